@@ -0,0 +1,111 @@
+"""
+Facet learning round-trips on synthetic embeddings: a full learn, cache
+hits from memory and from disk, and rounds of active-learning refinements
+that label a few of the current top results each time.
+
+Embeddings are unit vectors around a handful of topic directions, one row
+per fixture image, written once per fixture and dimension. The query's
+positives are a sample of one topic, as keyword matches would be. Every
+refinement is checked against a full rescore with the refined weights.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from micro import measure
+
+N_TOPICS = 8
+ROUNDS = 10
+LABELS_PER_ROUND = 5
+
+
+def write_embeddings(path, n_rows, dims, seed=0):
+    """Writes the embeddings; returns the topic of every row."""
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, N_TOPICS, n_rows)
+    centers = rng.normal(0, 1, (N_TOPICS, dims)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    embeddings = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n_rows, dims))
+    for start in range(0, n_rows, 65_536):
+        stop = min(start + 65_536, n_rows)
+        noise = rng.normal(0, 1, (stop - start, dims)).astype(np.float32) / np.sqrt(dims)
+        chunk = centers[topics[start:stop]] * 0.6 + noise
+        embeddings[start:stop] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    embeddings.flush()
+    return topics
+
+
+def run_facets(fixture_dir, columns, dims=128, repeat=20, seed=0):
+    from core.facet_cache import FacetCache
+    from core.facet_learner import FacetLearner, facet_key, top_k
+
+    n_rows = len(columns["filepath"])
+    path = os.path.join(fixture_dir, "artifacts", f"facet_embeddings_{dims}.npy")
+    topics_path = os.path.join(fixture_dir, "artifacts", f"facet_embeddings_{dims}.topics.npy")
+    if not os.path.exists(topics_path):
+        print(f"Writing {n_rows}x{dims} synthetic embeddings -> {path}")
+        np.save(topics_path, write_embeddings(path, n_rows, dims, seed))
+    topics = np.load(topics_path)
+
+    rng = np.random.default_rng(seed)
+    # keyword matches find a fraction of a topic, plus some noise
+    positives = np.flatnonzero(topics == 0)
+    positives = np.union1d(
+        rng.choice(positives, max(1, len(positives) // 20), replace=False),
+        rng.integers(0, n_rows, max(1, n_rows // 2000)),
+    )
+
+    results = {"rows": n_rows, "dims": dims, "positives": len(positives)}
+    cache_dir = tempfile.mkdtemp(prefix="facets-")
+    try:
+        learner = FacetLearner(path)
+        cache = FacetCache(cache_dir, "benchmark")
+        negatives = learner.sample_negatives(positives)
+        start = time.perf_counter()
+        facet, timings = learner.learn_facet("topic", positives, negatives)
+        cache.put(facet)
+        results["learn_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        results["learn_stages_ms"] = {stage: round(s * 1000, 3) for stage, s in timings.items()}
+
+        key = facet_key("topic", positives, negatives)
+        results["hit_memory"] = measure(lambda: cache.get(facet_key("topic", positives, negatives)), repeat)
+        results["hit_disk"] = measure(lambda: FacetCache(cache_dir, "benchmark").get(key), repeat)
+
+        # each round labels the top results: topic 0 rows positive, others negative
+        refine_ms, rescored, exact = [], [], True
+        for _ in range(ROUNDS):
+            top = facet.top(200)[0]
+            new_positives = top[topics[top] == 0][:LABELS_PER_ROUND]
+            new_negatives = top[topics[top] != 0][:LABELS_PER_ROUND]
+            start = time.perf_counter()
+            facet, _ = learner.refine(facet, new_positives, new_negatives)
+            cache.put(facet)
+            refine_ms.append((time.perf_counter() - start) * 1000)
+            rescored.append(facet.rescored)
+
+            labeled = np.zeros(n_rows, dtype=bool)
+            labeled[np.concatenate([facet.positives, facet.negatives])] = True
+            scores = learner.score(facet.weights, facet.bias)
+            expected = top_k(scores, 1000, exclude=labeled)
+            refined_scores = facet.top(1000)[1]
+            exact &= bool(np.allclose(np.sort(refined_scores), np.sort(scores[expected]), atol=1e-6))
+        results["refine"] = {
+            "rounds": ROUNDS,
+            "median_ms": round(float(np.median(refine_ms)), 3),
+            "p95_ms": round(float(np.percentile(refine_ms, 95)), 3),
+            "rows_rescored_median": int(np.median(rescored)),
+            "matches_full_rescore": exact,
+        }
+        # the same labels from scratch, with sklearn already imported
+        start = time.perf_counter()
+        learner.learn_facet("topic", facet.positives, facet.negatives)
+        results["refine"]["full_relearn_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        results["precision_at_100"] = float(np.mean(topics[facet.top(100)[0]] == 0))
+        results["stored_facet_bytes"] = os.path.getsize(cache.path_for(facet.key))
+    finally:
+        learner.close()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,171 @@
+"""
+In-process load test for the API.
+
+Requests go through ``httpx.ASGITransport`` straight into the ASGI app, so
+the numbers measure routing, dependencies and serialisation rather than
+the network. ``concurrency`` coroutines share a fixed request budget per
+route; throughput is requests over wall time, latency is per request.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "backend")
+
+
+def app_environment(fixture_dir):
+    """Settings overrides pointing the API at a fixture directory."""
+    fixture_dir = os.path.abspath(fixture_dir)
+    return {
+        "DATA_DIR": fixture_dir,
+        "CLUSTERS_PATH": os.path.join(fixture_dir, "processed", "clusters.json"),
+        "ARTIFACTS_DIR": os.path.join(fixture_dir, "artifacts"),
+        "EMBEDDINGS_PATH": os.path.join(fixture_dir, "artifacts", "missing_embeddings.npy"),
+        "THUMBNAIL_CACHE_DIR": os.path.join(fixture_dir, "thumbnails"),
+        "FACET_CACHE_DIR": os.path.join(fixture_dir, "facets"),
+        "IIIF_FETCH_PAGE_DIMENSIONS": "false",
+    }
+
+
+def rss_bytes():
+    """Current resident set size of this process (0 where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def latency_summary(latencies, wall):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+    }
+
+
+def scenarios(columns, clusters, rng):
+    """``name -> callable(client)`` returning a request coroutine."""
+    cluster_ids = list(clusters)
+    filepaths = columns["filepath"]
+    newspapers = sorted(set(columns["name"][:10000]))
+
+    def pick(values):
+        return values[int(rng.integers(len(values)))]
+
+    def batch_ids(n):
+        return [filepaths[i] for i in rng.integers(0, len(filepaths), n).tolist()]
+
+    return {
+        "dataset": lambda c: c.get("/"),
+        "cluster": lambda c: c.get(f"/cluster/{pick(cluster_ids)}"),
+        "image": lambda c: c.get(f"/image/{pick(filepaths)}"),
+        "search_term": lambda c: c.get(f"/search/{pick(['horse', 'boxer', 'ship'])}"),
+        "search_filtered": lambda c: c.get(
+            "/search/*",
+            params={
+                "newspaper": [pick(newspapers)],
+                "start_date": f"{int(rng.integers(1900, 1960))}-01-01",
+                "end_date": "1963-12-31",
+            },
+        ),
+        "clusters_batch": lambda c: c.post("/clusters:batch", json={"ids": [pick(cluster_ids) for _ in range(50)]}),
+        "images_batch": lambda c: c.post("/images:batch", json={"ids": batch_ids(100)}),
+    }
+
+
+async def run_route(client, make_request, n_requests, concurrency):
+    latencies, remaining = [], [n_requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.url}: HTTP {response.status_code}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+async def run_load(columns, clusters, n_requests=500, concurrency=16, routes=None, seed=0):
+    """
+    Starts the app against the fixture selected by the environment (see
+    ``app_environment``) and loads each route in turn. Returns per-route
+    latency summaries plus the process RSS before and after.
+    """
+    import httpx
+
+    sys.path.insert(0, BACKEND_DIR)
+    from main import app
+    rng = np.random.default_rng(seed)
+    results = {"rss_before_bytes": rss_bytes(), "routes": {}}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, make_request in scenarios(columns, clusters, rng).items():
+                if routes and name not in routes:
+                    continue
+                results["routes"][name] = await run_route(client, make_request, n_requests, concurrency)
+    results["rss_after_bytes"] = rss_bytes()
+    return results
+
+
+STARTUP_PROBE = """
+import asyncio, json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+from main import app
+imported = time.perf_counter()
+
+async def probe():
+    import httpx
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/")
+            response.raise_for_status()
+        first = time.perf_counter()
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return ready, first, rss
+
+ready, first, rss = asyncio.run(probe())
+print(json.dumps({
+    "import_s": imported - start,
+    "lifespan_s": ready - imported,
+    "first_request_s": first - ready,
+    "total_s": first - start,
+    "rss_bytes": rss,
+}))
+"""
+
+
+def measure_startup(fixture_dir, runs=3):
+    """Cold starts in fresh interpreters; returns the median of each phase."""
+    env = {**os.environ, **app_environment(fixture_dir)}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: round(float(np.median([s[key] for s in samples])), 4) for key in samples[0]}
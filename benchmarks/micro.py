@@ -0,0 +1,93 @@
+"""
+Micro-benchmarks for the hot paths behind the routes: cluster store
+loading and lookups, filepath resolution, OCR and faceted search, OCR text
+lookups, and top-k selection over production-sized score vectors.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+
+
+def measure(fn, repeat=20, warmup=2):
+    """Per-call timings of ``fn()`` in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings = np.asarray(timings) * 1000
+    return {
+        "repeat": repeat,
+        "min_ms": round(float(timings.min()), 4),
+        "median_ms": round(float(np.median(timings)), 4),
+        "p95_ms": round(float(np.percentile(timings, 95)), 4),
+    }
+
+
+def run_micro(fixture_dir, columns, repeat=20, seed=0):
+    from core.cluster_store import ClusterStore
+    from core.facet_learner import top_k
+    from core.filepath_index import FilepathIndex
+    from core.filepaths import parse_filepaths
+    from core.ocr_index import OCRIndex
+    from core.ocr_store import OCRStore, build_ocr_store
+    from core.search_index import SearchIndex, parse_date_bound
+
+    rng = np.random.default_rng(seed)
+    clusters_path = os.path.join(fixture_dir, "processed", "clusters.json")
+    artifacts_dir = os.path.join(fixture_dir, "artifacts")
+    filepaths = columns["filepath"]
+    sample = [filepaths[i] for i in rng.integers(0, len(filepaths), 1000).tolist()]
+
+    results = {}
+    results["cluster_store_from_json"] = measure(lambda: ClusterStore.from_json(clusters_path), max(3, repeat // 5), 1)
+    store = ClusterStore.from_json(clusters_path)
+    cluster_ids = list(store.cluster_ids)
+    largest = cluster_ids[int(np.argmax(np.diff(store.offsets)))]
+    results["cluster_filepaths_largest"] = measure(lambda: store.filepaths(largest), repeat)
+    results["cluster_of_x1000"] = measure(lambda: [store.cluster_of(fp) for fp in sample], repeat)
+
+    results["parse_filepaths_all"] = measure(lambda: parse_filepaths(filepaths), max(3, repeat // 5), 1)
+
+    index = FilepathIndex.load(artifacts_dir)
+    results["filepath_lookup_x1000"] = measure(lambda: [index.lookup(fp) for fp in sample], repeat)
+    results["filepath_lookup_many_1000"] = measure(lambda: index.lookup_many(sample), repeat)
+
+    ocr = OCRIndex.load(artifacts_dir)
+    results["ocr_term"] = measure(lambda: ocr.search("horse"), repeat)
+    results["ocr_and"] = measure(lambda: ocr.search("horse ship"), repeat)
+    results["ocr_phrase"] = measure(lambda: ocr.search('"horse ship"'), repeat)
+    results["ocr_prefix"] = measure(lambda: ocr.search("w1*"), repeat)
+
+    # fixtures written before the OCR store only have the plain column
+    if not OCRStore.exists(artifacts_dir):
+        build_ocr_store(columns["ocr"], artifacts_dir)
+    rows = rng.integers(0, len(filepaths), 1000)
+    results["ocr_text_cold_x1000"] = measure(lambda: OCRStore.load(artifacts_dir).take(rows), repeat)
+    ocr_store = OCRStore.load(artifacts_dir)
+    results["ocr_text_warm_x1000"] = measure(lambda: ocr_store.take(rows), repeat)
+    results["ocr_text_raw_bytes"] = ocr_store.meta["raw_bytes"]
+    results["ocr_text_compressed_bytes"] = ocr_store.meta["compressed_bytes"]
+
+    search = SearchIndex.load(artifacts_dir)
+    newspaper = search.newspaper_id(columns["lccn"][0])
+    start, end = parse_date_bound("1920-01-01"), parse_date_bound("1930-12-31", end=True)
+    results["filter_rows_date_newspaper"] = measure(
+        lambda: search.filter_rows(None, [newspaper], start, end), repeat
+    )
+    horse = ocr.search("horse")
+    results["rank_clusters_term"] = measure(lambda: search.rank_clusters(search.filter_rows(horse)), repeat)
+    results["search_clusters_all"] = measure(lambda: search.search_clusters(), repeat)
+    results["search_clusters_date"] = measure(lambda: search.search_clusters(None, None, start, end), repeat)
+
+    scores = rng.random(len(filepaths), dtype=np.float32)
+    exclude = np.zeros(len(scores), dtype=bool)
+    exclude[rng.integers(0, len(scores), 1000)] = True
+    results["top_k_1000"] = measure(lambda: top_k(scores, 1000, exclude), repeat)
+    return results
@@ -0,0 +1,147 @@
+"""
+Perceptual hashing of downloaded images: throughput, reprint recall and
+outlier detection on synthetic JPEGs, plus upload-match latency against an
+index the size of the fixture.
+
+Every fixture cluster (until ``n_images`` are drawn) gets one synthetic
+photograph. Its members are "reprints": cropped, rescaled, re-toned, noisy
+and re-compressed copies. A few members are replaced by an unrelated
+photograph; those are the outliers the report has to find. The images and a
+downloader manifest are written once per fixture under ``images/``.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from micro import measure
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+N_IMAGES = 2000
+OUTLIER_RATE = 0.02
+SIZE = (480, 360)
+
+
+def photograph(rng):
+    """A smooth random scene with a few hard-edged shapes, as a PIL image."""
+    from PIL import Image, ImageDraw
+
+    field = rng.normal(0, 1, (9, 12))
+    field = (field - field.min()) / np.ptp(field) * 255
+    image = Image.fromarray(field.astype(np.uint8)).resize(SIZE, Image.BICUBIC)
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x0, y0 = rng.integers(0, SIZE[0] - 60), rng.integers(0, SIZE[1] - 60)
+        box = (x0, y0, x0 + rng.integers(30, 200), y0 + rng.integers(30, 150))
+        fill = int(rng.integers(0, 256))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=fill)
+    return image
+
+
+def reprint(image, rng):
+    """A reprinted copy: slight crop and rescale, new tone, noise, new JPEG quality."""
+    from PIL import Image
+
+    w, h = image.size
+    crop = rng.uniform(0, 0.03, 4) * (w, h, w, h)
+    image = image.crop((crop[0], crop[1], w - crop[2], h - crop[3]))
+    scale = rng.uniform(0.7, 1.3)
+    image = image.resize((int(w * scale), int(h * scale)), Image.BILINEAR)
+    pixels = np.asarray(image, dtype=np.float32)
+    pixels = pixels * rng.uniform(0.85, 1.15) + rng.uniform(-20, 20) + rng.normal(0, 6, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def write_images(images_dir, clusters, n_images=N_IMAGES, seed=0):
+    """
+    Writes the JPEGs and manifest.jsonl; returns ``(clusters, outliers)``:
+    the clusters restricted to the written images and the planted outliers.
+    """
+    from downloader import MANIFEST_NAME, filename_for
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(images_dir, exist_ok=True)
+    written, outliers = {}, []
+    entries = []
+    for cluster_id, members in clusters.items():
+        if len(entries) >= n_images:
+            break
+        members = members[: max(3, min(len(members), 50))]
+        base = photograph(rng)
+        written[cluster_id] = members
+        for filepath in members:
+            outlier = len(members) >= 5 and rng.random() < OUTLIER_RATE
+            image = reprint(photograph(rng) if outlier else base, rng)
+            if outlier:
+                outliers.append(filepath)
+            filename = filename_for(filepath)
+            image.save(os.path.join(images_dir, filename), quality=int(rng.integers(60, 95)))
+            entries.append({"filepath": filepath, "file": filename, "url": "", "bytes": 0})
+    with open(os.path.join(images_dir, MANIFEST_NAME), "w") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+    return written, outliers
+
+
+def run_phash(fixture_dir, columns, clusters, n_images=N_IMAGES, repeat=20, seed=0):
+    from hash_images import cluster_outliers, hash_directory, load_hashes
+    from core.phash import PerceptualIndex, hamming, hash_images, index_arrays
+
+    images_dir = os.path.join(fixture_dir, "images")
+    marker = os.path.join(images_dir, "images.json")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            written, outliers = json.load(f)
+    else:
+        print(f"Writing {n_images} synthetic JPEGs -> {images_dir}")
+        written, outliers = write_images(images_dir, clusters, n_images, seed)
+        with open(marker, "w") as f:
+            json.dump([written, outliers], f)
+    results = {"images": sum(map(len, written.values())), "clusters": len(written), "planted_outliers": len(outliers)}
+
+    # throughput: one core, then every core; always from scratch
+    files = [os.path.join(images_dir, name) for name in sorted(os.listdir(images_dir)) if name.endswith(".jpg")]
+    start = time.perf_counter()
+    hash_images(files)
+    results["images_per_second_one_core"] = round(len(files) / (time.perf_counter() - start), 1)
+    for name in ("dhash.npy", "phash.npy", "hashes.txt"):
+        if os.path.exists(os.path.join(images_dir, name)):
+            os.remove(os.path.join(images_dir, name))
+    report = hash_directory(images_dir)
+    results["images_per_second_all_cores"] = report["images_per_second"]
+    results["failed"] = report["failed"]
+    filepaths, _, phash = load_hashes(images_dir)
+    # re-running only hashes what is new
+    results["rehash_skipped"] = hash_directory(images_dir)["skipped"]
+
+    # reprints must stay close to each other, unrelated photographs far apart
+    code_of = dict(zip(filepaths, phash.tolist()))
+    planted = set(outliers)
+    within, bases = [], []
+    for members in written.values():
+        codes = np.array([code_of[fp] for fp in members if fp not in planted], dtype=np.uint64)
+        within.extend(hamming(codes[0], codes[1:]).tolist())
+        bases.append(codes[0])
+    bases = np.array(bases, dtype=np.uint64)
+    between = hamming(bases[:, None], bases[None, :])[np.triu_indices(len(bases), 1)]
+    results["reprint_distance_p50"] = float(np.percentile(within, 50))
+    results["reprint_distance_p99"] = float(np.percentile(within, 99))
+    results["unrelated_distance_p1"] = float(np.percentile(between, 1))
+
+    report = cluster_outliers(written, filepaths, phash)
+    found = {o["image"] for o in report["outliers"]}
+    results["outlier_recall"] = len(found & planted) / len(planted) if planted else 1.0
+    results["outlier_precision"] = len(found & planted) / len(found) if found else 1.0
+
+    # upload matching against an index of every fixture image: random codes
+    # for the rest, overridden by the real hashes (the last duplicate wins)
+    rng = np.random.default_rng(seed)
+    others = rng.integers(0, 2**62, len(columns["filepath"]), dtype=np.int64).astype(np.uint64) << np.uint64(2)
+    all_codes = np.concatenate([others, phash])
+    index = PerceptualIndex(index_arrays(columns["filepath"] + filepaths, all_codes, all_codes))
+    queries = iter(np.resize(hash_images(files[:repeat])[1], 4 * (repeat + 2)))
+    for radius in (6, 10):
+        results[f"match_r{radius}"] = measure(lambda: index.search(next(queries), radius), repeat, 2)
+    return results
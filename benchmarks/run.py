@@ -0,0 +1,175 @@
+"""
+Runs the benchmark suite against a synthetic fixture and records the
+results as JSON, optionally comparing them with an earlier run.
+
+    python benchmarks/run.py                        # 1.5M images, all suites
+    python benchmarks/run.py --scale 0.05 --suite micro
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+    python benchmarks/run.py --suite workers --workers 1,2,4,8
+    python benchmarks/run.py --scale 0.05 --suite phash
+    python benchmarks/run.py --scale 0.05 --suite facets --facet-dims 512
+
+The fixture is generated once per scale and seed under --fixture-dir and
+reused by later runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import synthetic  # noqa: E402
+
+SUITES = ("micro", "load", "startup", "workers", "phash", "facets")
+
+
+def fixture(args):
+    """Generates (or reuses) the fixture; returns (fixture_dir, columns, clusters, timings)."""
+    n_images = int(synthetic.N_IMAGES * args.scale)
+    n_clusters = max(10, int(synthetic.N_CLUSTERS * args.scale))
+    fixture_dir = os.path.join(args.fixture_dir, f"images_{n_images}_seed_{args.seed}")
+    marker = os.path.join(fixture_dir, "fixture.json")
+    if os.path.exists(marker):
+        columns = synthetic.generate_columns(n_images, synthetic.N_NEWSPAPERS, args.seed)
+        with open(os.path.join(fixture_dir, "processed", "clusters.json")) as f:
+            clusters = json.load(f)
+        with open(marker) as f:
+            return fixture_dir, columns, clusters, json.load(f)["timings"]
+
+    print(f"Generating fixture: {n_images} images, {n_clusters} clusters -> {fixture_dir}")
+    columns, timings = synthetic.write_fixture(
+        fixture_dir, n_images, n_clusters, synthetic.N_NEWSPAPERS, args.seed
+    )
+    with open(os.path.join(fixture_dir, "processed", "clusters.json")) as f:
+        clusters = json.load(f)
+    with open(marker, "w") as f:
+        json.dump({"images": n_images, "clusters": len(clusters), "timings": timings}, f)
+    return fixture_dir, columns, clusters, timings
+
+
+def flatten(results, prefix=""):
+    """``{"micro.ocr_term.median_ms": 1.2, ...}`` for comparisons."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = flatten(json.load(f)["results"])
+    print(f"\nComparison with {baseline_path} (ratio > 1 means slower/larger now):")
+    for name, value in flatten(current).items():
+        if not name.endswith(("_ms", "_s", "_bytes")) or not baseline.get(name):
+            continue
+        ratio = value / baseline[name]
+        flag = "  <-- regression" if ratio > 1.2 else ""
+        print(f"  {name:<55} {baseline[name]:>12.3f} -> {value:>12.3f}  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of the 1.5M-image production size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--suite", choices=SUITES, action="append", help="suites to run (default: all)")
+    parser.add_argument("--fixture-dir", default=os.path.join(BENCHMARKS_DIR, "fixtures"))
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARKS_DIR, "results"))
+    parser.add_argument("--repeat", type=int, default=20, help="micro-benchmark repetitions")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route in the load test")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--route", action="append", help="load-test only these routes")
+    parser.add_argument("--workers", default="1,2,4", help="worker counts for the workers suite")
+    parser.add_argument("--phash-images", type=int, default=2000, help="synthetic JPEGs for the phash suite")
+    parser.add_argument("--facet-dims", type=int, default=128, help="synthetic embedding size for the facets suite")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument(
+        "--startup-budget", type=float, default=1.0, help="fail if cold start to first 200 exceeds this (seconds)"
+    )
+    args = parser.parse_args()
+    suites = args.suite or SUITES
+
+    fixture_dir, columns, clusters, build_timings = fixture(args)
+    results = {"fixture": {"images": len(columns["filepath"]), "clusters": len(clusters), "build_s": build_timings}}
+
+    if "micro" in suites:
+        from micro import run_micro
+
+        print("Running micro-benchmarks...")
+        results["micro"] = run_micro(fixture_dir, columns, args.repeat, args.seed)
+    if "startup" in suites:
+        from load import measure_startup
+
+        print("Measuring cold start...")
+        results["startup"] = measure_startup(fixture_dir)
+    if "load" in suites:
+        from load import app_environment, run_load
+
+        print(f"Load testing ({args.requests} requests/route, concurrency {args.concurrency})...")
+        # settings are read when the app is imported
+        os.environ.update(app_environment(fixture_dir))
+        results["load"] = asyncio.run(
+            run_load(columns, clusters, args.requests, args.concurrency, args.route, args.seed)
+        )
+
+    if "workers" in suites:
+        from workers import measure_workers
+
+        worker_counts = tuple(int(n) for n in args.workers.split(","))
+        print(f"Measuring memory with {worker_counts} workers...")
+        results["workers"] = measure_workers(fixture_dir, columns, clusters, worker_counts)
+
+    if "phash" in suites:
+        from phash import run_phash
+
+        print(f"Hashing {args.phash_images} synthetic images...")
+        results["phash"] = run_phash(fixture_dir, columns, clusters, args.phash_images, args.repeat, args.seed)
+
+    if "facets" in suites:
+        from facets import run_facets
+
+        print("Learning and refining facets...")
+        results["facets"] = run_facets(fixture_dir, columns, args.facet_dims, args.repeat, args.seed)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output_path, "w") as f:
+        json.dump(
+            {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output_path}")
+    if args.compare:
+        compare(results, args.compare)
+    if "startup" in results and results["startup"]["total_s"] > args.startup_budget:
+        sys.exit(f"Cold start took {results['startup']['total_s']:.3f}s (budget {args.startup_budget}s)")
+    if "workers" in results:
+        from workers import MAX_ADDED_WORKER_ARTIFACT_PSS
+
+        ratio = results["workers"].get("added_worker_artifact_pss_ratio", 0)
+        if ratio > MAX_ADDED_WORKER_ARTIFACT_PSS:
+            sys.exit(
+                f"Each added worker costs {ratio:.2f} of a worker's artifact memory "
+                f"(limit {MAX_ADDED_WORKER_ARTIFACT_PSS}): artifacts are not being shared"
+            )
+
+
+if __name__ == "__main__":
+    main()
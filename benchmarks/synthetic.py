@@ -0,0 +1,149 @@
+"""
+Synthetic, production-shaped fixtures for the benchmarks.
+
+Generates a dataset of ``n_images`` rows spread over ``n_newspapers``
+newspapers and 1900-1963 publication dates, groups the rows into
+``n_clusters`` clusters with heavy-tailed sizes, and writes everything the
+API loads: data/processed/clusters.json, data/processed/metadata.json and
+the artifacts from scripts/build_artifacts.py (cluster store and metadata
+snapshots, filepath, OCR and search indexes, cluster summaries). Defaults
+match production scale: about 2000 clusters, 1.5M images and 200
+newspapers.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+
+N_IMAGES = 1_500_000
+N_CLUSTERS = 2000
+N_NEWSPAPERS = 200
+VOCABULARY = 5000
+WORDS_PER_IMAGE = 12
+QUERY_WORDS = ["horse", "baseball", "boxer", "president", "building", "ship"]
+
+
+def generate_columns(n_images=N_IMAGES, n_newspapers=N_NEWSPAPERS, seed=0):
+    rng = np.random.default_rng(seed)
+    lccns = [f"sn{84000000 + i * 37:08d}" for i in range(n_newspapers)]
+    titles = [f"The Daily Synthetic {i}" for i in range(n_newspapers)]
+    places = [f"Town {i}, State {i % 48}" for i in range(n_newspapers)]
+
+    # newspapers follow a Zipf-like popularity, dates are uniform 1900-1963
+    popularity = 1 / np.arange(1, n_newspapers + 1)
+    newspaper = rng.choice(n_newspapers, n_images, p=popularity / popularity.sum())
+    days = rng.integers(0, (1963 - 1900 + 1) * 365, n_images)
+    dates = np.datetime64("1900-01-01") + days.astype("timedelta64[D]")
+    date_strings = np.datetime_as_string(dates).tolist()
+    seq = rng.integers(1, 2000, n_images).tolist()
+    confidence = rng.integers(90, 100, n_images).tolist()
+    newspaper = newspaper.tolist()
+
+    filepaths = [
+        f"b{n % 50}_batch{n}_ver01/data/{lccns[n]}/{i:011d}/"
+        f"{d.replace('-', '')}01/{s:04d}/{i % 20:03d}_0_{c}.jpg"
+        for i, (n, d, s, c) in enumerate(zip(newspaper, date_strings, seq, confidence))
+    ]
+
+    vocabulary = QUERY_WORDS + [f"w{i}" for i in range(VOCABULARY)]
+    # word frequencies are Zipfian, like real OCR
+    word_p = 1 / np.arange(1, len(vocabulary) + 1)
+    words = rng.choice(len(vocabulary), (n_images, WORDS_PER_IMAGE), p=word_p / word_p.sum())
+    ocr = [" ".join(vocabulary[w] for w in row) for row in words.tolist()]
+
+    boxes = rng.uniform(0, 0.5, (n_images, 2))
+    boxes = np.concatenate((boxes, boxes + rng.uniform(0.1, 0.5, (n_images, 2))), axis=1)
+
+    return {
+        "filepath": filepaths,
+        "pub_date": date_strings,
+        "lccn": [lccns[n] for n in newspaper],
+        "name": [titles[n] for n in newspaper],
+        "publisher": [f"Publisher {n}" for n in newspaper],
+        "place_of_publication": [places[n] for n in newspaper],
+        "box": np.round(boxes, 4).tolist(),
+        "prediction_section_iiif_url": [f"https://example.org/iiif/{i}/full/default.jpg" for i in range(n_images)],
+        "ocr": ocr,
+    }
+
+
+def generate_clusters(filepaths, n_clusters=N_CLUSTERS, seed=0):
+    """Heavy-tailed cluster sizes that together cover every image."""
+    rng = np.random.default_rng(seed)
+    weights = rng.lognormal(0, 1.5, n_clusters)
+    sizes = np.maximum(2, (weights / weights.sum() * len(filepaths)).astype(np.int64))
+    order = rng.permutation(len(filepaths))
+    bounds = np.minimum(np.cumsum(sizes), len(filepaths))
+    clusters, start = {}, 0
+    for i, end in enumerate(bounds.tolist()):
+        if end <= start:
+            break
+        clusters[str(i + 1)] = [filepaths[j] for j in order[start:end].tolist()]
+        start = end
+    return clusters
+
+
+def write_fixture(output_dir, n_images=N_IMAGES, n_clusters=N_CLUSTERS, n_newspapers=N_NEWSPAPERS, seed=0):
+    """Writes a full fixture to ``output_dir``; returns (columns, timings)."""
+    from core.cluster_store import ClusterStore
+    from core.filepath_index import FilepathIndex, build_filepath_index
+    from core.metadata_store import build_metadata_store
+    from core.ocr_index import build_ocr_index
+    from core.search_index import build_search_index
+    from core.summaries import build_summaries
+
+    timings = {}
+    processed_dir = os.path.join(output_dir, "processed")
+    artifacts_dir = os.path.join(output_dir, "artifacts")
+    os.makedirs(processed_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    columns = generate_columns(n_images, n_newspapers, seed)
+    clusters = generate_clusters(columns["filepath"], n_clusters, seed)
+    timings["generate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(os.path.join(processed_dir, "clusters.json"), "w") as f:
+        json.dump(clusters, f)
+    metadata_columns = [name for name in columns if name != "ocr"]
+    with open(os.path.join(processed_dir, "metadata.json"), "w") as f:
+        for row in zip(*(columns[name] for name in metadata_columns)):
+            f.write(json.dumps(dict(zip(metadata_columns, row))) + "\n")
+    timings["write_json"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_metadata_store([columns], artifacts_dir)
+    timings["metadata"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_filepath_index(columns["filepath"], artifacts_dir)
+    timings["filepath_index"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_ocr_index(columns["ocr"], artifacts_dir)
+    timings["ocr_index"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = ClusterStore.from_dict(clusters)
+    store.save(artifacts_dir)
+    rows = FilepathIndex.load(artifacts_dir).lookup_many(store.paths)
+    row_cluster = np.full(len(columns["filepath"]), -1, dtype=np.int32)
+    row_cluster[rows] = store.path_cluster
+    build_search_index(
+        columns["pub_date"], columns["lccn"], columns["name"], row_cluster, store.cluster_ids, artifacts_dir
+    )
+    timings["search_index"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_summaries(
+        store,
+        dict(zip(columns["lccn"], columns["name"])),
+        artifacts_dir,
+        dict(zip(columns["lccn"], columns["place_of_publication"])),
+    )
+    timings["summaries"] = time.perf_counter() - start
+    return columns, timings
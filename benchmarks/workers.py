@@ -0,0 +1,218 @@
+"""
+Memory of a multi-worker deployment as the worker count grows.
+
+Starts ``serve.py --workers N`` against a fixture, warms every worker with
+the same mix of requests, then sums the memory of the process tree.
+RSS counts a shared page once per process that maps it, so it is reported
+but the check uses PSS (each shared page split between its mappers), which
+adds up to the physical memory actually used.
+
+With more than one worker, uvicorn adds a supervisor process and a
+multiprocessing resource tracker that a single worker (running in the
+server process) doesn't have. Those are reported as overhead, and the check
+compares workers only, each with its own children.
+
+A worker's own interpreter, imports and caches are private by nature, so
+at small scales they dominate its PSS and say nothing about sharing. The
+check is therefore on the memory-mapped artifact files (from
+/proc/<pid>/smaps): if their pages are shared, their total PSS stays about
+flat as workers are added, and each added worker may cost at most
+``MAX_ADDED_WORKER_ARTIFACT_PSS`` of a worker's artifact PSS in the first
+deployment. The whole-worker ratio is reported alongside.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from load import BACKEND_DIR, app_environment
+
+# Artifact pages mapped by every worker should be counted about once: each
+# added worker may add at most this fraction of one first-deployment
+# worker's artifact PSS (pages touched by only one worker account for it)
+MAX_ADDED_WORKER_ARTIFACT_PSS = 0.3
+
+sys.path.insert(0, BACKEND_DIR)
+from core.metrics import process_memory  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_parents():
+    """``{pid: parent pid}`` of every process (Linux /proc scan)."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # the command name may contain spaces; ppid follows ')'
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    return parents
+
+
+def process_tree(pid, parents=None):
+    """``pid`` and all of its descendants."""
+    parents = process_parents() if parents is None else parents
+    tree, frontier = [pid], [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier]
+        tree += frontier
+    return tree
+
+
+def is_resource_tracker(pid):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"resource_tracker" in f.read()
+    except OSError:
+        return False
+
+
+def split_workers(server_pid, n_workers):
+    """
+    ``(workers, overhead)``: one list of pids per worker (the worker and its
+    children), and the pids of the supervisor and resource trackers.
+    """
+    parents = process_parents()
+    if n_workers == 1:
+        roots = [server_pid]
+    else:
+        roots = [pid for pid, parent in parents.items() if parent == server_pid]
+    workers = [
+        [pid for pid in process_tree(root, parents) if not is_resource_tracker(pid)]
+        for root in roots
+        if not is_resource_tracker(root)
+    ]
+    in_workers = {pid for worker in workers for pid in worker}
+    overhead = [pid for pid in process_tree(server_pid, parents) if pid not in in_workers]
+    return workers, overhead
+
+
+def memory(pids):
+    usage = [process_memory(pid) for pid in pids]
+    return {f"{kind}_bytes": sum(u.get(kind, 0) for u in usage) for kind in ("rss", "pss", "shared", "private")}
+
+
+def mapped_memory(pids, directory):
+    """RSS and PSS of the file mappings under ``directory``, summed over ``pids``."""
+    directory = os.path.realpath(directory) + os.sep
+    totals = {"rss_bytes": 0, "pss_bytes": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps") as f:
+                inside = False
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if " " not in name:
+                        # a field of the current mapping
+                        if inside and name in ("Rss", "Pss"):
+                            totals[f"{name.lower()}_bytes"] += int(value.split()[0]) * 1024
+                    else:
+                        # a mapping header: address perms offset dev inode [path]
+                        fields = line.split(None, 5)
+                        inside = len(fields) == 6 and fields[5].strip().startswith(directory)
+        except OSError:
+            continue
+    return totals
+
+
+def request(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if data else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data, headers), timeout=60) as response:
+        return response.read()
+
+
+def wait_ready(base_url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(base_url + "/")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{base_url} did not become ready in {timeout}s")
+
+
+def warm_up(base_url, columns, clusters, n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    filepaths, cluster_ids = columns["filepath"], list(clusters)
+    requests = []
+    for i in range(n_requests):
+        kind = i % 4
+        if kind == 0:
+            requests.append((f"{base_url}/image/{filepaths[int(rng.integers(len(filepaths)))]}", None))
+        elif kind == 1:
+            requests.append((f"{base_url}/search/horse?start_date={int(rng.integers(1900, 1960))}", None))
+        elif kind == 2:
+            requests.append((f"{base_url}/cluster/{cluster_ids[int(rng.integers(len(cluster_ids)))]}", None))
+        else:
+            ids = [filepaths[j] for j in rng.integers(0, len(filepaths), 100).tolist()]
+            requests.append((f"{base_url}/images:batch", {"ids": ids}))
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda args: request(*args), requests))
+
+
+def measure_workers(fixture_dir, columns, clusters, worker_counts=(1, 2, 4), requests_per_worker=200):
+    """
+    Per worker count, the summed memory of the workers, of their artifact
+    mappings and of the overhead after warm-up.
+    """
+    env = {**os.environ, **app_environment(fixture_dir)}
+    artifacts_dir = env["ARTIFACTS_DIR"]
+    results = {}
+    for n_workers in worker_counts:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(n_workers)],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url)
+            warm_up(base_url, columns, clusters, requests_per_worker * n_workers)
+            time.sleep(1)
+            workers, overhead = split_workers(server.pid, n_workers)
+            if len(workers) != n_workers:
+                raise RuntimeError(f"Expected {n_workers} worker processes, found {len(workers)}")
+            worker_pids = [pid for worker in workers for pid in worker]
+            results[str(n_workers)] = {
+                "processes": sum(map(len, workers)) + len(overhead),
+                **memory(worker_pids),
+                "artifacts": mapped_memory(worker_pids, artifacts_dir),
+                "overhead": {"processes": len(overhead), **memory(overhead)},
+            }
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    first, last = worker_counts[0], worker_counts[-1]
+    if last > first:
+        # PSS of each added worker as a fraction of a worker of the first
+        # deployment; 1.0 would mean every worker holds its own copy
+        def added_ratio(first_pss, last_pss):
+            added = (last_pss - first_pss) / (last - first)
+            return round(added / (first_pss / first), 3) if first_pss else 0.0
+
+        results["added_worker_pss_ratio"] = added_ratio(
+            results[str(first)]["pss_bytes"], results[str(last)]["pss_bytes"]
+        )
+        results["added_worker_artifact_pss_ratio"] = added_ratio(
+            results[str(first)]["artifacts"]["pss_bytes"], results[str(last)]["artifacts"]["pss_bytes"]
+        )
+    return results
@@ -0,0 +1,248 @@
+"""
+Offline build steps for the artifacts served by the backend.
+
+Run from the repository root, e.g.:
+
+    python scripts/build_artifacts.py filepath-index
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# The builders live next to the loaders in the backend package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+
+ARTIFACTS_DIR = os.path.join("data", "artifacts")
+CLUSTERS_PATH = os.path.join("data", "processed", "clusters.json")
+METADATA_PATH = os.path.join("data", "processed", "metadata.json")
+EMBEDDINGS_PATH = os.path.join(ARTIFACTS_DIR, "global_embeddings_light.npy")
+DATASET_NAME = "biglam/newspaper-navigator"
+DATASET_CONFIG = "photos"
+
+
+def load_photos():
+    from datasets import load_dataset
+
+    return load_dataset(DATASET_NAME, DATASET_CONFIG, split="train")
+
+
+def build_filepath_index(args):
+    from core.filepath_index import build_filepath_index
+
+    photos = load_photos()
+    start = time.perf_counter()
+    n_rows = build_filepath_index(photos["filepath"], args.output_dir)
+    print(f"Indexed {n_rows} filepaths in {time.perf_counter() - start:.1f}s")
+
+
+def build_cluster_store(args):
+    from core.cluster_store import ClusterStore
+
+    start = time.perf_counter()
+    store = ClusterStore.from_json(args.clusters)
+    store.save(args.output_dir)
+    print(f"Wrote snapshot of {len(store)} clusters in {time.perf_counter() - start:.1f}s")
+
+
+def build_metadata(args):
+    from core.metadata_store import COLUMNS, build_metadata_store
+    from core.ocr_store import OCRStore
+
+    photos = load_photos().select_columns(list(COLUMNS))
+    start = time.perf_counter()
+    n_rows = build_metadata_store(photos.iter(10_000), args.output_dir)
+    print(f"Wrote {n_rows} metadata rows in {time.perf_counter() - start:.1f}s")
+    ocr = OCRStore.load(args.output_dir).stats()
+    print(f"OCR text: {ocr['raw_bytes']} bytes -> {ocr['compressed_bytes']} ({ocr['codec']}, x{ocr['ratio']:.1f})")
+
+
+def build_ocr_index(args):
+    from core.ocr_index import build_ocr_index
+
+    photos = load_photos()
+    start = time.perf_counter()
+    texts = (batch["ocr"] for batch in photos.select_columns(["ocr"]).iter(10_000))
+    n_terms = build_ocr_index(
+        (text for batch in texts for text in batch), args.output_dir
+    )
+    print(f"Indexed {n_terms} OCR terms in {time.perf_counter() - start:.1f}s")
+
+
+def build_search_index(args):
+    import numpy as np
+    from core.cluster_store import ClusterStore
+    from core.filepath_index import FilepathIndex
+    from core.search_index import build_search_index
+
+    photos = load_photos().select_columns(["pub_date", "lccn", "name"])
+    store = ClusterStore.from_json(args.clusters)
+    start = time.perf_counter()
+
+    # Map every clustered filepath to its dataset row (needs filepath-index)
+    rows = FilepathIndex.load(args.output_dir).lookup_many(store.paths)
+    found = rows >= 0
+    row_cluster = np.full(len(photos), -1, dtype=np.int32)
+    row_cluster[rows[found]] = store.path_cluster[found]
+    print(f"Resolved {found.sum()} of {len(found)} clustered images")
+
+    build_search_index(
+        photos["pub_date"],
+        photos["lccn"],
+        photos["name"],
+        row_cluster,
+        store.cluster_ids,
+        args.output_dir,
+    )
+    print(f"Built search index in {time.perf_counter() - start:.1f}s")
+
+
+def build_ann_index(args):
+    import numpy as np
+    from core.ann_index import ANNIndex, build_ann_index
+
+    embeddings = np.load(args.embeddings, mmap_mode="r")
+    start = time.perf_counter()
+    build_ann_index(embeddings, args.output_dir, nlist=args.nlist, m=args.m)
+    print(f"Built IVF-PQ index in {time.perf_counter() - start:.1f}s")
+
+    # Recall against exact search, with and without exact re-ranking
+    report = {}
+    for name, attached in (("adc", None), ("reranked", embeddings)):
+        index = ANNIndex.load(args.output_dir, attached)
+        report[name] = index.evaluate(embeddings, n_queries=args.eval_queries)
+        print(f"{name}: {report[name]}")
+    with open(os.path.join(args.output_dir, "ann_index.report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def build_page_dimensions(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from core.cluster_store import ClusterStore
+    from core.filepaths import parse_filepaths
+    from core.iiif import build_page_dimensions, fetch_info_json, page_of, page_service_id
+    from downloader import TokenBucket
+
+    store = ClusterStore.from_json(args.clusters)
+    # one filepath per distinct page, grouped on the parsed fields
+    table = parse_filepaths(store.paths)
+    first, _ = table.pages()
+    first = first[table.valid[first]]
+    pages = sorted(page_of(filepath) for filepath in store.paths.take(first))
+    bucket = TokenBucket(args.requests_per_minute / 60.0)
+    print(f"Fetching dimensions of {len(pages)} pages...")
+
+    def fetch(page):
+        bucket.acquire()
+        try:
+            info = fetch_info_json(f"{page_service_id(page)}/info.json")
+            return page, (int(info["width"]), int(info["height"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error fetching {page}: {e}")
+            return page, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sizes = [(page, size) for page, size in pool.map(fetch, pages) if size]
+    n_pages = build_page_dimensions(sizes, args.output_dir)
+    print(f"Stored {n_pages} page dimensions in {time.perf_counter() - start:.1f}s")
+
+
+def build_phash_index(args):
+    import numpy as np
+    from core.phash import build_perceptual_index
+    from hash_images import load_hashes
+
+    filepaths, phash, dhash = [], [], []
+    for images_dir in args.images_dirs:
+        dir_filepaths, dir_dhash, dir_phash = load_hashes(images_dir)
+        filepaths.extend(dir_filepaths)
+        dhash.append(dir_dhash)
+        phash.append(dir_phash)
+    start = time.perf_counter()
+    n_images = build_perceptual_index(filepaths, np.concatenate(phash), np.concatenate(dhash), args.output_dir)
+    print(f"Indexed {n_images} perceptual hashes in {time.perf_counter() - start:.1f}s")
+
+
+def build_summaries(args):
+    from core.cluster_store import ClusterStore
+    from core.summaries import build_summaries
+
+    start = time.perf_counter()
+    store = ClusterStore.from_json(args.clusters)
+
+    # newspaper titles and places from the metadata written by get_metadata.py
+    titles_by_lccn, places_by_lccn = {}, {}
+    if os.path.exists(args.metadata):
+        with open(args.metadata, "r") as f:
+            for line in f:
+                item = json.loads(line)
+                titles_by_lccn.setdefault(item.get("lccn"), item.get("name"))
+                places_by_lccn.setdefault(item.get("lccn"), item.get("place_of_publication"))
+    else:
+        print(f"No metadata at {args.metadata}; newspapers will be listed by LCCN")
+
+    stats = build_summaries(store, titles_by_lccn, args.output_dir, places_by_lccn)
+    print(f"Summarised {len(store)} clusters in {time.perf_counter() - start:.1f}s: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output-dir", default=ARTIFACTS_DIR)
+    parser.add_argument("--clusters", default=CLUSTERS_PATH)
+    parser.add_argument("--embeddings", default=EMBEDDINGS_PATH)
+    parser.add_argument("--metadata", default=METADATA_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser(
+        "filepath-index", help="sorted filepath -> dataset row index"
+    ).set_defaults(func=build_filepath_index)
+
+    subparsers.add_parser(
+        "cluster-store", help="binary snapshot of clusters.json, memory-mapped at startup"
+    ).set_defaults(func=build_cluster_store)
+
+    subparsers.add_parser(
+        "metadata", help="binary snapshot of the served dataset columns and compressed OCR store"
+    ).set_defaults(func=build_metadata)
+
+    subparsers.add_parser(
+        "ocr-index", help="positional inverted index over the OCR text"
+    ).set_defaults(func=build_ocr_index)
+
+    subparsers.add_parser(
+        "search-index",
+        help="date, newspaper and cluster filters for /search (after filepath-index)",
+    ).set_defaults(func=build_search_index)
+
+    ann_parser = subparsers.add_parser(
+        "ann-index", help="IVF-PQ nearest-neighbour index over the embeddings"
+    )
+    ann_parser.add_argument("--nlist", type=int, default=1024)
+    ann_parser.add_argument("--m", type=int, default=16)
+    ann_parser.add_argument("--eval-queries", type=int, default=100)
+    ann_parser.set_defaults(func=build_ann_index)
+
+    pages_parser = subparsers.add_parser(
+        "page-dimensions", help="width/height of every clustered page (IIIF info.json)"
+    )
+    pages_parser.add_argument("--requests-per-minute", type=float, default=20)
+    pages_parser.set_defaults(func=build_page_dimensions)
+
+    phash_parser = subparsers.add_parser(
+        "phash-index", help="perceptual hashes of downloaded images (after hash_images.py hash)"
+    )
+    phash_parser.add_argument("images_dirs", nargs="+")
+    phash_parser.set_defaults(func=build_phash_index)
+
+    subparsers.add_parser(
+        "summaries", help="per-cluster summaries and dataset statistics"
+    ).set_defaults(func=build_summaries)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
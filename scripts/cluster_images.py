@@ -0,0 +1,315 @@
+"""
+Near-duplicate clustering of the CLIP embeddings, one year at a time.
+
+This is the scripted version of 3_cluster_images.ipynb: DBSCAN over each
+year's embeddings, written as data/exports/all_<year>_epsilon_<eps>.json
+with clusters keyed "0", "1", ... by decreasing size, each a list of raw
+(underscore) filepaths. merge_exported_clusters.py consumes these files.
+
+Instead of handing the whole year to sklearn, pairwise distances are
+computed block by block in a process pool. Each worker memory-maps the
+year's embeddings, so memory stays bounded by the block size, and blocks of
+different years run side by side. Only edges within epsilon are kept;
+clusters are the connected components of that graph. A manifest records the
+inputs and parameters of every exported year, so re-running only clusters
+years that are new or changed.
+
+``--lccns`` and ``--places`` restrict clustering to some newspapers; places
+are resolved to LCCNs by querying the partitioned dataset store
+(dataset_store.py), which reads only the year's partitions. Subsets are
+exported under their own ``--prefix`` in a ``subsets`` directory below the
+output directory, so they never replace the full years and
+merge_exported_clusters.py never picks them up.
+
+Run from the repository root, e.g.:
+
+    python scripts/cluster_images.py --embeddings-dir embeddings --epsilon 2.4
+    python scripts/cluster_images.py --years 1910 --places "Chicago, Illinois" --prefix chicago
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from dataset_store import STORE_DIR, DatasetStore
+from core.filepaths import parse_filepaths
+
+EXPORTS_DIR = os.path.join("data", "exports")
+SUBSETS_DIR = "subsets"
+MANIFEST_NAME = "cluster_manifest.json"
+BLOCK_SIZE = 4096
+
+_embeddings = {}
+
+
+def _load(path, normalize):
+    """Per-process cache of memory-mapped (and optionally normalised) inputs."""
+    key = (path, normalize)
+    if key not in _embeddings:
+        X = np.load(path, mmap_mode="r")
+        norms = np.linalg.norm(X, axis=1).astype(np.float32) if normalize else None
+        _embeddings[key] = (X, norms)
+    return _embeddings[key]
+
+
+def neighbour_block(path, i0, i1, j0, j1, epsilon, metric, rows_i=None, rows_j=None):
+    """
+    Edges (i, j), i < j, between rows [i0, i1) and [j0, j1) closer than
+    ``epsilon``, plus the neighbour count of every row in both ranges. When
+    clustering a subset, ``rows_i``/``rows_j`` are the embedding rows behind
+    those ranges.
+    """
+    X, norms = _load(path, metric == "cosine")
+    rows_i = slice(i0, i1) if rows_i is None else rows_i
+    rows_j = slice(j0, j1) if rows_j is None else rows_j
+    A = np.asarray(X[rows_i], dtype=np.float32)
+    B = np.asarray(X[rows_j], dtype=np.float32)
+    gram = A @ B.T
+    if metric == "cosine":
+        gram /= np.maximum(norms[rows_i, None] * norms[None, rows_j], 1e-12)
+        close = (1 - gram) <= epsilon
+    else:
+        sq = (A * A).sum(1)[:, None] + (B * B).sum(1)[None, :] - 2 * gram
+        close = sq <= epsilon * epsilon
+
+    i, j = np.nonzero(close)
+    i += i0
+    j += j0
+    keep = i < j
+    i, j = i[keep], j[keep]
+    return i.astype(np.int32), j.astype(np.int32)
+
+
+def dbscan_labels(n, i, j, min_samples):
+    """
+    DBSCAN labels from an epsilon-neighbour edge list: core points have at
+    least ``min_samples`` points (themselves included) within epsilon, core
+    points connected by an edge share a cluster, and border points join the
+    cluster of a neighbouring core point. Noise is -1.
+    """
+    degree = np.bincount(i, minlength=n) + np.bincount(j, minlength=n) + 1
+    core = degree >= min_samples
+
+    both = core[i] & core[j]
+    graph = coo_matrix((np.ones(both.sum(), dtype=np.int8), (i[both], j[both])), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+    labels = np.where(core, components, -1)
+
+    # border points: attach to any core neighbour
+    border_i = ~core[i] & core[j]
+    labels[i[border_i]] = components[j[border_i]]
+    border_j = core[i] & ~core[j]
+    labels[j[border_j]] = components[i[border_j]]
+
+    # renumber clusters by decreasing size, as in the notebook
+    clustered = labels >= 0
+    _, dense, sizes = np.unique(labels[clustered], return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    labels[clustered] = rank[dense]
+    return labels
+
+
+def export_name(year, epsilon, prefix="all"):
+    return f"{prefix}_{year}_epsilon_{str(epsilon).replace('.', '_')}.json"
+
+
+def manifest_key(year, prefix):
+    return year if prefix == "all" else f"{prefix}_{year}"
+
+
+def input_signature(npy_path, txt_path):
+    return [
+        [os.path.getsize(p), int(os.path.getmtime(p))] for p in (npy_path, txt_path)
+    ]
+
+
+def find_years(embeddings_dir):
+    """{year: (npy path, txt path)} for every <year>_embeddings.npy/.txt pair."""
+    years = {}
+    for filename in sorted(os.listdir(embeddings_dir)):
+        match = re.fullmatch(r"(\d{4})_embeddings\.npy", filename)
+        txt_path = os.path.join(embeddings_dir, f"{filename[:-4]}.txt")
+        if match and os.path.exists(txt_path):
+            years[match.group(1)] = (os.path.join(embeddings_dir, filename), txt_path)
+    return years
+
+
+def newspaper_rows(filenames, lccns):
+    """Indices of the ``filenames`` (raw ids) published by one of ``lccns``."""
+    table = parse_filepaths(filenames)
+    codes = [table.lccns.find(lccn) for lccn in lccns]
+    return np.flatnonzero(np.isin(table.lccn, [code for code in codes if code >= 0]))
+
+
+def place_lccns(store, year, places):
+    """LCCNs of the newspapers published in ``places`` during ``year``."""
+    rows = store.read(["lccn"], years=int(year), isin={"place_of_publication": places})
+    return sorted(set(rows["lccn"]))
+
+
+def cluster_years(
+    embeddings_dir,
+    output_dir=EXPORTS_DIR,
+    epsilon=2.4,
+    min_samples=2,
+    metric="euclidean",
+    years=None,
+    workers=None,
+    block_size=BLOCK_SIZE,
+    force=False,
+    lccns=None,
+    places=None,
+    store_dir=STORE_DIR,
+    prefix="all",
+):
+    if (lccns or places) and prefix == "all":
+        raise ValueError("clustering a subset of newspapers needs its own export prefix")
+    if prefix != "all":
+        output_dir = os.path.join(output_dir, SUBSETS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    params = {"epsilon": epsilon, "min_samples": min_samples, "metric": metric}
+    inputs = find_years(embeddings_dir)
+    store = DatasetStore.open(store_dir) if places else None
+    pending = {}
+    for year, (npy_path, txt_path) in inputs.items():
+        if years and year not in years:
+            continue
+        entry = {
+            "input": input_signature(npy_path, txt_path),
+            "output": export_name(year, epsilon, prefix),
+            **params,
+        }
+        if lccns or places:
+            newspapers = set(lccns or [])
+            if places:
+                newspapers.update(place_lccns(store, year, places))
+            entry["lccns"] = sorted(newspapers)
+        up_to_date = manifest.get(manifest_key(year, prefix)) == entry and os.path.exists(
+            os.path.join(output_dir, entry["output"])
+        )
+        if force or not up_to_date:
+            pending[year] = entry
+        else:
+            print(f"Skipping {year}: up to date")
+
+    # restrict years to the requested newspapers' rows
+    filenames = {}
+    selected = {}
+    for year, entry in pending.items():
+        npy_path, txt_path = inputs[year]
+        with open(txt_path, "r") as f:
+            filenames[year] = [line.rstrip("\n") for line in f]
+        n_embeddings = len(np.load(npy_path, mmap_mode="r"))
+        if len(filenames[year]) != n_embeddings:
+            raise ValueError(f"{year}: {len(filenames[year])} filenames for {n_embeddings} embeddings")
+        if "lccns" in entry:
+            selected[year] = newspaper_rows(filenames[year], entry["lccns"])
+            filenames[year] = [filenames[year][r] for r in selected[year]]
+
+    # fan all (year, block pair) tasks out to one pool
+    start = time.perf_counter()
+    edges = defaultdict(list)
+    sizes = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for year in pending:
+            npy_path = inputs[year][0]
+            rows = selected.get(year)
+            n = len(filenames[year])
+            sizes[year] = n
+            for i0 in range(0, n, block_size):
+                for j0 in range(i0, n, block_size):
+                    i1, j1 = min(i0 + block_size, n), min(j0 + block_size, n)
+                    future = pool.submit(
+                        neighbour_block,
+                        npy_path,
+                        i0,
+                        i1,
+                        j0,
+                        j1,
+                        epsilon,
+                        metric,
+                        None if rows is None else rows[i0:i1],
+                        None if rows is None else rows[j0:j1],
+                    )
+                    futures[future] = year
+        for future in as_completed(futures):
+            edges[futures[future]].append(future.result())
+
+    for year, entry in pending.items():
+        i = np.concatenate([e[0] for e in edges[year]] or [np.zeros(0, np.int32)])
+        j = np.concatenate([e[1] for e in edges[year]] or [np.zeros(0, np.int32)])
+        labels = dbscan_labels(sizes[year], i, j, min_samples)
+
+        order = np.argsort(labels, kind="stable")
+        order = order[labels[order] >= 0]
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        clusters = {
+            str(k): [filenames[year][r] for r in rows]
+            for k, rows in enumerate(np.split(order, bounds) if len(order) else [])
+        }
+        with open(os.path.join(output_dir, entry["output"]), "w") as f:
+            json.dump(clusters, f)
+        manifest[manifest_key(year, prefix)] = entry
+        print(
+            f"{year}: {len(clusters)} clusters, {int((labels < 0).sum())} noise points "
+            f"from {sizes[year]} embeddings"
+        )
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Clustered {len(pending)} years in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--embeddings-dir", default="embeddings")
+    parser.add_argument("--output-dir", default=EXPORTS_DIR)
+    parser.add_argument("--epsilon", type=float, default=2.4)
+    parser.add_argument("--min-samples", type=int, default=2)
+    parser.add_argument("--metric", choices=("euclidean", "cosine"), default="euclidean")
+    parser.add_argument("--years", nargs="*", help="only these years (default: all)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--force", action="store_true", help="recluster unchanged years")
+    parser.add_argument("--lccns", nargs="*", help="only images from these newspapers")
+    parser.add_argument("--places", nargs="*", help="only newspapers published in these places")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="dataset store used for --places")
+    parser.add_argument("--prefix", default="all", help="export name prefix for subsets")
+    args = parser.parse_args()
+    if (args.lccns or args.places) and args.prefix == "all":
+        parser.error("--lccns/--places need a --prefix other than 'all'")
+
+    cluster_years(
+        args.embeddings_dir,
+        args.output_dir,
+        epsilon=args.epsilon,
+        min_samples=args.min_samples,
+        metric=args.metric,
+        years=args.years,
+        workers=args.workers,
+        block_size=args.block_size,
+        force=args.force,
+        lccns=args.lccns,
+        places=args.places,
+        store_dir=args.store_dir,
+        prefix=args.prefix,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Local copy of the Newspaper Navigator photos split, partitioned on disk by
+publication year and optionally by newspaper (LCCN).
+
+Each partition is a directory (``year=1910/`` or ``year=1910/lccn=sn86063381/``)
+of uncompressed ``.npz`` chunks holding every column: text columns as a
+UTF-8 blob plus int64 lengths, numeric columns as arrays. Members of an npz
+are read individually, so a query only reads the columns it asks for.
+``store.json`` lists the columns,
+their types and the row count of every partition, and is written last, so an
+interrupted build is never mistaken for a complete store.
+
+Queries prune partitions by year and LCCN before touching any data, read only
+the requested columns of the partitions that remain, and evaluate membership
+filters (``isin``) on their column before decoding the others:
+
+    store = DatasetStore.open()
+    rows = store.read(["filepath", "prediction_section_iiif_url"], years=range(1910, 1915))
+
+It lives in scripts/datasets/ next to the other local copies. Build it once
+from the Hugging Face dataset:
+
+    python scripts/dataset_store.py build --by-lccn
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from core.cluster_store import StringTable  # noqa: E402
+
+STORE_DIR = os.path.join(os.path.dirname(__file__), "datasets", "newspaper_navigator_store")
+MANIFEST_NAME = "store.json"
+DATASET_NAME = "biglam/newspaper-navigator"
+DATASET_CONFIG = "photos"
+
+
+def _column_type(value):
+    """Schema entry for a column from one of its values."""
+    if isinstance(value, str):
+        return {"kind": "text"}
+    array = np.asarray(value)
+    if array.dtype.kind in "biuf":
+        dtype = np.float64 if array.dtype.kind == "f" else np.int64
+        if array.dtype.kind == "b":
+            dtype = np.bool_
+        return {"kind": "array", "dtype": np.dtype(dtype).str, "shape": list(array.shape)}
+    # lists of strings, dicts, ...
+    return {"kind": "json"}
+
+
+def _infer_schema(batch):
+    schema = {}
+    for name, values in batch.items():
+        value = next((v for v in values if v is not None), "")
+        schema[name] = _column_type(value)
+    return schema
+
+
+def _partition_path(key, partition_by):
+    return os.path.join(*(f"{field}={value}" for field, value in zip(partition_by, key)))
+
+
+def _encode_chunk(schema, columns):
+    """Arrays for one chunk file: ``{name}_blob``/``{name}_lengths`` per text column."""
+    arrays = {}
+    for name, column_type in schema.items():
+        values = columns[name]
+        if column_type["kind"] == "array":
+            shape = [len(values)] + column_type["shape"]
+            arrays[name] = np.asarray(values, dtype=column_type["dtype"]).reshape(shape)
+            continue
+        if column_type["kind"] == "json":
+            values = [json.dumps(v) for v in values]
+        encoded = [(v or "").encode("utf-8") for v in values]
+        arrays[f"{name}_blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        arrays[f"{name}_lengths"] = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    return arrays
+
+
+def build_dataset_store(batches, root=STORE_DIR, by_lccn=False, overwrite=False, flush_rows=200_000):
+    """
+    Writes a partitioned store from an iterable of columnar batches (dicts of
+    lists, e.g. ``Dataset.iter``) that include ``pub_date`` and ``lccn``.
+    Rows keep their dataset order within each partition. Rows are buffered
+    per partition and every ``flush_rows`` rows each buffered partition gets
+    one more chunk file, so the number of files stays close to the number of
+    partitions however small the batches are. Returns the store.
+    """
+    if os.path.exists(root):
+        if not overwrite:
+            raise FileExistsError(f"{root} already exists; pass overwrite=True to rebuild it")
+        shutil.rmtree(root)
+    os.makedirs(root)
+
+    partition_by = ("year", "lccn") if by_lccn else ("year",)
+    schema = None
+    rows = defaultdict(int)
+    chunks = defaultdict(int)
+    buffered = defaultdict(lambda: defaultdict(list))
+    n_buffered = 0
+
+    def flush():
+        for key, columns in buffered.items():
+            directory = os.path.join(root, _partition_path(key, partition_by))
+            os.makedirs(directory, exist_ok=True)
+            # uncompressed npz: one file, but each column is read separately
+            np.savez(os.path.join(directory, f"chunk-{chunks[key]:04d}.npz"), **_encode_chunk(schema, columns))
+            chunks[key] += 1
+        buffered.clear()
+
+    for batch in batches:
+        if schema is None:
+            schema = _infer_schema(batch)
+        years = [int(date[:4]) for date in batch["pub_date"]]
+        keys = list(zip(years, batch["lccn"]) if by_lccn else zip(years))
+        for name in schema:
+            for key, value in zip(keys, batch[name]):
+                buffered[key][name].append(value)
+        for key in keys:
+            rows[key] += 1
+        n_buffered += len(keys)
+        if n_buffered >= flush_rows:
+            flush()
+            n_buffered = 0
+    if schema is not None:
+        flush()
+
+    manifest = {
+        "partition_by": list(partition_by),
+        "schema": schema or {},
+        "partitions": [
+            {**dict(zip(partition_by, key)), "rows": n, "chunks": chunks[key]}
+            for key, n in sorted(rows.items())
+        ],
+    }
+    with open(os.path.join(root, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return DatasetStore(root, manifest)
+
+
+def _years(years):
+    if years is None:
+        return None
+    if isinstance(years, (int, np.integer)):
+        return {int(years)}
+    return {int(year) for year in years}
+
+
+def _compress(values, keep):
+    """The entries of ``values`` (an ndarray or a list) where ``keep`` is True."""
+    if isinstance(values, np.ndarray):
+        return values[keep]
+    return [value for value, kept in zip(values, keep.tolist()) if kept]
+
+
+class DatasetStore:
+    def __init__(self, root, manifest):
+        self.root = root
+        self.partition_by = tuple(manifest["partition_by"])
+        self.schema = manifest["schema"]
+        self.column_names = list(self.schema)
+        self._partitions = manifest["partitions"]
+
+    @classmethod
+    def open(cls, root=STORE_DIR):
+        path = os.path.join(root, MANIFEST_NAME)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"No dataset store at {root}; build one with scripts/dataset_store.py build"
+            )
+        with open(path, "r") as f:
+            return cls(root, json.load(f))
+
+    def __len__(self):
+        return sum(p["rows"] for p in self._partitions)
+
+    @property
+    def years(self):
+        return sorted({p["year"] for p in self._partitions})
+
+    def partitions(self, years=None, lccns=None):
+        """Partitions that can hold rows of ``years`` and ``lccns``."""
+        years = _years(years)
+        lccns = set(lccns) if lccns is not None and "lccn" in self.partition_by else None
+        return [
+            p
+            for p in self._partitions
+            if (years is None or p["year"] in years) and (lccns is None or p["lccn"] in lccns)
+        ]
+
+    def _chunks(self, partition):
+        directory = os.path.join(self.root, _partition_path(
+            [partition[field] for field in self.partition_by], self.partition_by
+        ))
+        return [
+            np.load(os.path.join(directory, f"chunk-{k:04d}.npz"))
+            for k in range(partition["chunks"])
+        ]
+
+    def _column(self, chunks, name):
+        """One column of a partition: an ndarray or a ``StringTable``."""
+        if self.schema[name]["kind"] == "array":
+            return np.concatenate([chunk[name] for chunk in chunks])
+        lengths = np.concatenate([chunk[f"{name}_lengths"] for chunk in chunks])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        blob = np.concatenate([chunk[f"{name}_blob"] for chunk in chunks])
+        return StringTable(blob, offsets)
+
+    def _take(self, column, name, rows):
+        if isinstance(column, np.ndarray):
+            return np.asarray(column[rows])
+        values = column.take(rows)
+        if self.schema[name]["kind"] == "json":
+            values = [json.loads(v) for v in values]
+        return values
+
+    def iter_batches(self, columns=None, years=None, lccns=None, isin=None):
+        """
+        Yields one dict of columns per matching partition (ndarrays for
+        numeric columns, lists otherwise). ``isin`` maps column names to
+        collections of accepted values; those columns are read first and the
+        rest are decoded only for the rows that pass (filter columns are
+        decoded once, and their filtered values reused).
+        """
+        columns = list(columns or self.column_names)
+        isin = dict(isin or {})
+        if lccns is not None and "lccn" not in self.partition_by:
+            isin["lccn"] = lccns
+        isin = {name: set(values) for name, values in isin.items()}
+
+        for partition in self.partitions(years, lccns):
+            chunks = self._chunks(partition)
+            rows = np.arange(partition["rows"])
+            # decoded filter columns, kept aligned with rows
+            decoded = {}
+            for name, accepted in isin.items():
+                values = self._take(self._column(chunks, name), name, rows)
+                keep = np.fromiter((v in accepted for v in values), dtype=bool, count=len(rows))
+                rows = rows[keep]
+                decoded = {other: _compress(kept, keep) for other, kept in decoded.items()}
+                if name in columns:
+                    decoded[name] = _compress(values, keep)
+                if not len(rows):
+                    break
+            if len(rows):
+                yield {
+                    name: decoded[name] if name in decoded else self._take(self._column(chunks, name), name, rows)
+                    for name in columns
+                }
+            for chunk in chunks:
+                chunk.close()
+
+    def read(self, columns=None, years=None, lccns=None, isin=None):
+        """``iter_batches`` concatenated into one dict of columns."""
+        columns = list(columns or self.column_names)
+        parts = defaultdict(list)
+        for batch in self.iter_batches(columns, years, lccns, isin):
+            for name in columns:
+                parts[name].append(batch[name])
+
+        result = {}
+        for name in columns:
+            if self.schema[name]["kind"] == "array":
+                shape = [0] + self.schema[name]["shape"]
+                empty = np.zeros(shape, dtype=self.schema[name]["dtype"])
+                result[name] = np.concatenate(parts[name]) if parts[name] else empty
+            else:
+                result[name] = [value for part in parts[name] for value in part]
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    build = subparsers.add_parser("build", help=f"partition {DATASET_NAME} ({DATASET_CONFIG})")
+    build.add_argument("--root", default=STORE_DIR)
+    build.add_argument("--by-lccn", action="store_true", help="also partition by newspaper")
+    build.add_argument("--batch-size", type=int, default=10_000)
+    build.add_argument("--overwrite", action="store_true")
+    build.set_defaults(command="build")
+
+    info = subparsers.add_parser("info", help="rows per year in an existing store")
+    info.add_argument("--root", default=STORE_DIR)
+    info.set_defaults(command="info")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from datasets import load_dataset
+
+        photos = load_dataset(DATASET_NAME, DATASET_CONFIG, split="train")
+        start = time.perf_counter()
+        store = build_dataset_store(
+            photos.iter(args.batch_size), args.root, by_lccn=args.by_lccn, overwrite=args.overwrite
+        )
+        print(
+            f"Wrote {len(store)} rows in {len(store.partitions())} partitions "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+    else:
+        store = DatasetStore.open(args.root)
+        for year in store.years:
+            print(year, sum(p["rows"] for p in store.partitions(years=year)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Concurrent, resumable image downloader for IIIF urls.
+
+Downloads are spread over a thread pool sharing one pooled ``requests``
+session. A token bucket caps the request rate across all threads, so slow
+responses overlap instead of each one adding to a fixed per-request sleep.
+Every finished download is appended to a JSONL manifest keyed by
+``filepath``; re-running skips anything already on disk.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MANIFEST_NAME = "manifest.jsonl"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, ``capacity`` burst."""
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every caller of ``acquire`` for at least ``seconds``."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # a debt that takes ``seconds`` to refill before the next token
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def filename_for(filepath):
+    """Stable file name for a dataset filepath, e.g. a/b/c.jpg -> a_b_c.jpg."""
+    filename = filepath.replace("/", "_")
+    return filename if filename.endswith(".jpg") else f"{filename}.jpg"
+
+
+def load_manifest(output_dir):
+    """Return {filepath: entry} for every successful download so far."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash; the image is simply redone
+                continue
+            if os.path.exists(os.path.join(output_dir, entry["file"])):
+                done[entry["filepath"]] = entry
+    return done
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def retry_delay(value, default):
+    """
+    Seconds to wait from a Retry-After header, which is either a number of
+    seconds or an HTTP-date; ``default`` when missing or unparseable.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return default
+    if date.tzinfo is None:
+        # HTTP-dates are always GMT
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, date.timestamp() - time.time())
+
+
+RETRY_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def fetch(session, bucket, url, path, retries, backoff, timeout):
+    """
+    Download ``url`` to ``path`` atomically; returns the number of bytes.
+
+    A Retry-After from the server pauses the shared ``bucket``, so every
+    thread backs off, not just the one that was told to; other retryable
+    failures back off exponentially in this thread only.
+    """
+    tmp_path = f"{path}.part"
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            response = session.get(url, stream=True, timeout=timeout)
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                if retry_after:
+                    bucket.pause(retry_delay(retry_after, backoff * 2**attempt))
+                else:
+                    time.sleep(backoff * 2**attempt)
+                continue
+            response.raise_for_status()
+
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                # never leave a partial body behind
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, path)
+            return size
+        except RETRY_ERRORS:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt)
+
+
+def download_images(
+    items,
+    output_dir,
+    requests_per_minute=20,
+    burst=1,
+    workers=8,
+    retries=3,
+    backoff=1.0,
+    timeout=30,
+):
+    """
+    Downloads ``items`` (an iterable of ``(filepath, url)`` pairs) to
+    ``output_dir`` and returns a throughput report.
+
+    ``requests_per_minute`` is shared by all ``workers``, so the total request
+    rate never exceeds it however many downloads are in flight.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_manifest(output_dir)
+    # one download per filepath, even if it is listed more than once
+    todo = {}
+    for fp, url in items:
+        if fp not in done:
+            todo.setdefault(fp, url)
+
+    # end a line torn by a crash, so the next entry isn't appended to it
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path) and os.path.getsize(manifest_path):
+        with open(manifest_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=burst)
+    session = make_session(workers)
+    manifest_lock = threading.Lock()
+    report = {"skipped": len(done), "downloaded": 0, "failed": 0, "bytes": 0}
+    errors = {}
+
+    def download(filepath, url):
+        filename = filename_for(filepath)
+        size = fetch(
+            session,
+            bucket,
+            url,
+            os.path.join(output_dir, filename),
+            retries,
+            backoff,
+            timeout,
+        )
+        entry = {"filepath": filepath, "file": filename, "url": url, "bytes": size}
+        with manifest_lock, open(os.path.join(output_dir, MANIFEST_NAME), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(download, fp, url): fp for fp, url in todo.items()}
+        for future in as_completed(futures):
+            try:
+                report["bytes"] += future.result()
+                report["downloaded"] += 1
+            except requests.exceptions.RequestException as e:
+                report["failed"] += 1
+                errors[futures[future]] = str(e)
+    session.close()
+
+    elapsed = time.perf_counter() - start
+    report["seconds"] = round(elapsed, 3)
+    report["images_per_second"] = round(report["downloaded"] / elapsed, 3) if elapsed else 0.0
+    report["bytes_per_second"] = round(report["bytes"] / elapsed, 1) if elapsed else 0.0
+    report["errors"] = errors
+    return report
@@ -40,7 +40,12 @@ def _():
     # lastly, we handle imports for showing IIIF photos
     from IPython.display import Image, display
     import requests
-    return Image, LogisticRegression, display, np, pickle
+
+    # the OCR index and facet learner are shared with the backend
+    import os
+    import sys
+    sys.path.insert(0, os.path.join("..", "src", "backend"))
+    return Image, display, np, os, pickle
 
 
 @app.cell(hide_code=True)
@@ -50,19 +55,16 @@ def _(mo):
 
 
 @app.cell
-def _(np, pickle):
+def _(pickle):
+    # the embeddings are memory-mapped by the facet learner below
     with open('datasets/starting_data/global_metadata.pkl', 'rb') as f:
         metadata = pickle.load(f)
     print('Loaded metadata!')
-    embeddings = np.load('datasets/starting_data/global_embeddings_light.npy')
-    print('Loaded embeddings!')
     for _i in range(0, len(metadata)):
-        lowered = metadata[_i]['ocr'].lower()
-        metadata[_i]['lowered_ocr'] = lowered
         metadata[_i]['uuid'] = _i
-    print('Lowered all OCR for ease of string matching & added UUIDs!')
+    print('Added UUIDs!')
     print(metadata[0])
-    return embeddings, metadata
+    return (metadata,)
 
 
 @app.cell(hide_code=True)
@@ -72,20 +74,33 @@ def _(mo):
 
 
 @app.cell
-def _(metadata):
+def _(metadata, os):
+    from core.ocr_index import OCRIndex, build_ocr_index
+    from core.ocr_store import OCRStore, build_ocr_store
+
+    # Build the inverted OCR index once; afterwards it is memory-mapped
+    ocr_index_dir = "datasets/starting_data/ocr_index"
+    if not os.path.exists(ocr_index_dir):
+        build_ocr_index((md["ocr"] for md in metadata), ocr_index_dir)
+    ocr_index = OCRIndex.load(ocr_index_dir)
+
+    # The OCR text itself moves to a compressed store next to it, so the
+    # metadata dicts don't have to hold gigabytes of text
+    if not OCRStore.exists(ocr_index_dir):
+        build_ocr_store((md["ocr"] for md in metadata), ocr_index_dir)
+    ocr_store = OCRStore.load(ocr_index_dir)
+    for md in metadata:
+        md.pop("ocr", None)
+
+    # Terms are ANDed, `OR` separates alternatives, "quotes" make a phrase
+    # and a trailing * matches a prefix, e.g. '"horse race" OR boxer*'
     def keyword_search(search):
-        res = []
-        for _i in range(0, len(metadata)):
-            md = metadata[_i]
-            if len(search) > 0:
-                if 'lowered_ocr' in md.keys():
-                    if not search in md['lowered_ocr']:
-                        continue
-            res.append(md)
-        return res
+        if len(search.strip()) == 0:
+            return metadata
+        return [metadata[_i] for _i in ocr_index.search(search)]
     results = keyword_search('baseball')
     for _i in range(0, 3):
-        print(results[_i])
+        print(results[_i], ocr_store[results[_i]['uuid']])
     return (keyword_search,)
 
 
@@ -96,44 +111,23 @@ def _(mo):
 
 
 @app.cell
-def _(LogisticRegression, embeddings, np):
-    # this function trains the facet learner and predicts on all examples
-    # positive_indices, negative_indices are used for training
-    def train_and_predict(positive_indices, negative_indices):
-
-        # set random seed for reproducibility w/ negative examples
-        np.random.seed(0)
-
-        # next, we grab the embeddings 
-        positive_embeddings = embeddings[positive_indices]
-        negative_embeddings = embeddings[negative_indices]
-
-        # construct training data
-        train_X = np.concatenate((positive_embeddings, negative_embeddings), axis=0)
-        train_y = np.concatenate((np.ones(len(positive_embeddings)), np.zeros(len(negative_embeddings))))
-        # set sample weight
-        sample_weight = np.ones(len(positive_embeddings) + len(negative_embeddings))
-        sample_weight[:len(positive_indices)] = 10
-        sample_weight[-len(negative_indices):] = 10
-
-        # create Linear SVM
-        # clf = RandomForestClassifier(max_depth=5, random_state=1, n_estimators=100)
-        clf = LogisticRegression(class_weight='balanced', random_state=1, max_iter=100000)
-        # LinearSVC(class_weight='balanced', verbose=False, max_iter=100000, tol=1e-6, random_state=1)
-
-        # fit to the training data (positive + negative annotations w/ additional, randomly drawn negative examples)
-        clf.fit(train_X, train_y, sample_weight)
-
-        # generate predictions
-        predictions = clf.predict_proba(embeddings)[:,1]
+def _():
+    from core.cache import snapshot_version
+    from core.facet_cache import FacetCache
+    from core.facet_learner import FacetLearner
 
-        return predictions
-    return (train_and_predict,)
+    # the learner scores the memory-mapped embeddings chunk by chunk, and
+    # trained facets are kept on disk keyed by query + labels, so re-running
+    # a cell (or the whole notebook) doesn't retrain anything
+    embeddings_path = 'datasets/starting_data/global_embeddings_light.npy'
+    facet_cache = FacetCache('datasets/starting_data/facet_cache', snapshot_version([embeddings_path]))
+    facet_learner = FacetLearner(embeddings_path, block_norms=facet_cache.block_norms())
+    return facet_cache, facet_learner
 
 
 @app.cell
-def _(embeddings, keyword_search, np, train_and_predict):
-    N_PREDICTIONS = 1000
+def _(facet_cache, facet_learner, keyword_search, np):
+    from core.facet_learner import facet_key
 
     def train_facet_learner(search):
 
@@ -144,73 +138,75 @@ def _(embeddings, keyword_search, np, train_and_predict):
 
         print("Found " + str(len(results)) + " positive matches")
 
-        print("Generating training data...")
+        # convert to indices, plus as many (seeded) random negatives
+        positive_indices = np.array([result['uuid'] for result in results], dtype=np.int64)
+        negative_indices = facet_learner.sample_negatives(positive_indices)
 
-        # convert to indices
-        positive_indices = []
-        for result in results:
-            positive_indices.append(result['uuid'])
-
-    #     for i in positive_indices[:10]:
-    #         display(Image(metadata[i]['IIIF_downsampled_url']))
-
-        # generate random negative indices
-        n_negative_examples = len(positive_indices)
-        random_indices_for_negative = np.arange(len(embeddings))
-        np.random.shuffle(random_indices_for_negative)
-        random_indices_for_negative = random_indices_for_negative[:n_negative_examples]
-        negative_indices = random_indices_for_negative
+        facet = facet_cache.get(facet_key(search, positive_indices, negative_indices))
+        if facet is not None:
+            print("Cached facet " + facet.key)
+            return facet
 
         print("Training and predicting...")
 
-        # train and predict using function defined above
-        predictions = train_and_predict(positive_indices, negative_indices)
+        # top results (capped @ 1K) skip photos already in library (+ or -)
+        facet, timings = facet_learner.learn_facet(search, positive_indices, negative_indices)
+        facet_cache.put(facet)
+        facet_cache.save_block_norms(facet_learner.block_norms)
 
-        print("Sorting results & filtering...")
+        print("Done in " + str(round(sum(timings.values()), 2)) + "s")
+        return facet
 
-        # sort indices of predictions and invert (here, capped @ 1K results)
-        sorted_indices = predictions.argsort()[::-1]
-        sorted_indices = sorted_indices[:N_PREDICTIONS + len(positive_indices) + len(negative_indices)]
+    # label a few results by hand: the classifier is warm-started and only
+    # the rows that can still make the top 1K are rescored
+    def refine_facet(facet, positive=(), negative=()):
+        refined, timings = facet_learner.refine(facet, positive, negative)
+        facet_cache.put(refined)
+        print("Refined in " + str(round(sum(timings.values()), 3)) + "s, "
+              + str(refined.rescored) + " rows rescored")
+        return refined
+    return refine_facet, train_facet_learner
 
-        # filter out photos already in library (+ or -)
-        filtered_sorted_indices = []
-        for index in sorted_indices:
-            if index not in positive_indices and index not in negative_indices:
-                filtered_sorted_indices.append(index)    
 
-        print("Done!")
-        return filtered_sorted_indices
-    return (train_facet_learner,)
+@app.cell
+def _(Image, display, metadata, train_facet_learner):
+    _facet = train_facet_learner('building')
+    for _i in _facet.top(20)[0].tolist():
+        display(Image(metadata[_i]['IIIF_downsampled_url']))
+    return
 
 
 @app.cell
 def _(Image, display, metadata, train_facet_learner):
-    _facet_learner_results = train_facet_learner('building')
-    for _i in _facet_learner_results[:20]:
+    _facet = train_facet_learner('baseball')
+    for _i in _facet.top(20)[0].tolist():
         display(Image(metadata[_i]['IIIF_downsampled_url']))
     return
 
 
 @app.cell
-def _(Image, display, metadata, train_facet_learner):
-    _facet_learner_results = train_facet_learner('baseball')
-    for _i in _facet_learner_results[:20]:
+def _(Image, display, metadata, refine_facet, train_facet_learner):
+    # e.g. the 3rd and 5th baseball results aren't baseball photos
+    _facet = train_facet_learner('baseball')
+    _results = _facet.top(20)[0]
+    _facet = refine_facet(_facet, negative=_results[[2, 4]])
+    for _i in _facet.top(20)[0].tolist():
         display(Image(metadata[_i]['IIIF_downsampled_url']))
     return
 
 
 @app.cell
 def _(Image, display, metadata, train_facet_learner):
-    _facet_learner_results = train_facet_learner(' horse ')
-    for _i in _facet_learner_results[:20]:
+    _facet = train_facet_learner(' horse ')
+    for _i in _facet.top(20)[0].tolist():
         display(Image(metadata[_i]['IIIF_downsampled_url']))
     return
 
 
 @app.cell
 def _(Image, display, metadata, train_facet_learner):
-    _facet_learner_results = train_facet_learner(' boxer ')
-    for _i in _facet_learner_results[:20]:
+    _facet = train_facet_learner(' boxer ')
+    for _i in _facet.top(20)[0].tolist():
         display(Image(metadata[_i]['IIIF_downsampled_url']))
     return
 
@@ -13,86 +13,67 @@ def _(mo):
 @app.cell
 def _():
     import os
-    import time
-    import requests
 
-    from datasets import load_dataset, load_from_disk
-    from tqdm import tqdm
+    from datasets import load_dataset
     import marimo as mo
-    return load_dataset, mo, os, requests, time, tqdm
 
-
-@app.cell
-def _(load_dataset):
-    # Load a specific configuration (e.g., photos)
-    photos_dataset = load_dataset("biglam/newspaper-navigator", "photos")
-    return (photos_dataset,)
+    from dataset_store import STORE_DIR, DatasetStore, build_dataset_store
+    return DatasetStore, STORE_DIR, build_dataset_store, load_dataset, mo, os
 
 
 @app.cell
-def _(photos_dataset):
-    # Save dataset to disk
-    photos_dataset.save_to_disk(f"datasets/newspaper_navigator_photos")
-    return
+def _(DatasetStore, STORE_DIR, build_dataset_store, load_dataset, os):
+    # Partition the photos split by year and newspaper once; later runs
+    # (and get_metadata.py / cluster_images.py) only open the store
+    if os.path.exists(os.path.join(STORE_DIR, "store.json")):
+        store = DatasetStore.open(STORE_DIR)
+    else:
+        photos_dataset = load_dataset("biglam/newspaper-navigator", "photos", split="train")
+        store = build_dataset_store(photos_dataset.iter(10_000), STORE_DIR, by_lccn=True)
+    return (store,)
 
 
 @app.cell
-def _(photos_dataset):
-    filtered_photos_dataset = photos_dataset["train"].filter(
-        lambda x: "1910" <= x["pub_date"][:4] <= "1910"
+def _(store):
+    # Only the 1910 partitions are read, and only these columns
+    years = range(1910, 1911)
+    photos = store.read(
+        ["filepath", "pub_date", "name", "ocr", "prediction_section_iiif_url"],
+        years=years,
     )
-
-    filtered_photos_dataset.save_to_disk("datasets/newspaper_navigator_photos_filtered")
-
-    return (filtered_photos_dataset,)
+    return (photos,)
 
 
 @app.cell
-def _(filtered_photos_dataset):
-    print(len(filtered_photos_dataset))
+def _(photos):
+    print(len(photos["filepath"]))
 
     # View the first example
-    example = filtered_photos_dataset[0]
-
-    print(f"Publication: {example['name']}")
-    print(f"Date: {example['pub_date']}")
-    print(f"OCR text: {example['ocr']}")
+    print(f"Publication: {photos['name'][0]}")
+    print(f"Date: {photos['pub_date'][0]}")
+    print(f"OCR text: {photos['ocr'][0]}")
 
-    image_url = example['prediction_section_iiif_url']
+    image_url = photos['prediction_section_iiif_url'][0]
     print(f"Image URL:\n{image_url}")
     return
 
 
 @app.cell
-def _(filtered_photos_dataset, os, requests, time, tqdm):
-    def download_images(dataset):
-        """Downloads all images from the dataset to a specified directory."""
-        output_dir = "datasets/filtered_image_files"
-        os.makedirs(output_dir, exist_ok=True)
-
-        # 20 requests per minute is 1 request every 3 seconds
-        requests_per_minute = 20
-        delay_between_requests = 60.0 / requests_per_minute
-
-        for index, photo in enumerate(tqdm(dataset, total=len(dataset))):
-
-            image_url = photo['prediction_section_iiif_url']  
-            #tqdm.write(f"Downloading item {index}: {image_url}")
-
-            try:
-                response = requests.get(image_url, stream=True)
-                response.raise_for_status()
-
-                filename = os.path.join(output_dir, f"{index}.jpg")
-
-                with open(filename, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                time.sleep(delay_between_requests)
-            except requests.exceptions.RequestException as e:
-                print(f"Error downloading {image_url}: {e}")
-
-    download_images(filtered_photos_dataset)
+def _(photos):
+    from downloader import download_images
+
+    # 20 requests per minute is the LoC limit; downloads overlap up to that
+    # rate and resume from datasets/filtered_image_files/manifest.jsonl
+    report = download_images(
+        zip(photos["filepath"], photos["prediction_section_iiif_url"]),
+        "datasets/filtered_image_files",
+        requests_per_minute=20,
+    )
+    print(
+        f"Downloaded {report['downloaded']} images "
+        f"({report['images_per_second']} img/s), skipped {report['skipped']}, "
+        f"failed {report['failed']}"
+    )
     return
 
 
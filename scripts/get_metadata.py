@@ -13,37 +13,43 @@ def _(mo):
 @app.cell
 def _():
     import json
+    import os
+    import sys
+    import time
     import marimo as mo
-    from datasets import load_dataset
-    return json, load_dataset, mo
+
+    # the filepath parser is shared with the backend
+    sys.path.insert(0, os.path.join("..", "src", "backend"))
+    from core.filepaths import parse_filepaths, raw_to_processed
+    from dataset_store import DatasetStore
+    return DatasetStore, json, mo, parse_filepaths, raw_to_processed, time
 
 
 @app.cell
-def _(load_dataset):
-    # Load a specific configuration (e.g., photos)
-    dataset = load_dataset("biglam/newspaper-navigator", "photos")
-    return (dataset,)
+def _(DatasetStore):
+    # The local year/LCCN-partitioned copy written by get_images.py
+    store = DatasetStore.open()
+    return (store,)
 
 
 @app.cell
-def _(json):
+def _(json, raw_to_processed):
     # Load the cluster data
     with open("../data/raw/clusters.json", "r") as clusters_json:
         clusters_raw_data = json.load(clusters_json)
 
     def format_cluster(clusters_data):
+        # 'a_b_c_d_e_f_g_h_i_j_k' -> 'a_b_c/d/e/f/g/h/i_j_k.jpg' for every
+        # filepath at once; ids that don't parse are kept as they are
+        keys = list(clusters_data)
+        sizes = [len(clusters_data[key]) for key in keys]
+        formatted = raw_to_processed(fp for key in keys for fp in clusters_data[key])
+
         formatted_data = {}
-        for cluster_id, filepaths in clusters_data.items():
-            formatted_data[cluster_id] = []
-            for filepath in filepaths:
-                # Formats a filepath from 'a_b_c' to 'a/b/c.jpg' style
-                parts = filepath.split('_')
-                if len(parts) >= 11:
-                    formatted_filepath = f"{parts[0]}_{parts[1]}_{parts[2]}/{parts[3]}/{parts[4]}/{parts[5]}/{parts[6]}/{parts[7]}/{'_'.join(parts[8:])}.jpg"
-                    formatted_data[cluster_id].append(formatted_filepath)
-                else:
-                    # Keep original if it doesn't match expected format
-                    formatted_data[cluster_id].append(filepath)
+        start = 0
+        for key, size in zip(keys, sizes):
+            formatted_data[key] = formatted[start:start + size]
+            start += size
         return formatted_data
 
     with open("../data/processed/clusters.json", "w") as processed_clusters_json:
@@ -54,68 +60,59 @@ def _(json):
 
 @app.cell
 def _(processed_cluster):
-    # Flatten the lists of filepaths from the clusters
-    filepaths_to_keep = [
+    # Create a set of the clustered filepaths for fast lookups
+    filepaths_set = {
         filepath
         for cluster_filepaths in processed_cluster.values()
         for filepath in cluster_filepaths
-    ]
-
-    # Create a set for faster lookups
-    filepaths_set = set(filepaths_to_keep)
+    }
 
     print(f"Total items: {len(filepaths_set)}")
-    print(filepaths_set)
     return (filepaths_set,)
 
 
 @app.cell
-def _(dataset, filepaths_set):
-    # Filter the dataset
-    filtered_dataset = dataset["train"].filter(
-        lambda x: x["filepath"] in filepaths_set
-    )
-    print(filtered_dataset)
-    return (filtered_dataset,)
-
-
-@app.cell
-def _(filtered_dataset):
-    # Remove columns
-    clean_dataset = filtered_dataset.remove_columns(["ocr"])
-    return (clean_dataset,)
-
-
-@app.cell
-def _(clean_dataset):
-    # Save JSON
-    clean_dataset.to_json("../data/raw/metadata.json")
-    return
+def _(filepaths_set, parse_filepaths, store, time):
+    # Only the partitions of the years and newspapers that appear in the
+    # clusters are read; the filepath column is tested first and the other
+    # columns (except OCR) are decoded for matching rows only. If any id
+    # doesn't parse, its partition is unknown, so every partition is read
+    start = time.perf_counter()
+    table = parse_filepaths(filepaths_set)
+    years, lccns = None, None
+    if table.valid.all():
+        years = set(table.year.tolist())
+        lccns = table.lccns.take(range(len(table.lccns)))
+    else:
+        print(f"{int((~table.valid).sum())} ids don't parse; reading every partition")
+    columns = [column for column in store.column_names if column != "ocr"]
+    metadata = store.read(columns, years=years, lccns=lccns, isin={"filepath": filepaths_set})
+    elapsed = time.perf_counter() - start
+    print(f"Selected {len(metadata['filepath'])} of {len(store)} rows from "
+          f"{len(store.partitions(years, lccns))} partitions in {elapsed:.1f}s")
+    return (metadata,)
 
 
 @app.cell
-def _(json):
-    # Fix forward slashes
-    def fix_slashes_in_file(input_path, output_path):
-        with open(input_path, 'r') as infile, open(output_path, 'w') as outfile:
-            for line in infile:
-                try:
-                    # Load the JSON object from the line
-                    data = json.loads(line)
-
-                    # Iterate over all key-value pairs
-                    for key, value in data.items():
-                        # If the value is a string and contains the escaped slashes, replace them
-                        if isinstance(value, str):
-                            data[key] = value.replace('\\/', '/')
-
-                    # Write the corrected JSON object back to the new file
-                    outfile.write(json.dumps(data) + '\n')
-                except json.JSONDecodeError:
-                    # If a line is not a valid JSON, write it as is to the new file
-                    outfile.write(line)
-
-    fix_slashes_in_file("../data/raw/metadata.json", "../data/processed/metadata.json")
+def _(json, metadata, time):
+    # Write JSON lines directly (the OCR column was never read); json.dumps
+    # doesn't escape forward slashes, so no second pass is needed to fix them
+    def write_metadata(columns, output_path):
+        start = time.perf_counter()
+        names = list(columns)
+        values = [
+            column.tolist() if hasattr(column, "tolist") else column
+            for column in columns.values()
+        ]
+        with open(output_path, "w") as outfile:
+            outfile.writelines(
+                json.dumps(dict(zip(names, row))) + "\n" for row in zip(*values)
+            )
+        n_rows = len(values[0]) if values else 0
+        elapsed = time.perf_counter() - start
+        print(f"Wrote {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    write_metadata(metadata, "../data/processed/metadata.json")
     return
 
 
@@ -0,0 +1,207 @@
+"""
+Perceptual hashes of the images fetched by downloader.py, and a report of
+cluster members that don't look like the rest of their cluster.
+
+``hash`` reads the download manifest of an image directory and hashes every
+downloaded file that isn't hashed yet, in chunks spread over a process pool.
+The dHash and pHash of each image are appended to ``dhash.npy`` and
+``phash.npy`` (uint64) next to ``hashes.txt``, which holds the dataset
+filepath of every row, like the embeddings' .npy/.txt pairs. Files that fail
+to decode are skipped and retried on the next run.
+
+``outliers`` compares the pHashes within each cluster. A member whose median
+distance to the rest of its cluster exceeds ``--threshold`` bits is reported,
+with the nearest hashed image from another cluster when there is one within
+``--radius`` bits.
+
+The hashes feed the backend's upload-matching endpoint through
+``build_artifacts.py phash-index``. Run from the repository root, e.g.:
+
+    python scripts/hash_images.py hash scripts/datasets/filtered_image_files
+    python scripts/hash_images.py outliers scripts/datasets/filtered_image_files
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from core.phash import PerceptualIndex, hamming, hash_images, index_arrays  # noqa: E402
+
+from downloader import load_manifest  # noqa: E402
+
+CHUNK_SIZE = 256
+CLUSTERS_PATH = os.path.join("data", "processed", "clusters.json")
+REPORT_PATH = os.path.join("data", "processed", "phash_outliers.json")
+# distances to the rest of a cluster are measured against at most this many members
+MAX_REFERENCE = 2000
+
+
+def load_hashes(images_dir):
+    """``(filepaths, dhash, phash)`` already computed for ``images_dir``."""
+    txt_path = os.path.join(images_dir, "hashes.txt")
+    if not os.path.exists(txt_path):
+        return [], np.zeros(0, np.uint64), np.zeros(0, np.uint64)
+    with open(txt_path, "r") as f:
+        filepaths = [line.rstrip("\n") for line in f]
+    dhash = np.load(os.path.join(images_dir, "dhash.npy"))
+    phash = np.load(os.path.join(images_dir, "phash.npy"))
+    if not len(filepaths) == len(dhash) == len(phash):
+        raise ValueError(f"{images_dir}: hashes.txt, dhash.npy and phash.npy disagree")
+    return filepaths, dhash, phash
+
+
+def save_hashes(images_dir, filepaths, dhash, phash):
+    """Rewrites the three files, each through a temporary file."""
+    for name, array in (("dhash", dhash), ("phash", phash)):
+        tmp_path = os.path.join(images_dir, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(images_dir, f"{name}.npy"))
+    tmp_path = os.path.join(images_dir, "hashes.txt.tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{filepath}\n" for filepath in filepaths)
+    os.replace(tmp_path, os.path.join(images_dir, "hashes.txt"))
+
+
+def hash_directory(images_dir, workers=None, chunk_size=CHUNK_SIZE):
+    """Hashes the new downloads of ``images_dir``; returns a throughput report."""
+    filepaths, dhash, phash = load_hashes(images_dir)
+    hashed = set(filepaths)
+    todo = [entry for filepath, entry in load_manifest(images_dir).items() if filepath not in hashed]
+    chunks = [todo[i : i + chunk_size] for i in range(0, len(todo), chunk_size)]
+
+    start = time.perf_counter()
+    new_filepaths, new_dhash, new_phash = [], [], []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        paths = ([os.path.join(images_dir, entry["file"]) for entry in chunk] for chunk in chunks)
+        for chunk, (d, p, ok) in zip(chunks, pool.map(hash_images, paths)):
+            new_filepaths.extend(entry["filepath"] for entry, good in zip(chunk, ok) if good)
+            new_dhash.append(d[ok])
+            new_phash.append(p[ok])
+            failed += int((~ok).sum())
+    elapsed = time.perf_counter() - start
+
+    if new_filepaths:
+        save_hashes(
+            images_dir,
+            filepaths + new_filepaths,
+            np.concatenate([dhash] + new_dhash),
+            np.concatenate([phash] + new_phash),
+        )
+    return {
+        "hashed": len(new_filepaths),
+        "skipped": len(hashed),
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(len(new_filepaths) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def cluster_outliers(clusters, filepaths, phash, threshold=16, radius=10, min_size=3):
+    """
+    Members of ``clusters`` ({id: [processed filepath, ...]}) whose median
+    pHash distance to the other hashed members exceeds ``threshold`` bits.
+    """
+    index = PerceptualIndex(index_arrays(filepaths, phash, phash))
+    cluster_of = {fp: cluster_id for cluster_id, fps in clusters.items() for fp in fps}
+
+    outliers = []
+    checked = images = 0
+    for cluster_id, members in clusters.items():
+        ids = [i for i in map(index.lookup, members) if i is not None]
+        if len(ids) < min_size:
+            continue
+        checked += 1
+        images += len(ids)
+        codes = np.asarray(index.codes[np.asarray(ids)])
+        reference = codes[:MAX_REFERENCE]
+        distances = hamming(codes[:, None], reference[None, :]).astype(np.float64)
+        # leave out each member's zero distance to itself
+        np.fill_diagonal(distances, np.nan)
+        median = np.nanmedian(distances, axis=1)
+        for i in np.flatnonzero(median > threshold).tolist():
+            filepath = index.paths[ids[i]]
+            match_ids, match_distances = index.search(codes[i], radius)
+            best = next(
+                (
+                    (index.paths[j], d)
+                    for j, d in zip(match_ids.tolist(), match_distances.tolist())
+                    if cluster_of.get(index.paths[j]) != cluster_id
+                ),
+                None,
+            )
+            outliers.append(
+                {
+                    "cluster": cluster_id,
+                    "image": filepath,
+                    "cluster_size": len(members),
+                    "median_distance": float(median[i]),
+                    "nearest_elsewhere": None if best is None else {
+                        "image": best[0],
+                        "cluster": cluster_of.get(best[0]),
+                        "distance": best[1],
+                    },
+                }
+            )
+    outliers.sort(key=lambda o: -o["median_distance"])
+    return {
+        "threshold": threshold,
+        "clusters_checked": checked,
+        "images_checked": images,
+        "outliers": outliers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    hash_parser = subparsers.add_parser("hash", help="hash new downloads in image directories")
+    hash_parser.add_argument("images_dirs", nargs="+")
+    hash_parser.add_argument("--workers", type=int, default=None)
+    hash_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    hash_parser.set_defaults(command="hash")
+
+    outliers_parser = subparsers.add_parser("outliers", help="report images unlike the rest of their cluster")
+    outliers_parser.add_argument("images_dirs", nargs="+")
+    outliers_parser.add_argument("--clusters", default=CLUSTERS_PATH, help="processed clusters.json")
+    outliers_parser.add_argument("--threshold", type=int, default=16)
+    outliers_parser.add_argument("--radius", type=int, default=10)
+    outliers_parser.add_argument("--output", default=REPORT_PATH)
+    outliers_parser.set_defaults(command="outliers")
+    args = parser.parse_args()
+
+    if args.command == "hash":
+        for images_dir in args.images_dirs:
+            report = hash_directory(images_dir, args.workers, args.chunk_size)
+            print(
+                f"{images_dir}: hashed {report['hashed']} images "
+                f"({report['images_per_second']} img/s), skipped {report['skipped']}, "
+                f"failed {report['failed']}"
+            )
+        return
+
+    filepaths, phash = [], []
+    for images_dir in args.images_dirs:
+        dir_filepaths, _, dir_phash = load_hashes(images_dir)
+        filepaths.extend(dir_filepaths)
+        phash.append(dir_phash)
+    with open(args.clusters, "r") as f:
+        clusters = json.load(f)
+    start = time.perf_counter()
+    report = cluster_outliers(clusters, filepaths, np.concatenate(phash), args.threshold, args.radius)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(
+        f"{len(report['outliers'])} outliers in {report['clusters_checked']} clusters "
+        f"({report['images_checked']} hashed images) in {time.perf_counter() - start:.1f}s -> {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
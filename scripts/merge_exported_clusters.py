@@ -1,20 +1,145 @@
+import argparse
+import heapq
 import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 
-def merge_cluster_files():
+CHUNK_SIZE = 1 << 16
+# Regex to find the year in the filename, e.g., all_1910_...
+YEAR_REGEX = re.compile(r"_(\d{4})_")
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_object(f, chunk_size=CHUNK_SIZE):
+    """
+    Yields the (key, value) pairs of the top-level JSON object in the file
+    ``f`` without loading the whole file.
+
+    The buffer only ever holds the member being decoded (plus at most as much
+    again), so memory is bounded by the largest single cluster rather than
+    the file. While a value doesn't fit, each read doubles in size, so a
+    large value is re-parsed O(log size) times rather than once per chunk.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill(size=chunk_size):
+        nonlocal buffer, pos, eof
+        chunk = f.read(size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal pos
+        size = chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+                # a value that ends exactly at the buffer edge may be a
+                # truncated number; only trust it once more input is seen
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill(size)
+            size *= 2
+
+    def expect(chars):
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", buffer, pos)
+        pos += 1
+        return buffer[pos - 1]
+
+    expect("{")
+    skip_whitespace()
+    if pos < len(buffer) and buffer[pos] == "}":
+        return
+    while True:
+        skip_whitespace()
+        key = decode()
+        expect(":")
+        skip_whitespace()
+        yield key, decode()
+        if expect(",}") == "}":
+            return
+
+
+def first_clusters(filepath, top_n):
+    """
+    Returns the ``top_n`` clusters with the smallest integer keys of one
+    export file as ``[(key, filepaths), ...]``, sorted by key.
+    """
+    heap = []
+    with open(filepath, "r") as f:
+        for key, value in iter_json_object(f):
+            # keep the top_n smallest keys in a bounded max-heap
+            item = (-int(key), key, value)
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return [(key, value) for _, key, value in sorted(heap, reverse=True)]
+
+
+def _process_file(args):
+    filename, filepath, top_n = args
+    try:
+        return filename, first_clusters(filepath, top_n), None
+    except (json.JSONDecodeError, ValueError, KeyError) as e:
+        return filename, None, f"Error processing file {filename}: {e}"
+    except Exception as e:
+        return filename, None, f"An unexpected error occurred with file {filename}: {e}"
+
+
+def read_cluster(merged_filepath, key, offsets=None):
+    """
+    Reads a single cluster from a merged file using its sidecar offsets index
+    (``<merged>.offsets.json``), without parsing the rest of the file.
     """
-    Merges the first 100 clusters from each JSON file in the data/exports
-    directory into a single file.
+    if offsets is None:
+        with open(f"{os.path.splitext(merged_filepath)[0]}.offsets.json", "r") as f:
+            offsets = json.load(f)
+    offset, length = offsets[key]
+    with open(merged_filepath, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+def merge_cluster_files(top_n=100, workers=None):
+    """
+    Merges the first ``top_n`` clusters from each JSON file in the
+    data/exports directory into a single file.
 
     The cluster keys are renamed to include the year from the source filename,
     e.g., a cluster "0" from "all_1910_epsilon_2_4.json" becomes "1910_0".
 
-    The merged data is saved to data/processed/merged_clusters.json.
+    Export files are parsed incrementally in parallel worker processes, and
+    the merged data is written compactly, cluster by cluster, to
+    data/processed/merged_clusters.json. A sidecar
+    merged_clusters.offsets.json maps each key to the byte offset and length
+    of its filepath list, so one cluster can be read with ``read_cluster``.
     """
     exports_dir = os.path.join("data", "exports")
     processed_dir = os.path.join("data", "processed")
     output_filepath = os.path.join(processed_dir, "merged_clusters.json")
+    offsets_filepath = os.path.join(processed_dir, "merged_clusters.offsets.json")
 
     if not os.path.exists(exports_dir):
         print(f"Error: Directory not found at '{exports_dir}'")
@@ -23,52 +148,53 @@ def merge_cluster_files():
     if not os.path.exists(processed_dir):
         os.makedirs(processed_dir)
 
-    merged_clusters = {}
-    
-    # Regex to find the year in the filename, e.g., all_1910_...
-    year_regex = re.compile(r"_(\d{4})_")
-
-    # Get all json files in the directory
-    json_files = [f for f in os.listdir(exports_dir) if f.endswith('.json')]
-
-    for filename in json_files:
-        match = year_regex.search(filename)
+    # Get all json files in the directory, in year order
+    tasks = []
+    for filename in sorted(os.listdir(exports_dir)):
+        if not filename.endswith(".json"):
+            continue
+        match = YEAR_REGEX.search(filename)
         if not match:
             print(f"Skipping file (could not find year): {filename}")
             continue
-        
-        year = match.group(1)
-        filepath = os.path.join(exports_dir, filename)
-
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
-
-            # Get the first 100 cluster keys, assuming they are strings of ints
-            # Sort numerically to ensure we get the first 100 clusters correctly
-            cluster_keys = sorted(data.keys(), key=int)[:100]
-
-            for key in cluster_keys:
-                new_key = f"{year}_{key}"
-                merged_clusters[new_key] = data[key]
-            
-            print(f"Processed {len(cluster_keys)} clusters from {filename}")
-
-        except (json.JSONDecodeError, ValueError, KeyError) as e:
-            print(f"Error processing file {filename}: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred with file {filename}: {e}")
-
+        tasks.append((match.group(1), filename))
+    tasks.sort()
 
-    # Save the merged data to the output file
+    offsets = {}
     try:
-        with open(output_filepath, 'w') as f:
-            json.dump(merged_clusters, f, indent=4)
+        with open(output_filepath, "wb") as out, ProcessPoolExecutor(workers) as pool:
+            out.write(b"{")
+            results = pool.map(
+                _process_file,
+                [(filename, os.path.join(exports_dir, filename), top_n) for _, filename in tasks],
+            )
+            for (year, _), (filename, clusters, error) in zip(tasks, results):
+                if error:
+                    print(error)
+                    continue
+                for key, filepaths in clusters:
+                    new_key = f"{year}_{key}"
+                    out.write(b"," if offsets else b"")
+                    out.write(json.dumps(new_key).encode("utf-8") + b":")
+                    value = json.dumps(filepaths, separators=(",", ":")).encode("utf-8")
+                    offsets[new_key] = [out.tell(), len(value)]
+                    out.write(value)
+                print(f"Processed {len(clusters)} clusters from {filename}")
+            out.write(b"}")
+
+        with open(offsets_filepath, "w") as f:
+            json.dump(offsets, f, separators=(",", ":"))
         print(f"\nSuccessfully merged data to {output_filepath}")
-        print(f"Total clusters merged: {len(merged_clusters)}")
+        print(f"Total clusters merged: {len(offsets)}")
     except IOError as e:
         print(f"Error writing to output file {output_filepath}: {e}")
 
 
 if __name__ == "__main__":
-    merge_cluster_files()
+    parser = argparse.ArgumentParser(description="Merge exported cluster files.")
+    parser.add_argument(
+        "--top-n", type=int, default=100, help="clusters to keep per export file"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    merge_cluster_files(top_n=args.top_n, workers=args.workers)
@@ -0,0 +1,161 @@
+"""
+Tests of downloader.py against a local stub HTTP server.
+
+Run from the repository root with ``python -m pytest scripts``.
+"""
+import json
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import MANIFEST_NAME, TokenBucket, download_images, retry_delay
+
+BODY = b"\xff\xd8 not really a jpeg \xff\xd9" * 100
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.times.append(time.monotonic())
+            script = server.scripts.get(self.path, [])
+            step = script.pop(0) if script else "ok"
+        if step == "truncate":
+            # a chunked body that stops half way
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            half = BODY[: len(BODY) // 2]
+            self.wfile.write(f"{len(half):x}\r\n".encode() + half + b"\r\n")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        if step == "ok":
+            status, headers = 200, {}
+        else:
+            status, headers = step
+        body = BODY if status == 200 else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.times = []
+    server.scripts = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def items_for(server, names):
+    return [(f"batch/data/{name}.jpg", f"{server.url}/{name}") for name in names]
+
+
+def download(items, output_dir, **options):
+    options = {"requests_per_minute": 60_000, "burst": 10, "workers": 4, "backoff": 0.01, **options}
+    return download_images(items, output_dir, **options)
+
+
+def test_retry_after_seconds_and_http_date(server, tmp_path):
+    server.scripts["/a"] = [(429, {"Retry-After": "1"})]
+    server.scripts["/b"] = [(503, {"Retry-After": formatdate(time.time() + 1, usegmt=True)})]
+    start = time.monotonic()
+    report = download(items_for(server, ["a", "b"]), str(tmp_path))
+    assert report["downloaded"] == 2 and report["failed"] == 0
+    assert server.requests.count("/a") == 2 and server.requests.count("/b") == 2
+    assert time.monotonic() - start >= 0.9
+    with open(tmp_path / "batch_data_a.jpg", "rb") as f:
+        assert f.read() == BODY
+
+
+def test_retry_after_pauses_every_thread(server, tmp_path):
+    server.scripts["/a"] = [(429, {"Retry-After": "1"})]
+    items = items_for(server, ["a"] + [f"n{i}" for i in range(8)])
+    report = download(items, str(tmp_path), workers=2, burst=1)
+    assert report["downloaded"] == 9
+    # once /a was told to wait, the other thread waited too: apart from a
+    # request already in flight, nothing reached the server for a second
+    told = server.times[server.requests.index("/a")]
+    during = [t for t in server.times if told + 0.1 < t < told + 0.9]
+    assert len(during) <= 1
+
+
+def test_truncated_body_is_retried_without_leftovers(server, tmp_path):
+    server.scripts["/a"] = ["truncate"]
+    report = download(items_for(server, ["a"]), str(tmp_path))
+    assert report["downloaded"] == 1
+    assert server.requests.count("/a") == 2
+    assert sorted(os.listdir(tmp_path)) == ["batch_data_a.jpg", MANIFEST_NAME]
+
+
+def test_failed_body_leaves_no_partial_file(server, tmp_path):
+    server.scripts["/a"] = ["truncate"] * 4
+    report = download(items_for(server, ["a"]), str(tmp_path), retries=3)
+    assert report["failed"] == 1
+    assert not any(name.endswith(".part") for name in os.listdir(tmp_path))
+
+
+def test_resume_skips_finished_and_duplicate_downloads(server, tmp_path):
+    items = items_for(server, ["a", "b", "c"])
+    report = download(items + items[:1], str(tmp_path))
+    assert report["downloaded"] == 3
+    assert server.requests.count("/a") == 1
+
+    # a torn manifest line from a crash and a missing file are both redone
+    os.remove(tmp_path / "batch_data_b.jpg")
+    with open(tmp_path / MANIFEST_NAME, "a") as f:
+        f.write('{"filepath": "batch/data/d.jp')
+    report = download(items + items_for(server, ["d"]), str(tmp_path))
+    assert report["skipped"] == 2 and report["downloaded"] == 2
+    assert server.requests.count("/a") == 1 and server.requests.count("/b") == 2
+
+    with open(tmp_path / MANIFEST_NAME) as f:
+        entries = []
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    assert {entry["filepath"] for entry in entries} == {fp for fp, _ in items_for(server, "abcd")}
+
+
+def test_retry_delay():
+    assert retry_delay("3", 9) == 3.0
+    assert retry_delay(None, 9) == 9
+    assert retry_delay("soon", 9) == 9
+    assert 25 <= retry_delay(formatdate(time.time() + 30, usegmt=True), 9) <= 30
+    assert retry_delay("Wed, 21 Oct 2015 07:28:00 GMT", 9) == 0.0
+
+
+def test_token_bucket_pause():
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    bucket = TokenBucket(10, capacity=1, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire()
+    bucket.pause(2)
+    bucket.acquire()
+    assert now[0] >= 2
@@ -0,0 +1,185 @@
+"""
+IVF-PQ approximate nearest-neighbour index over the CLIP embeddings.
+
+Vectors are L2-normalised, so ranking by Euclidean distance is ranking by
+cosine similarity. A coarse k-means quantizer splits the collection into
+``nlist`` inverted lists. Each vector's residual to its list centroid is
+product-quantised into ``m`` one-byte codes. A query visits the ``nprobe``
+closest lists and scores their codes with per-list lookup tables
+(asymmetric distance). The best candidates can optionally be re-ranked
+exactly against the memory-mapped embeddings.
+"""
+import os
+import time
+import numpy as np
+
+ARRAYS = ("coarse", "codebooks", "list_offsets", "ids", "codes")
+CHUNK_SIZE = 65_536
+
+
+def normalize(X):
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=-1, keepdims=True)
+    return X / np.maximum(norms, 1e-12)
+
+
+def _sq_distances(X, C):
+    """Squared L2 distances between the rows of ``X`` and ``C``."""
+    return (
+        (X * X).sum(1)[:, None] - 2 * X @ C.T + (C * C).sum(1)[None, :]
+    )
+
+
+def kmeans(X, k, n_iter=20, seed=0):
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    C = X[rng.choice(len(X), k, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _sq_distances(X, C).argmin(1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(C)
+        np.add.at(sums, labels, X)
+        empty = counts == 0
+        C[~empty] = sums[~empty] / counts[~empty, None]
+        C[empty] = X[rng.choice(len(X), int(empty.sum()), replace=False)]
+    return C
+
+
+def build_ann_index(embeddings, output_dir, nlist=1024, m=16, train_size=200_000, seed=0):
+    """
+    Trains and writes an IVF-PQ index for ``embeddings`` (an (N, d) array,
+    typically memory-mapped). ``d`` must be divisible by ``m``.
+    """
+    n, d = embeddings.shape
+    if d % m:
+        raise ValueError(f"Dimension {d} is not divisible by m={m}")
+    rng = np.random.default_rng(seed)
+    sample = normalize(embeddings[np.sort(rng.choice(n, min(n, train_size), replace=False))])
+
+    coarse = kmeans(sample, min(nlist, len(sample)), seed=seed)
+    residuals = (sample - coarse[_sq_distances(sample, coarse).argmin(1)]).reshape(len(sample), m, d // m)
+    codebooks = np.stack(
+        [kmeans(residuals[:, j], min(256, len(sample)), seed=seed + j) for j in range(m)]
+    )
+
+    labels = np.empty(n, dtype=np.int32)
+    codes = np.empty((n, m), dtype=np.uint8)
+    for start in range(0, n, CHUNK_SIZE):
+        chunk = normalize(embeddings[start : start + CHUNK_SIZE])
+        chunk_labels = _sq_distances(chunk, coarse).argmin(1)
+        chunk_residuals = (chunk - coarse[chunk_labels]).reshape(len(chunk), m, d // m)
+        labels[start : start + len(chunk)] = chunk_labels
+        for j in range(m):
+            codes[start : start + len(chunk), j] = _sq_distances(
+                chunk_residuals[:, j], codebooks[j]
+            ).argmin(1)
+
+    order = np.argsort(labels, kind="stable")
+    list_offsets = np.zeros(len(coarse) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=len(coarse)), out=list_offsets[1:])
+    arrays = {
+        "coarse": coarse,
+        "codebooks": codebooks,
+        "list_offsets": list_offsets,
+        "ids": order.astype(np.int32),
+        "codes": codes[order],
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_dir, f"ann_index.{name}.npy"), arrays[name])
+
+
+def exact_search(embeddings, query, k, chunk_size=CHUNK_SIZE):
+    """Brute-force cosine top-k, streamed over ``embeddings`` in chunks."""
+    query = normalize(query)
+    best_ids = np.zeros(0, dtype=np.int64)
+    best_scores = np.zeros(0, dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        scores = normalize(embeddings[start : start + chunk_size]) @ query
+        ids = np.arange(start, start + len(scores))
+        best_ids = np.concatenate((best_ids, ids))
+        best_scores = np.concatenate((best_scores, scores))
+        if len(best_scores) > k:
+            keep = np.argpartition(-best_scores, k - 1)[:k]
+            best_ids, best_scores = best_ids[keep], best_scores[keep]
+    order = np.argsort(-best_scores, kind="stable")
+    return best_ids[order], best_scores[order]
+
+
+class ANNIndex:
+    def __init__(self, arrays, embeddings=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.embeddings = embeddings
+        self.m, self.ksub, self.dsub = self.codebooks.shape
+
+    @classmethod
+    def load(cls, index_dir, embeddings=None):
+        return cls(
+            {
+                name: np.load(os.path.join(index_dir, f"ann_index.{name}.npy"), mmap_mode="r")
+                for name in ARRAYS
+            },
+            embeddings,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=10, nprobe=16, rerank=4):
+        """
+        Approximate cosine top-k for one query vector. Returns ``(ids,
+        scores)``; when embeddings are attached, the best ``k * rerank``
+        candidates are re-scored exactly.
+        """
+        query = normalize(query)
+        coarse_distances = _sq_distances(query[None, :], self.coarse)[0]
+        nprobe = min(nprobe, len(self.coarse))
+        probes = np.argpartition(coarse_distances, nprobe - 1)[:nprobe]
+
+        # one (m, ksub) distance table per probed list, from the query residual
+        residuals = (query[None, :] - self.coarse[probes]).reshape(nprobe, self.m, 1, self.dsub)
+        tables = ((residuals - self.codebooks[None]) ** 2).sum(-1)
+
+        starts, stops = self.list_offsets[probes], self.list_offsets[probes + 1]
+        sizes = stops - starts
+        if not sizes.sum():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        positions = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+        probe_of = np.repeat(np.arange(nprobe), sizes)
+        codes = self.codes[positions]
+        distances = tables[probe_of[:, None], np.arange(self.m)[None, :], codes].sum(1)
+
+        n_candidates = min(len(distances), k * rerank if self.embeddings is not None else k)
+        best = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+        ids = self.ids[positions[best]].astype(np.int64)
+        if self.embeddings is not None:
+            order = np.argsort(ids)
+            ids = ids[order]
+            scores = normalize(self.embeddings[ids]) @ query
+        else:
+            # |q - x|^2 = 2 - 2 cos(q, x) for unit vectors
+            scores = 1 - distances[best] / 2
+        top = np.argsort(-scores, kind="stable")[:k]
+        return ids[top], scores[top].astype(np.float32)
+
+    def evaluate(self, embeddings, n_queries=100, k=10, nprobe=16, seed=0):
+        """Recall@k against exact search and latency percentiles (ms)."""
+        rng = np.random.default_rng(seed)
+        recalls, latencies = [], []
+        for row in rng.choice(len(embeddings), n_queries, replace=False):
+            query = np.asarray(embeddings[row], dtype=np.float32)
+            start = time.perf_counter()
+            ids, _ = self.search(query, k=k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - start) * 1000)
+            exact_ids, _ = exact_search(embeddings, query, k)
+            recalls.append(len(np.intersect1d(ids, exact_ids)) / k)
+        return {
+            "k": k,
+            "nprobe": nprobe,
+            "queries": n_queries,
+            "recall": float(np.mean(recalls)),
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p95": float(np.percentile(latencies, 95)),
+            "latency_ms_p99": float(np.percentile(latencies, 99)),
+        }
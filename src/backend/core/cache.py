@@ -0,0 +1,201 @@
+"""
+Response caching for endpoints whose output only changes when the served
+artifacts are rebuilt.
+
+Responses are keyed by their full URL (scheme, host, path and query string),
+since bodies embed the request's base URL. They are stored in a
+per-process LRU bounded by total body bytes and optionally in a shared backend
+that all workers see (Redis, or an in-memory stand-in for local use). ETags
+are derived from the data snapshot version and the request key, so
+``If-None-Match`` can be answered with a 304 without touching any data.
+Endpoints whose response also depends on something fetched at request time
+mark it ``Cache-Control: no-store`` and it is passed through uncached.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+
+def snapshot_version(paths):
+    """Short hash of the size and mtime of every file under ``paths``."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            )
+        for filepath in files:
+            if os.path.exists(filepath):
+                stat = os.stat(filepath)
+                digest.update(f"{filepath}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU of byte strings, evicting by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.items),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryBackend:
+    """In-process stand-in for Redis with the same get/set subset."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.data[key] = value
+
+
+def make_backend(url):
+    """'' -> no shared cache, 'memory://' -> stand-in, 'redis://...' -> Redis."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class ResponseCache:
+    def __init__(self, version, max_bytes, backend=None, ttl=None):
+        self.version = version
+        self.local = LRUCache(max_bytes)
+        self.backend = backend
+        self.ttl = ttl
+        self.shared_hits = self.shared_misses = self.not_modified = 0
+
+    def etag(self, key):
+        digest = hashlib.blake2b(f"{self.version}:{key}".encode(), digest_size=12)
+        return f'"{digest.hexdigest()}"'
+
+    def get(self, key):
+        body = self.local.get(key)
+        if body is None and self.backend is not None:
+            body = self.backend.get(f"viral-images:{self.version}:{key}")
+            if body is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                self.local.set(key, body)
+        return body
+
+    def set(self, key, body):
+        self.local.set(key, body)
+        if self.backend is not None:
+            self.backend.set(f"viral-images:{self.version}:{key}", body, ex=self.ttl)
+
+    def stats(self):
+        shared = self.shared_hits + self.shared_misses
+        return {
+            "version": self.version,
+            "local": self.local.stats(),
+            "shared": {
+                "enabled": self.backend is not None,
+                "hits": self.shared_hits,
+                "misses": self.shared_misses,
+                "hit_rate": self.shared_hits / shared if shared else 0.0,
+            },
+            "not_modified": self.not_modified,
+        }
+
+
+class CacheMiddleware(BaseHTTPMiddleware):
+    """
+    Serves cached JSON for GET requests whose path is ``/`` or starts with
+    one of ``prefixes``, and answers matching ``If-None-Match`` with 304.
+    The cache itself lives on ``app.state.response_cache`` (set at startup).
+    """
+
+    def __init__(self, app, prefixes, cache_control="public, max-age=0, must-revalidate"):
+        super().__init__(app)
+        self.prefixes = tuple(prefixes)
+        self.cache_control = cache_control
+
+    def cacheable(self, request):
+        path = request.url.path
+        return request.method == "GET" and (path == "/" or path.startswith(self.prefixes))
+
+    async def dispatch(self, request, call_next):
+        cache = getattr(request.app.state, "response_cache", None)
+        if cache is None or not self.cacheable(request):
+            return await call_next(request)
+
+        key = str(request.url)
+        etag = cache.etag(key)
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if etag in request.headers.get("if-none-match", ""):
+            cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        body = cache.get(key)
+        if body is None:
+            response = await call_next(request)
+            content_type = response.headers.get("content-type", "")
+            # encoded bodies depend on Accept-Encoding, so they are not shared
+            if (
+                response.status_code != 200
+                or "json" not in content_type
+                or "content-encoding" in response.headers
+                or "no-store" in response.headers.get("cache-control", "")
+            ):
+                return response
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            cache.set(key, body)
+        return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,198 @@
+import json
+import os
+import numpy as np
+
+ARRAYS = (
+    "cluster_ids_blob",
+    "cluster_ids_offsets",
+    "offsets",
+    "members",
+    "path_cluster",
+    "paths_blob",
+    "paths_offsets",
+)
+
+
+class StringTable:
+    """
+    Immutable table of strings packed into a single UTF-8 buffer.
+
+    String ``i`` is ``blob[offsets[i]:offsets[i + 1]]``, so a million short
+    filepaths cost one byte per character plus eight bytes of offset instead
+    of a full Python ``str`` object each.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self._view = memoryview(blob)
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self._view[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+    def take(self, ids):
+        """Decode many strings at once; ``ids`` is any integer array-like."""
+        ids = np.asarray(ids, dtype=np.int64)
+        starts = self.offsets[ids].tolist()
+        ends = self.offsets[ids + 1].tolist()
+        view = self._view
+        return [str(view[s:e], "utf-8") for s, e in zip(starts, ends)]
+
+    def find(self, s):
+        """Binary search for ``s`` in a sorted table; returns its id or -1."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < s:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self[lo] == s else -1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return self.blob.nbytes + self.offsets.nbytes
+
+
+class ClusterStore:
+    """
+    Read-only cluster membership in CSR form.
+
+    Every distinct filepath is interned once in ``paths`` (sorted, so ids are
+    stable for a given input). Cluster ``c`` owns the path ids
+    ``members[offsets[c]:offsets[c + 1]]``.
+
+    ``save`` writes the arrays as a binary snapshot that ``load`` memory-maps,
+    so workers start without parsing clusters.json.
+    """
+
+    def __init__(self, cluster_ids, offsets, members, paths, path_cluster=None):
+        self.cluster_ids = cluster_ids
+        self.offsets = offsets
+        self.members = members
+        self.paths = paths
+        self._index = {cluster_id: i for i, cluster_id in enumerate(cluster_ids)}
+        if path_cluster is None:
+            # Inverse of the CSR arrays: the (last) cluster ordinal of each path id
+            path_cluster = np.full(len(paths), -1, dtype=np.int32)
+            path_cluster[members] = np.repeat(
+                np.arange(len(cluster_ids), dtype=np.int32), np.diff(offsets)
+            )
+        self.path_cluster = path_cluster
+
+    @classmethod
+    def from_dict(cls, clusters):
+        unique_paths = sorted({fp for fps in clusters.values() for fp in fps})
+        path_ids = {fp: i for i, fp in enumerate(unique_paths)}
+
+        cluster_ids = list(clusters.keys())
+        offsets = np.zeros(len(cluster_ids) + 1, dtype=np.int64)
+        np.cumsum([len(clusters[c]) for c in cluster_ids], out=offsets[1:])
+        members = np.fromiter(
+            (path_ids[fp] for c in cluster_ids for fp in clusters[c]),
+            dtype=np.int32,
+            count=int(offsets[-1]),
+        )
+        return cls(cluster_ids, offsets, members, StringTable.from_strings(unique_paths))
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, output_dir):
+        """Writes the store as ``cluster_store.*.npy`` files in ``output_dir``."""
+        os.makedirs(output_dir, exist_ok=True)
+        cluster_ids = StringTable.from_strings(self.cluster_ids)
+        arrays = {
+            "cluster_ids_blob": cluster_ids.blob,
+            "cluster_ids_offsets": cluster_ids.offsets,
+            "offsets": self.offsets,
+            "members": self.members,
+            "path_cluster": self.path_cluster,
+            "paths_blob": self.paths.blob,
+            "paths_offsets": self.paths.offsets,
+        }
+        for name in ARRAYS:
+            np.save(os.path.join(output_dir, f"cluster_store.{name}.npy"), arrays[name])
+
+    @classmethod
+    def load(cls, index_dir):
+        """Memory-maps a snapshot written by ``save``."""
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"cluster_store.{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        cluster_ids = list(StringTable(arrays["cluster_ids_blob"], arrays["cluster_ids_offsets"]))
+        return cls(
+            cluster_ids,
+            arrays["offsets"],
+            arrays["members"],
+            StringTable(arrays["paths_blob"], arrays["paths_offsets"]),
+            arrays["path_cluster"],
+        )
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def __contains__(self, cluster_id):
+        return cluster_id in self._index
+
+    def index_of(self, cluster_id):
+        """Return the ordinal of ``cluster_id``, or ``None`` if unknown."""
+        return self._index.get(cluster_id)
+
+    def member_ids(self, cluster_id):
+        """Return the interned path ids of a cluster as an int32 array view."""
+        c = self._index[cluster_id]
+        return self.members[self.offsets[c] : self.offsets[c + 1]]
+
+    def filepaths(self, cluster_id):
+        return self.paths.take(self.member_ids(cluster_id))
+
+    def cluster_of(self, filepath):
+        """Return the id of the cluster containing ``filepath``, or ``None``."""
+        path_id = self.paths.find(filepath)
+        if path_id < 0 or self.path_cluster[path_id] < 0:
+            return None
+        return self.cluster_ids[self.path_cluster[path_id]]
+
+    @property
+    def n_images(self):
+        return len(self.paths)
+
+    @property
+    def nbytes(self):
+        return (
+            self.offsets.nbytes
+            + self.members.nbytes
+            + self.path_cluster.nbytes
+            + self.paths.nbytes
+        )
+
+    def memory_report(self):
+        return {
+            "clusters": len(self),
+            "memberships": int(self.offsets[-1]),
+            "unique_images": self.n_images,
+            "offsets_bytes": self.offsets.nbytes,
+            "members_bytes": self.members.nbytes,
+            "path_cluster_bytes": self.path_cluster.nbytes,
+            "paths_bytes": self.paths.nbytes,
+            "total_bytes": self.nbytes,
+        }
@@ -9,5 +9,60 @@ class Settings(BaseSettings):
     )
     api_version: str = "0.1.0"
 
+    # Data settings (relative to src/backend, override with env vars)
+    data_dir: str = "../../data"
+    clusters_path: str = "../../data/processed/clusters.json"
+    artifacts_dir: str = "../../data/artifacts"
+    dataset_name: str = "biglam/newspaper-navigator"
+    dataset_config: str = "photos"
+    embeddings_path: str = "../../data/artifacts/global_embeddings_light.npy"
+
+    # Facet learner settings (0 scores in the request thread); trained
+    # facets are persisted under facet_cache_dir and the most recent
+    # facet_cache_entries are also kept in memory
+    facet_processes: int = 0
+    facet_cache_dir: str = "../../data/facets"
+    facet_cache_entries: int = 64
+
+    # Response cache settings ('' disables the shared backend, 'memory://'
+    # uses an in-process stand-in, otherwise a redis:// URL, which needs the
+    # optional redis package)
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_backend_url: str = ""
+    cache_ttl_seconds: int = 24 * 60 * 60
+
+    # Thumbnail proxy settings
+    thumbnail_cache_dir: str = "../../data/thumbnails"
+    thumbnail_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    thumbnail_upstream_concurrency: int = 4
+
+    # Maximum number of ids per batch lookup
+    batch_max_ids: int = 5000
+
+    # IIIF settings (page sizes missing from the precomputed table are
+    # fetched from LoC info.json and kept in an LRU; fetches over the rate
+    # are skipped, and failed pages are retried after a while)
+    iiif_fetch_page_dimensions: bool = True
+    page_dimensions_cache_size: int = 4096
+    page_dimensions_requests_per_second: float = 5.0
+    page_dimensions_retry_seconds: float = 300.0
+    page_dimensions_fetch_concurrency: int = 8
+
+    # Decompressed OCR blocks kept in memory (per worker)
+    ocr_block_cache_bytes: int = 16 * 1024 * 1024
+
+    # Nearest-neighbour settings (lists probed per query)
+    ann_nprobe: int = 16
+
+    # Upload matching against the perceptual hash index (default pHash
+    # distance in bits, and the largest accepted upload)
+    match_radius: int = 10
+    match_max_bytes: int = 10 * 1024 * 1024
+
+    # Admin endpoints (the sampling profiler) are disabled unless a token is
+    # set; requests must send it in the X-Admin-Token header
+    admin_token: str = ""
+    profile_max_seconds: int = 60
+
 
 settings = Settings()
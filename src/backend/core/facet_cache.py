@@ -0,0 +1,135 @@
+"""
+Persistent cache of trained facets.
+
+A facet is keyed by its query and its exact label set (``facet_key``), so
+asking for the same query again, or replaying the same labels, skips
+training and scoring altogether. Each facet is one ``{key}.npz`` under a
+directory named after the embeddings snapshot, so rebuilt embeddings never
+serve stale rows. Facets are written through a temporary file and the most
+recent ones are also kept in memory. The largest row norm of every
+embeddings block (needed by ``FacetLearner.refine``) is kept next to them,
+so a restarted server can refine without a full pass first.
+
+Latencies of hits, full learns and refinements are recorded for
+``/cache/stats``.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+import numpy as np
+
+from core.facet_learner import Facet
+
+LATENCY_WINDOW = 1000
+HEX_DIGITS = "0123456789abcdef"
+
+
+class FacetCache:
+    def __init__(self, cache_dir, version, max_entries=64):
+        self.directory = os.path.join(cache_dir, version)
+        self.version = version
+        self.max_entries = max_entries
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __len__(self):
+        return sum(name.endswith(".npz") for name in os.listdir(self.directory))
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _remember(self, facet):
+        with self.lock:
+            self.items[facet.key] = facet
+            self.items.move_to_end(facet.key)
+            while len(self.items) > self.max_entries:
+                self.items.popitem(last=False)
+
+    def get(self, key):
+        """The cached facet ``key`` from memory or disk, or ``None``."""
+        if not key or key.strip(HEX_DIGITS):
+            return None
+        with self.lock:
+            facet = self.items.get(key)
+            if facet is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return facet
+        try:
+            with np.load(self.path_for(key)) as data:
+                meta = json.loads(bytes(data["meta"]).decode("utf-8"))
+                arrays = {name: data[name] for name in Facet.ARRAYS}
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        facet = Facet(
+            meta["query"], bias=meta["bias"], parent=meta["parent"], rescored=meta["rescored"], **arrays
+        )
+        self._remember(facet)
+        with self.lock:
+            self.hits += 1
+        return facet
+
+    def put(self, facet):
+        meta = {
+            "query": facet.query,
+            "bias": facet.bias,
+            "parent": facet.parent,
+            "rescored": facet.rescored,
+        }
+        arrays = {name: getattr(facet, name) for name in Facet.ARRAYS}
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+        path = self.path_for(facet.key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self._remember(facet)
+
+    def block_norms(self):
+        """Block norms saved for this embeddings snapshot, or ``None``."""
+        try:
+            return np.load(os.path.join(self.directory, "block_norms.npy"))
+        except FileNotFoundError:
+            return None
+
+    def save_block_norms(self, norms):
+        path = os.path.join(self.directory, "block_norms.npy")
+        if norms is None or os.path.exists(path):
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp_path, norms)
+        os.replace(tmp_path, path)
+
+    def record(self, kind, seconds):
+        """Adds one latency sample for ``kind`` ('hit', 'learn' or 'refine')."""
+        with self.lock:
+            self.latencies[kind].append(seconds)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            latencies = {
+                kind: {
+                    "count": len(samples),
+                    "p50_ms": float(np.percentile(samples, 50) * 1000),
+                    "p95_ms": float(np.percentile(samples, 95) * 1000),
+                }
+                for kind, samples in self.latencies.items()
+                if samples
+            }
+            return {
+                "version": self.version,
+                "entries": len(self.items),
+                "stored": len(self),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency": latencies,
+            }
@@ -0,0 +1,394 @@
+"""
+Facet learning: train a linear classifier on keyword-matched positives and
+random negatives, then score every embedding and keep the top K.
+
+Scoring streams over a memory-mapped embedding matrix in fixed-size chunks,
+optionally spread over a process pool. Each worker maps the same ``.npy``
+file, so only the chunk being scored is resident at any time.
+
+A trained ``Facet`` keeps the exact logits of its best unlabeled rows (the
+candidates) and, for every block of ``BLOCK_SIZE`` rows, an upper bound on
+the logit of any other unlabeled row. Refining a facet with a few more
+labels warm-starts the classifier from the old weights. The bounds then grow
+by at most ``|x| * |dw| + |db|`` (Cauchy-Schwarz, with the largest row norm
+of the block), so only the candidates and the blocks whose bound can still
+reach the top K are rescored.
+"""
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+N_PREDICTIONS = 1000
+N_CANDIDATES = 4 * N_PREDICTIONS
+CHUNK_SIZE = 65_536
+BLOCK_SIZE = 4096
+# slack for float32 rounding when comparing rescored logits with bounds
+BOUND_SLACK = 1e-3
+
+_worker_embeddings = None
+
+
+def load_embeddings(path):
+    return np.load(path, mmap_mode="r")
+
+
+def _init_worker(path):
+    global _worker_embeddings
+    _worker_embeddings = load_embeddings(path)
+
+
+def _score_chunk(args):
+    start, stop, weights, bias, with_norms = args
+    return (start, *_chunk_logits(_worker_embeddings[start:stop], weights, bias, with_norms))
+
+
+def _chunk_logits(X, weights, bias, with_norms):
+    """Logits of a chunk, plus the largest row norm of each block when asked."""
+    X = np.asarray(X, dtype=np.float32)
+    logits = X @ np.asarray(weights, dtype=np.float32) + np.float32(bias)
+    if not with_norms:
+        return logits, None
+    return logits, block_max(np.sqrt(np.einsum("ij,ij->i", X, X)))
+
+
+def block_max(values, block_size=BLOCK_SIZE):
+    """Maximum of every ``block_size`` consecutive values (the last block may be short)."""
+    n_blocks = -(-len(values) // block_size)
+    padded = np.full(n_blocks * block_size, -np.inf, dtype=np.float32)
+    padded[: len(values)] = values
+    return padded.reshape(n_blocks, block_size).max(1)
+
+
+def sigmoid(logits):
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def linear_scores(X, weights, bias):
+    """P(positive) of a logistic regression, computed in float32."""
+    return sigmoid(_chunk_logits(X, weights, bias, False)[0])
+
+
+def train(embeddings, positive_indices, negative_indices, sample_weight=10, init=None):
+    """
+    Fit a balanced logistic regression; returns (weights, bias). ``init``
+    is an earlier ``(weights, bias)`` to warm-start from.
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    positive_indices = np.sort(np.asarray(positive_indices, dtype=np.int64))
+    negative_indices = np.sort(np.asarray(negative_indices, dtype=np.int64))
+    train_X = np.concatenate(
+        (embeddings[positive_indices], embeddings[negative_indices]), axis=0
+    )
+    train_y = np.concatenate(
+        (np.ones(len(positive_indices)), np.zeros(len(negative_indices)))
+    )
+    clf = LogisticRegression(
+        class_weight="balanced", random_state=1, max_iter=100000, warm_start=init is not None
+    )
+    if init is not None:
+        clf.coef_ = np.asarray(init[0], dtype=np.float64)[None, :]
+        clf.intercept_ = np.array([init[1]], dtype=np.float64)
+    clf.fit(train_X, train_y, np.full(len(train_y), sample_weight, dtype=np.float64))
+    return clf.coef_[0], float(clf.intercept_[0])
+
+
+def top_k(scores, k, exclude=None):
+    """
+    Indices of the ``k`` highest scores, best first, skipping rows set in the
+    boolean ``exclude`` mask. Uses argpartition, so only k rows get sorted.
+    """
+    if exclude is not None and exclude.any():
+        scores = np.where(exclude, -np.inf, scores)
+        k = min(k, int(len(scores) - exclude.sum()))
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def facet_key(query, positives, negatives):
+    """Stable id of a facet: its query and its exact label set."""
+    digest = hashlib.sha256(query.strip().lower().encode("utf-8"))
+    for indices in (positives, negatives):
+        digest.update(b"|")
+        digest.update(np.sort(np.asarray(indices, dtype=np.int64)).tobytes())
+    return digest.hexdigest()[:24]
+
+
+class Facet:
+    """
+    A trained facet: its labels, the model, the exact logits of its best
+    ``N_CANDIDATES`` unlabeled rows and an upper bound on the logit of every
+    other unlabeled row, per block. ``rescored`` is the number of rows
+    scored to produce it.
+    """
+
+    ARRAYS = ("positives", "negatives", "weights", "candidates", "candidate_logits", "block_bounds")
+
+    def __init__(
+        self,
+        query,
+        positives,
+        negatives,
+        weights,
+        bias,
+        candidates,
+        candidate_logits,
+        block_bounds,
+        parent=None,
+        rescored=None,
+    ):
+        self.query = query
+        self.positives = positives
+        self.negatives = negatives
+        self.weights = weights
+        self.bias = float(bias)
+        self.candidates = candidates
+        self.candidate_logits = candidate_logits
+        self.block_bounds = block_bounds
+        self.parent = parent
+        self.rescored = rescored
+        self.key = facet_key(query, positives, negatives)
+
+    def top(self, k):
+        """
+        ``(indices, scores)`` of the ``k`` best unlabeled rows. Exact up to
+        ``N_CANDIDATES`` after a full scoring, and up to the ``k`` given to
+        ``refine`` after a refinement.
+        """
+        best = top_k(self.candidate_logits, k)
+        return self.candidates[best], sigmoid(self.candidate_logits[best])
+
+
+def merge_labels(positives, negatives, new_positives=(), new_negatives=()):
+    """Label sets after adding labels; a row labeled both ways keeps its new label."""
+    new_positives = np.asarray(new_positives, dtype=np.int64)
+    new_negatives = np.asarray(new_negatives, dtype=np.int64)
+    if np.intersect1d(new_positives, new_negatives).size:
+        raise ValueError("Rows cannot be labeled both positive and negative")
+    return (
+        np.union1d(np.setdiff1d(positives, new_negatives), new_positives),
+        np.union1d(np.setdiff1d(negatives, new_positives), new_negatives),
+    )
+
+
+def _labeled_mask(n, positives, negatives):
+    labeled = np.zeros(n, dtype=bool)
+    labeled[positives] = True
+    labeled[negatives] = True
+    return labeled
+
+
+class FacetLearner:
+    """
+    Trains and applies facets over one embedding matrix.
+
+    ``processes=0`` scores in the calling process; otherwise a pool of that
+    many workers is started on first use and kept until ``close``.
+    """
+
+    def __init__(self, embeddings_path, processes=0, chunk_size=CHUNK_SIZE, block_norms=None):
+        if chunk_size % BLOCK_SIZE:
+            raise ValueError(f"chunk_size must be a multiple of {BLOCK_SIZE}")
+        self.embeddings_path = embeddings_path
+        self.embeddings = load_embeddings(embeddings_path)
+        self.processes = processes
+        self.chunk_size = chunk_size
+        # largest row norm of every block, filled in by the first full scoring
+        self.block_norms = block_norms
+        self._pool = None
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def logits(self, weights, bias):
+        """Logits of every row; also records ``block_norms`` the first time."""
+        n = len(self.embeddings)
+        logits = np.empty(n, dtype=np.float32)
+        with_norms = self.block_norms is None
+        norms = np.empty(-(-n // BLOCK_SIZE), dtype=np.float32)
+        chunks = [
+            (start, min(start + self.chunk_size, n), weights, bias, with_norms)
+            for start in range(0, n, self.chunk_size)
+        ]
+        if self.processes:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.processes, initializer=_init_worker, initargs=(self.embeddings_path,)
+                )
+            results = self._pool.map(_score_chunk, chunks)
+        else:
+            results = (
+                (start, *_chunk_logits(self.embeddings[start:stop], w, b, norms_wanted))
+                for start, stop, w, b, norms_wanted in chunks
+            )
+        for start, chunk_logits, chunk_norms in results:
+            logits[start : start + len(chunk_logits)] = chunk_logits
+            if with_norms:
+                norms[start // BLOCK_SIZE : start // BLOCK_SIZE + len(chunk_norms)] = chunk_norms
+        if with_norms:
+            self.block_norms = norms
+        return logits
+
+    def score(self, weights, bias):
+        return sigmoid(self.logits(weights, bias))
+
+    def sample_negatives(self, positive_indices, n_negative=None, seed=0):
+        """
+        Random rows that are not positive, as many as the positives by
+        default. Rows are drawn with rejection rather than by permuting every
+        non-positive row, so recomputing the negatives of a seed (to find a
+        cached facet) costs about as much as the draw itself.
+        """
+        n = len(self.embeddings)
+        positive_indices = np.unique(np.asarray(positive_indices, dtype=np.int64))
+        n_negative = min(n_negative or len(positive_indices), n - len(positive_indices))
+        rng = np.random.default_rng(seed)
+        drawn = np.zeros(0, dtype=np.int64)
+        while len(drawn) < n_negative:
+            draw = rng.integers(0, n, 2 * n_negative)
+            drawn = np.concatenate([drawn, draw[~np.isin(draw, positive_indices)]])
+            # keep the first draw of every row, in draw order
+            _, first = np.unique(drawn, return_index=True)
+            drawn = drawn[np.sort(first)]
+        return np.sort(drawn[:n_negative])
+
+    def learn(self, positive_indices, k=N_PREDICTIONS, n_negative=None, seed=0):
+        """
+        Trains on ``positive_indices`` plus as many random negatives and returns
+        ``(indices, scores, timings)`` for the top ``k`` unlabeled rows.
+        """
+        facet, timings = self.learn_facet("", positive_indices, n_negative=n_negative, seed=seed)
+        start = time.perf_counter()
+        indices, scores = facet.top(k)
+        timings["top_k"] += time.perf_counter() - start
+        return indices, scores, timings
+
+    def learn_facet(self, query, positive_indices, negative_indices=None, n_negative=None, seed=0):
+        """
+        Trains a facet from scratch and scores every row. Negatives are drawn
+        at random unless given. Returns ``(facet, timings)``.
+        """
+        timings = {}
+        start = time.perf_counter()
+        positives = np.unique(np.asarray(positive_indices, dtype=np.int64))
+        if negative_indices is None:
+            negatives = self.sample_negatives(positives, n_negative, seed)
+        else:
+            negatives = np.setdiff1d(np.asarray(negative_indices, dtype=np.int64), positives)
+        timings["sample"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        weights, bias = train(self.embeddings, positives, negatives)
+        timings["train"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        logits = self.logits(weights, bias)
+        timings["score"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # candidates are the best unlabeled rows; every other unlabeled row
+        # counts towards its block's bound
+        labeled = _labeled_mask(len(logits), positives, negatives)
+        candidates = top_k(logits, N_CANDIDATES, exclude=labeled)
+        logits[labeled] = -np.inf
+        candidate_logits = logits[candidates]
+        logits[candidates] = -np.inf
+        facet = Facet(
+            query,
+            positives,
+            negatives,
+            np.asarray(weights, dtype=np.float32),
+            bias,
+            candidates,
+            candidate_logits,
+            block_max(logits),
+            rescored=len(logits),
+        )
+        timings["top_k"] = time.perf_counter() - start
+        return facet, timings
+
+    def refine(self, facet, positive_indices=(), negative_indices=(), k=N_PREDICTIONS):
+        """
+        ``facet`` with more labels: the classifier is warm-started from the
+        old weights, and only the candidates plus the blocks whose bound can
+        still reach the top ``k`` are rescored. Labels are merged with
+        ``merge_labels``. Returns ``(facet, timings)``.
+        """
+        timings = {}
+        start = time.perf_counter()
+        positives, negatives = merge_labels(
+            facet.positives, facet.negatives, positive_indices, negative_indices
+        )
+        n = len(self.embeddings)
+        labeled = _labeled_mask(n, positives, negatives)
+        timings["sample"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        weights, bias = train(self.embeddings, positives, negatives, init=(facet.weights, facet.bias))
+        weights = np.asarray(weights, dtype=np.float32)
+        timings["train"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if self.block_norms is None:
+            # one full pass also records the block norms for later refinements
+            refined, full_timings = self.learn_facet(facet.query, positives, negatives)
+            refined.parent = facet.key
+            timings["score"] = full_timings["score"] + full_timings["top_k"]
+            return refined, timings
+
+        # every unlabeled non-candidate row moved by at most |x| |dw| + |db|
+        growth = np.float32(np.linalg.norm(weights - facet.weights)) * self.block_norms
+        bounds = facet.block_bounds + growth + np.float32(abs(bias - facet.bias) + BOUND_SLACK)
+
+        keep = ~labeled[facet.candidates]
+        rows = facet.candidates[keep]
+        order = np.argsort(rows)
+        rows = rows[order]
+        rows_logits = _chunk_logits(self.embeddings[rows], weights, bias, False)[0]
+
+        # rescore the blocks that could still hold a top-k row
+        threshold = -np.inf
+        if len(rows_logits) >= k:
+            threshold = np.partition(rows_logits, len(rows_logits) - k)[len(rows_logits) - k]
+        blocks = np.flatnonzero(bounds >= threshold)
+        in_block = np.isin(rows // BLOCK_SIZE, blocks)
+        rows, rows_logits = rows[~in_block], rows_logits[~in_block]
+        block_rows, block_logits = [], []
+        for block in blocks.tolist():
+            begin, end = block * BLOCK_SIZE, min((block + 1) * BLOCK_SIZE, n)
+            logits = _chunk_logits(self.embeddings[begin:end], weights, bias, False)[0]
+            unlabeled = ~labeled[begin:end]
+            block_rows.append(np.arange(begin, end)[unlabeled])
+            block_logits.append(logits[unlabeled])
+        bounds[blocks] = -np.inf
+        rows = np.concatenate([rows] + block_rows)
+        rows_logits = np.concatenate([rows_logits] + block_logits)
+
+        best = top_k(rows_logits, N_CANDIDATES)
+        dropped = np.ones(len(rows), dtype=bool)
+        dropped[best] = False
+        np.maximum.at(bounds, rows[dropped] // BLOCK_SIZE, rows_logits[dropped])
+        timings["score"] = time.perf_counter() - start
+
+        refined = Facet(
+            facet.query,
+            positives,
+            negatives,
+            weights,
+            bias,
+            rows[best],
+            rows_logits[best],
+            bounds,
+            parent=facet.key,
+            rescored=int(keep.sum()) + sum(len(r) for r in block_rows),
+        )
+        return refined, timings
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import numpy as np
+
+from core.cluster_store import StringTable
+
+HASHES_FILE = "filepath_index.hashes.npy"
+ROWS_FILE = "filepath_index.rows.npy"
+PATHS_BLOB_FILE = "filepath_index.paths_blob.npy"
+PATHS_OFFSETS_FILE = "filepath_index.paths_offsets.npy"
+
+
+def filepath_hash(filepath):
+    """64-bit key for a filepath (first 8 bytes of its BLAKE2b digest)."""
+    digest = hashlib.blake2b(filepath.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def build_filepath_index(filepaths, output_dir):
+    """
+    Writes a sorted hash -> row index for ``filepaths`` to ``output_dir``.
+
+    Row ``i`` is the position of the filepath in the input, i.e. the row of
+    the Newspaper Navigator split it was read from. The lookup side costs 12
+    bytes per row: the sorted uint64 hashes and the matching uint32 rows. The
+    filepaths themselves are kept in row order for the reverse direction. All
+    are plain ``.npy`` files so they can be memory-mapped at startup.
+    """
+    filepaths = filepaths if isinstance(filepaths, list) else list(filepaths)
+    hashes = np.fromiter((filepath_hash(fp) for fp in filepaths), dtype=np.uint64)
+    order = np.argsort(hashes, kind="stable")
+    hashes = hashes[order]
+    rows = order.astype(np.uint32)
+
+    # A repeated hash is either a repeated filepath (keep the first row) or a
+    # genuine 64-bit collision, which we refuse to paper over.
+    duplicate = np.flatnonzero(hashes[1:] == hashes[:-1]) + 1
+    if len(duplicate):
+        for i in duplicate:
+            if filepaths[rows[i]] != filepaths[rows[i - 1]]:
+                raise ValueError(
+                    f"Hash collision between {filepaths[rows[i - 1]]!r} "
+                    f"and {filepaths[rows[i]]!r}"
+                )
+        keep = np.ones(len(hashes), dtype=bool)
+        keep[duplicate] = False
+        hashes, rows = hashes[keep], rows[keep]
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, HASHES_FILE), hashes)
+    np.save(os.path.join(output_dir, ROWS_FILE), rows)
+    paths = StringTable.from_strings(filepaths)
+    np.save(os.path.join(output_dir, PATHS_BLOB_FILE), paths.blob)
+    np.save(os.path.join(output_dir, PATHS_OFFSETS_FILE), paths.offsets)
+    return len(hashes)
+
+
+class FilepathIndex:
+    """Memory-mapped filepath <-> dataset row lookups in O(log n) / O(1)."""
+
+    def __init__(self, hashes, rows, paths):
+        self.hashes = hashes
+        self.rows = rows
+        self.paths = paths
+
+    @classmethod
+    def load(cls, index_dir):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        paths = StringTable(load(PATHS_BLOB_FILE), load(PATHS_OFFSETS_FILE))
+        return cls(load(HASHES_FILE), load(ROWS_FILE), paths)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, filepath):
+        return self.lookup(filepath) is not None
+
+    def lookup(self, filepath):
+        """Return the dataset row of ``filepath``, or ``None`` if unknown."""
+        key = np.uint64(filepath_hash(filepath))
+        i = int(np.searchsorted(self.hashes, key))
+        if i < len(self.hashes) and self.hashes[i] == key:
+            return int(self.rows[i])
+        return None
+
+    def filepath(self, row):
+        """The filepath of dataset row ``row``."""
+        return self.paths[row]
+
+    def filepaths(self, rows):
+        return self.paths.take(rows)
+
+    def lookup_many(self, filepaths):
+        """Vectorised lookup; unknown filepaths map to -1."""
+        keys = np.fromiter((filepath_hash(fp) for fp in filepaths), dtype=np.uint64)
+        if not len(self.hashes):
+            return np.full(len(keys), -1, dtype=np.int64)
+        i = np.searchsorted(self.hashes, keys)
+        i_clipped = np.minimum(i, len(self.hashes) - 1)
+        found = (i < len(self.hashes)) & (self.hashes[i_clipped] == keys)
+        return np.where(found, self.rows[i_clipped].astype(np.int64), -1)
@@ -0,0 +1,225 @@
+"""
+Vectorised parsing of Newspaper Navigator image ids.
+
+An id such as
+``in_jillette_ver01/data/sn82015313/00383349655/1934092501/0466/005_0_98.jpg``
+(processed form) or the same with every ``/`` replaced by ``_`` and no
+extension (raw form, as in the exported clusters) encodes the batch, LCCN,
+reel, issue date + edition, page sequence, box index, class and confidence.
+Both forms have exactly ten separators (``/`` or ``_``) around eleven
+tokens, so millions of ids can be parsed at once by locating separators in
+one byte buffer, with no per-id string operations.
+
+``parse_filepaths`` returns a ``FilepathTable``: a struct of arrays with
+interned batch, LCCN and reel codes, int32 dates and small ints. Reels are
+interned rather than parsed as numbers because some carry a letter suffix
+(``0038334959A``).
+"""
+import numpy as np
+
+from core.cluster_store import StringTable
+
+NEWLINE, SLASH, UNDERSCORE = ord("\n"), ord("/"), ord("_")
+N_SEPARATORS = 10
+# separators that are slashes in the processed form (after the 3-part batch
+# name, "data", the LCCN, reel, issue and sequence)
+PATH_SEPARATORS = slice(2, 8)
+EXTENSION = np.frombuffer(b".jpg", dtype=np.uint8)
+
+# token positions
+BATCH_FIRST, BATCH_LAST, LCCN, REEL, ISSUE, SEQ, BOX, LABEL, CONFIDENCE = 0, 2, 4, 5, 6, 7, 8, 9, 10
+
+
+def _tokenize(filepaths):
+    """
+    Packs ``filepaths`` into one byte buffer and finds the tokens of every
+    well-formed id. Returns ``(blob, starts, ends, valid, token_starts,
+    token_ends, separators)``; the token arrays have one row per valid id.
+    """
+    blob = np.frombuffer("\n".join(filepaths).encode("utf-8") + b"\n", dtype=np.uint8)
+    ends = np.flatnonzero(blob == NEWLINE)
+    starts = np.r_[0, ends[:-1] + 1]
+
+    separators = np.flatnonzero((blob == SLASH) | (blob == UNDERSCORE))
+    # separators before each id's end, so per-id counts are differences
+    before_end = np.searchsorted(separators, ends)
+    first = np.r_[0, before_end[:-1]]
+    counts = before_end - first
+    valid = counts == N_SEPARATORS
+    seps = separators[first[valid][:, None] + np.arange(N_SEPARATORS)]
+
+    # the path separators must be all '/' (processed) or all '_' (raw)
+    path_bytes = blob[seps[:, PATH_SEPARATORS]]
+    consistent = np.all(path_bytes == path_bytes[:, :1], axis=1)
+    other = np.delete(seps, np.arange(N_SEPARATORS)[PATH_SEPARATORS], axis=1)
+    consistent &= np.all(blob[other] == UNDERSCORE, axis=1)
+    valid[valid] = consistent
+    seps = seps[consistent]
+
+    token_starts = np.c_[starts[valid], seps + 1]
+    token_ends = np.c_[seps, ends[valid]]
+    # drop the extension from the last token
+    last_end = token_ends[:, -1]
+    tail = blob[np.maximum(last_end[:, None] - 4, 0) + np.arange(4)]
+    has_extension = np.all(tail == EXTENSION, axis=1) & (last_end - 4 >= token_starts[:, -1])
+    token_ends[has_extension, -1] -= 4
+    return blob, starts, ends, valid, token_starts, token_ends, seps
+
+
+def _gather(blob, starts, ends):
+    """Zero-padded ``(n, width)`` byte matrix of the slices ``[starts, ends)``."""
+    lengths = ends - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    columns = np.arange(width)
+    in_field = columns < lengths[:, None]
+    matrix = blob[np.minimum(starts[:, None] + columns, len(blob) - 1)]
+    return np.where(in_field, matrix, 0).astype(np.uint8), in_field
+
+
+def _parse_ints(blob, starts, ends, max_digits):
+    """Decimal fields as int64 (-1 where empty, too long or not all digits)."""
+    lengths = ends - starts
+    ok = (lengths > 0) & (lengths <= max_digits)
+    values = np.zeros(len(starts), dtype=np.int64)
+    for k in range(min(max_digits, int(lengths.max()) if len(lengths) else 0)):
+        # least significant digit first, one column at a time, so no
+        # (n, width) matrix is built; non-digits wrap around to >= 10
+        inside = lengths > k
+        digit = blob[ends - 1 - k] - np.uint8(ord("0"))
+        ok &= (digit < 10) | ~inside
+        np.add(values, digit * np.int64(10**k), out=values, where=inside)
+    values[~ok] = -1
+    return values
+
+
+def _intern(blob, starts, ends):
+    """
+    Sorted distinct strings of the slices as a StringTable, plus codes.
+    Slices are zero-padded to whole big-endian uint64 words, whose numeric
+    order is the byte order, and sorted with lexsort.
+    """
+    matrix, _ = _gather(blob, starts, ends)
+    n, width = matrix.shape
+    if n == 0 or width == 0:
+        return StringTable.from_strings([""] if n else []), np.zeros(n, dtype=np.int32)
+    padded = np.zeros((n, -(-width // 8) * 8), dtype=np.uint8)
+    padded[:, :width] = matrix
+    words = padded.view(">u8")
+    order = np.lexsort(words.T[::-1])
+    ordered = words[order]
+    new = np.r_[True, np.any(ordered[1:] != ordered[:-1], axis=1)]
+    codes = np.empty(n, dtype=np.int32)
+    codes[order] = np.cumsum(new) - 1
+    firsts = order[new]
+    strings = [bytes(blob[s:e]).decode("utf-8") for s, e in zip(starts[firsts].tolist(), ends[firsts].tolist())]
+    return StringTable.from_strings(strings), codes
+
+
+class FilepathTable:
+    """
+    Parsed image ids as parallel arrays, one entry per input id. Ids that
+    don't parse have ``valid`` False, code -1 and numeric fields -1.
+    ``batch``, ``lccn`` and ``reel`` index the sorted ``batches``/``lccns``/
+    ``reels`` tables.
+    """
+
+    INT_FIELDS = {
+        "date": np.int32,
+        "edition": np.int16,
+        "seq": np.int16,
+        "box": np.int16,
+        "label": np.int8,
+        "confidence": np.int16,
+    }
+
+    def __init__(self, valid, raw, batch, batches, lccn, lccns, reel, reels, **fields):
+        self.valid = valid
+        self.raw = raw
+        self.batch = batch
+        self.batches = batches
+        self.lccn = lccn
+        self.lccns = lccns
+        self.reel = reel
+        self.reels = reels
+        for name in self.INT_FIELDS:
+            setattr(self, name, fields[name])
+
+    def __len__(self):
+        return len(self.valid)
+
+    @property
+    def year(self):
+        return np.where(self.valid, self.date // 10000, -1)
+
+    def pages(self):
+        """
+        ``(first, page)``: the index of the first id on each distinct page
+        (batch, LCCN, reel, issue, sequence) and the page ordinal of every id.
+        """
+        keys = np.rec.fromarrays([self.batch, self.lccn, self.reel, self.date, self.edition, self.seq])
+        _, first, page = np.unique(keys, return_index=True, return_inverse=True)
+        return first, page
+
+
+def parse_filepaths(filepaths):
+    """Parses raw or processed ids (any mix) into a ``FilepathTable``."""
+    filepaths = list(filepaths)
+    n = len(filepaths)
+    fields = {name: np.full(n, -1, dtype=dtype) for name, dtype in FilepathTable.INT_FIELDS.items()}
+    batch, lccn, reel = (np.full(n, -1, dtype=np.int32) for _ in range(3))
+    raw = np.zeros(n, dtype=bool)
+    if n == 0:
+        empty = StringTable.from_strings([])
+        return FilepathTable(np.zeros(0, dtype=bool), raw, batch, empty, lccn, empty, reel, empty, **fields)
+
+    blob, _, _, valid, token_starts, token_ends, seps = _tokenize(filepaths)
+
+    def ints(token, max_digits):
+        return _parse_ints(blob, token_starts[:, token], token_ends[:, token], max_digits)
+
+    issue = ints(ISSUE, 10)
+    parsed = {
+        "date": np.where(issue >= 0, issue // 100, -1),
+        "edition": np.where(issue >= 0, issue % 100, -1),
+        "seq": ints(SEQ, 4),
+        "box": ints(BOX, 4),
+        "label": ints(LABEL, 2),
+        "confidence": ints(CONFIDENCE, 3),
+    }
+    # issues are always YYYYMMDDEE
+    ok = (token_ends[:, ISSUE] - token_starts[:, ISSUE]) == 10
+    ok &= token_ends[:, REEL] > token_starts[:, REEL]
+    ok &= np.all(np.c_[tuple(parsed.values())] >= 0, axis=1)
+    rows = np.flatnonzero(valid)[ok]
+    valid[:] = False
+    valid[rows] = True
+
+    for name, values in parsed.items():
+        fields[name][rows] = values[ok]
+    batches, batch_codes = _intern(blob, token_starts[ok, BATCH_FIRST], token_ends[ok, BATCH_LAST])
+    lccns, lccn_codes = _intern(blob, token_starts[ok, LCCN], token_ends[ok, LCCN])
+    reels, reel_codes = _intern(blob, token_starts[ok, REEL], token_ends[ok, REEL])
+    batch[rows], lccn[rows], reel[rows] = batch_codes, lccn_codes, reel_codes
+    raw[rows] = blob[seps[ok, PATH_SEPARATORS.start]] == UNDERSCORE
+    return FilepathTable(valid, raw, batch, batches, lccn, lccns, reel, reels, **fields)
+
+
+def raw_to_processed(filepaths):
+    """
+    Rewrites raw ids (``a_b_c_data_..._box_class_conf``) to the processed
+    form (``a_b_c/data/.../box_class_conf.jpg``) in one buffer operation.
+    Processed and unparseable ids are returned unchanged.
+    """
+    filepaths = list(filepaths)
+    if not filepaths:
+        return []
+    blob, _, ends, valid, token_starts, token_ends, seps = _tokenize(filepaths)
+    raw = blob[seps[:, PATH_SEPARATORS.start]] == UNDERSCORE
+
+    blob = blob.copy()
+    blob[seps[raw, PATH_SEPARATORS]] = SLASH
+    # ids whose last token had no extension get one
+    missing = raw & (token_ends[:, -1] == ends[valid])
+    positions = np.repeat(ends[valid][missing], len(EXTENSION))
+    blob = np.insert(blob, positions, np.tile(EXTENSION, int(missing.sum())))
+    return blob[:-1].tobytes().decode("utf-8").split("\n")
@@ -0,0 +1,245 @@
+"""
+IIIF helpers for Library of Congress (Chronicling America) pages.
+
+A dataset filepath such as
+``kyu_bunting_ver01/data/sn86069123/00202195209/1862111301/0085/005_0_98.jpg``
+encodes the page it was cropped from (everything before the last slash):
+batch, LCCN, reel, issue date + edition and page sequence. These map
+directly to the LoC image service and presentation manifest ids.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from core.filepath_index import filepath_hash
+
+SERVICE_ROOT = "https://tile.loc.gov/image-services/iiif"
+ITEM_ROOT = "https://www.loc.gov/item"
+PAGE_KEYS_FILE = "page_dimensions.keys.npy"
+PAGE_SIZES_FILE = "page_dimensions.sizes.npy"
+
+
+def page_of(filepath):
+    """The page part of a filepath: batch/data/lccn/reel/issue/seq."""
+    return filepath.rsplit("/", 1)[0]
+
+
+def page_service_id(page):
+    batch, _, lccn, reel, issue, seq = page.split("/")
+    institution = batch.split("_", 1)[0]
+    return (
+        f"{SERVICE_ROOT}/service:ndnp:{institution}:batch_{batch}"
+        f":data:{lccn}:{reel}:{issue}:{seq}"
+    )
+
+
+def image_service_id(filepath):
+    return page_service_id(page_of(filepath))
+
+
+def manifest_id(filepath):
+    _, _, lccn, _, issue, _ = page_of(filepath).split("/")
+    date = f"{issue[:4]}-{issue[4:6]}-{issue[6:8]}"
+    return f"{ITEM_ROOT}/{lccn}/{date}/ed-{int(issue[8:])}/manifest.json"
+
+
+def box_to_xywh(box, width, height):
+    """Fractional [x1, y1, x2, y2] box -> integer pixel (x, y, w, h)."""
+    x1, y1, x2, y2 = box
+    x, y = round(x1 * width), round(y1 * height)
+    return x, y, round(x2 * width) - x, round(y2 * height) - y
+
+
+def fetch_info_json(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+class PageDimensions:
+    """
+    Page (width, height) lookups.
+
+    Pages present in the precomputed table (sorted page-key hashes plus a
+    matching (n, 2) uint32 array) are answered from memory. Other pages fall
+    back to ``fetch(<image service>/info.json)``, cached in an LRU; pass
+    ``fetch=None`` to disable the network entirely.
+
+    Fetches happen on the request path, so they never wait for the rate
+    limit: at most ``requests_per_second`` are started (``burst`` at once)
+    and pages over the limit are answered None for now. Failed pages are
+    remembered for ``retry_seconds``, so a broken page isn't fetched on every
+    request. ``get_many`` fetches the missing pages of many ids concurrently.
+    """
+
+    def __init__(
+        self,
+        keys=None,
+        sizes=None,
+        fetch=fetch_info_json,
+        cache_size=4096,
+        requests_per_second=5.0,
+        burst=10,
+        retry_seconds=300.0,
+        concurrency=8,
+        clock=time.monotonic,
+    ):
+        self.keys = keys if keys is not None else np.zeros(0, dtype=np.uint64)
+        self.sizes = sizes if sizes is not None else np.zeros((0, 2), dtype=np.uint32)
+        self.fetch = fetch
+        self.cache_size = cache_size
+        # page -> (width, height), or the time to retry a failed page
+        self.fetched = OrderedDict()
+        self.failed = OrderedDict()
+        self.rate = requests_per_second
+        self.burst = self.tokens = burst
+        self.retry_seconds = retry_seconds
+        self.concurrency = concurrency
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+        self._pool = None
+        self.fetches = self.failures = self.throttled = 0
+
+    @classmethod
+    def load(cls, index_dir, fetch=fetch_info_json, cache_size=4096, **options):
+        try:
+            keys = np.load(os.path.join(index_dir, PAGE_KEYS_FILE), mmap_mode="r")
+            sizes = np.load(os.path.join(index_dir, PAGE_SIZES_FILE), mmap_mode="r")
+        except FileNotFoundError:
+            keys = sizes = None
+        return cls(keys, sizes, fetch, cache_size, **options)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _remember(self, items, page, value):
+        # called with the lock held
+        items[page] = value
+        items.move_to_end(page)
+        while len(items) > self.cache_size:
+            items.popitem(last=False)
+
+    def _lookup(self, page):
+        """``(size, needs_fetch)`` for ``page`` without touching the network."""
+        key = np.uint64(filepath_hash(page))
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return (int(self.sizes[i, 0]), int(self.sizes[i, 1])), False
+        if self.fetch is None:
+            return None, False
+        with self._lock:
+            size = self.fetched.get(page)
+            if size is not None:
+                self.fetched.move_to_end(page)
+                return size, False
+            now = self.clock()
+            retry_at = self.failed.get(page)
+            if retry_at is not None:
+                if now < retry_at:
+                    return None, False
+                del self.failed[page]
+            # token bucket, without waiting
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.throttled += 1
+                return None, False
+            self.tokens -= 1
+            return None, True
+
+    def _fetch_size(self, page):
+        with self._lock:
+            self.fetches += 1
+        try:
+            info = self.fetch(f"{page_service_id(page)}/info.json")
+            size = int(info["width"]), int(info["height"])
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.failures += 1
+                self._remember(self.failed, page, self.clock() + self.retry_seconds)
+            return None
+        with self._lock:
+            self._remember(self.fetched, page, size)
+        return size
+
+    def get(self, filepath):
+        """(width, height) of the page ``filepath`` was cropped from, or None."""
+        page = page_of(filepath)
+        size, needs_fetch = self._lookup(page)
+        return self._fetch_size(page) if needs_fetch else size
+
+    def get_many(self, filepaths):
+        """``get`` for many ids; each missing page is fetched once, concurrently."""
+        pages = [page_of(filepath) for filepath in filepaths]
+        sizes, to_fetch = {}, []
+        for page in dict.fromkeys(pages):
+            sizes[page], needs_fetch = self._lookup(page)
+            if needs_fetch:
+                to_fetch.append(page)
+        if len(to_fetch) > 1:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="iiif")
+            sizes.update(zip(to_fetch, self._pool.map(self._fetch_size, to_fetch)))
+        elif to_fetch:
+            sizes[to_fetch[0]] = self._fetch_size(to_fetch[0])
+        return [sizes[page] for page in pages]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stored": len(self),
+                "fetched": len(self.fetched),
+                "fetches": self.fetches,
+                "failures": self.failures,
+                "failed_pending_retry": len(self.failed),
+                "throttled": self.throttled,
+            }
+
+
+def build_page_dimensions(pages_and_sizes, output_dir):
+    """Writes the (page, (width, height)) pairs as a sorted lookup table."""
+    pages_and_sizes = list(pages_and_sizes)
+    keys = np.array([filepath_hash(page) for page, _ in pages_and_sizes], dtype=np.uint64)
+    sizes = np.array([size for _, size in pages_and_sizes], dtype=np.uint32).reshape(-1, 2)
+    order = np.argsort(keys)
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, PAGE_KEYS_FILE), keys[order])
+    np.save(os.path.join(output_dir, PAGE_SIZES_FILE), sizes[order])
+    return len(keys)
+
+
+def build_annotation(filepath, item, dimensions, base_url):
+    """
+    IIIF Presentation 3 annotation targeting the region of the LoC page that
+    ``filepath`` was cropped from. ``item`` is the dataset row (box, name,
+    pub_date); without page dimensions the whole canvas is targeted.
+    """
+    source = {
+        "id": image_service_id(filepath),
+        "type": "Canvas",
+        "partOf": [{"id": manifest_id(filepath), "type": "Manifest"}],
+    }
+    target = {"type": "SpecificResource", "source": source}
+    if dimensions is not None and item.get("box"):
+        x, y, w, h = box_to_xywh(item["box"], *dimensions)
+        target["selector"] = {"type": "FragmentSelector", "value": f"xywh={x},{y},{w},{h}"}
+
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": f"{base_url}image/{filepath}/annotation.json",
+        "type": "Annotation",
+        "motivation": ["contentState", "tagging"],
+        "target": target,
+        "body": {
+            "type": "TextualBody",
+            "value": f"Published by {item['name']} on {item['pub_date']}",
+            "format": "text/plain",
+            "language": ["en"],
+        },
+    }
@@ -0,0 +1,94 @@
+"""
+Binary snapshot of the dataset columns the API serves.
+
+Each text column is a ``StringTable`` (UTF-8 blob plus offsets) and the
+detection boxes are a float64 ``(n, 4)`` array, all in dataset row order and
+memory-mapped at startup. The OCR text, by far the largest column, goes to a
+block-compressed ``OCRStore`` instead. ``MetadataStore`` indexes like a ``datasets``
+split (an int gives a row dict, a list of ints gives a dict of columns), so
+routes work unchanged against either, without importing ``datasets``.
+"""
+import os
+import numpy as np
+
+from core.cluster_store import StringTable
+from core.ocr_store import OCRStore, OCRStoreWriter
+
+TEXT_COLUMNS = (
+    "filepath",
+    "pub_date",
+    "lccn",
+    "name",
+    "publisher",
+    "place_of_publication",
+    "prediction_section_iiif_url",
+)
+COLUMNS = TEXT_COLUMNS + ("ocr", "box")
+
+
+def build_metadata_store(batches, output_dir):
+    """
+    Writes ``metadata.*.npy`` and the OCR store from an iterable of columnar
+    batches (dicts of lists with every name in ``COLUMNS``, e.g.
+    ``Dataset.iter``), so the dataset is streamed rather than materialised.
+    Returns the row count.
+    """
+    blobs = {name: bytearray() for name in TEXT_COLUMNS}
+    lengths = {name: [] for name in TEXT_COLUMNS}
+    boxes = []
+    ocr = OCRStoreWriter(output_dir)
+    for batch in batches:
+        ocr.add(batch["ocr"])
+        for name in TEXT_COLUMNS:
+            encoded = [(value or "").encode("utf-8") for value in batch[name]]
+            blobs[name] += b"".join(encoded)
+            lengths[name].append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        boxes.append(np.asarray(batch["box"], dtype=np.float64).reshape(-1, 4))
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in TEXT_COLUMNS:
+        column_lengths = np.concatenate(lengths[name]) if lengths[name] else np.zeros(0, np.int64)
+        offsets = np.zeros(len(column_lengths) + 1, dtype=np.int64)
+        np.cumsum(column_lengths, out=offsets[1:])
+        np.save(os.path.join(output_dir, f"metadata.{name}_blob.npy"), np.frombuffer(blobs[name], dtype=np.uint8))
+        np.save(os.path.join(output_dir, f"metadata.{name}_offsets.npy"), offsets)
+    box = np.concatenate(boxes) if boxes else np.zeros((0, 4), np.float64)
+    np.save(os.path.join(output_dir, "metadata.box.npy"), box)
+    ocr.close()
+    return len(box)
+
+
+class MetadataStore:
+    def __init__(self, columns, box):
+        self.columns = columns
+        self.box = box
+        self.column_names = list(COLUMNS)
+        self.ocr_store = columns["ocr"]
+
+    @classmethod
+    def load(cls, index_dir, ocr_cache_bytes=16 * 1024 * 1024):
+        def load(name):
+            return np.load(os.path.join(index_dir, f"metadata.{name}.npy"), mmap_mode="r")
+
+        columns = {name: StringTable(load(f"{name}_blob"), load(f"{name}_offsets")) for name in TEXT_COLUMNS}
+        if not OCRStore.exists(index_dir):
+            # snapshots from before the OCR store kept the text in metadata.ocr_*.npy
+            raise RuntimeError(
+                f"Metadata snapshot in {index_dir} has no OCR store; "
+                "rebuild it with `python scripts/build_artifacts.py metadata`"
+            )
+        columns["ocr"] = OCRStore.load(index_dir, ocr_cache_bytes)
+        return cls(columns, load("box"))
+
+    def __len__(self):
+        return len(self.box)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            item = {name: table[key] for name, table in self.columns.items()}
+            item["box"] = self.box[key].tolist()
+            return item
+        rows = np.asarray(key, dtype=np.int64)
+        batch = {name: table.take(rows) for name, table in self.columns.items()}
+        batch["box"] = self.box[rows].tolist()
+        return batch
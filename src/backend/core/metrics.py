@@ -0,0 +1,186 @@
+"""
+Request metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, per route template, method and status, a
+latency histogram and a response-size histogram, plus the number of
+requests in flight. Startup phases (index loads and the like) are timed
+with ``Metrics.phase`` and exported as gauges. Everything runs on the event
+loop, so the counters need no locking.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(256 * 4**i for i in range(10))  # 256 B to 64 MiB
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            labels = format_labels(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = format_labels([("le", bound)])
+                lines.append(f"{self.name}_bucket{{{labels},{le}}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+def process_memory(pid="self"):
+    """
+    Resident, proportional (shared pages split between the processes mapping
+    them) and private memory of a process in bytes, from
+    /proc/<pid>/smaps_rollup. Empty where that isn't available.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def format_labels(pairs):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in pairs)
+
+
+class Metrics:
+    def __init__(self):
+        self.latency = Histogram(
+            "http_request_duration_seconds",
+            "Request latency by route.",
+            ("method", "route", "status"),
+            LATENCY_BUCKETS,
+        )
+        self.response_size = Histogram(
+            "http_response_size_bytes",
+            "Response body size by route.",
+            ("method", "route", "status"),
+            SIZE_BUCKETS,
+        )
+        self.in_flight = 0
+        self.startup = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Times a startup phase: ``with metrics.phase("cluster_store"): ...``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup[name] = time.perf_counter() - start
+
+    def render(self):
+        lines = self.latency.render() + self.response_size.render()
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP app_startup_phase_seconds Time spent in each startup phase.",
+            "# TYPE app_startup_phase_seconds gauge",
+        ]
+        for name, seconds in self.startup.items():
+            lines.append(f"app_startup_phase_seconds{{{format_labels([('phase', name)])}}} {seconds:.6f}")
+        memory = process_memory()
+        if memory:
+            # shared pages are the memory-mapped artifacts other workers also use
+            lines += [
+                "# HELP process_memory_bytes Memory of this worker by kind (rss, pss, shared, private).",
+                "# TYPE process_memory_bytes gauge",
+            ]
+            for kind, value in memory.items():
+                lines.append(f"process_memory_bytes{{{format_labels([('kind', kind)])}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def iter_routes(routes):
+    for route in routes:
+        # newer FastAPI versions wrap included routers instead of copying routes
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from iter_routes(included.routes)
+        else:
+            yield route
+
+
+def route_template(app, scope):
+    """The matched route's path template, so ids don't explode label sets."""
+    route = scope.get("route")
+    if route is None:
+        # answered before routing (e.g. by the response cache)
+        path, method = scope["path"], scope["method"]
+        for candidate in iter_routes(app.router.routes):
+            regex, methods = getattr(candidate, "path_regex", None), getattr(candidate, "methods", None)
+            if regex is not None and regex.match(path) and (not methods or method in methods):
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware, so streamed bodies are counted as they are sent.
+    Reads the ``Metrics`` instance from ``app.state.metrics``; ``exclude``
+    lists paths that are not recorded (the scrape endpoint itself).
+    """
+
+    def __init__(self, app, exclude=("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            return await self.app(scope, receive, send)
+
+        metrics = scope["app"].state.metrics
+        status, size = [500], [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.in_flight -= 1
+            labels = (scope["method"], route_template(scope["app"], scope), str(status[0]))
+            metrics.latency.observe(labels, elapsed)
+            metrics.response_size.observe(labels, size[0])
@@ -0,0 +1,308 @@
+"""
+Positional inverted index over the OCR text of the dataset rows.
+
+Postings are stored per term as three varint-encoded, delta-compressed
+streams: the rows containing the term, the number of occurrences in each
+row, and the token positions within each row. Terms are kept sorted so a
+term lookup is a binary search and a prefix query is a contiguous range.
+Everything is saved as ``.npy`` files and memory-mapped when loaded.
+"""
+import os
+import re
+import numpy as np
+
+from core.cluster_store import StringTable
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+MAX_POSITION = np.iinfo(np.uint16).max
+# A prefix query matching more terms than this (e.g. "h*") is refused: its
+# postings would cover most of the dataset and take a request's worth of CPU
+MAX_PREFIX_TERMS = 10_000
+ARRAYS = (
+    "terms_blob",
+    "terms_offsets",
+    "df",
+    "rows",
+    "rows_offsets",
+    "counts",
+    "counts_offsets",
+    "positions",
+    "positions_offsets",
+)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def varint_encode(values):
+    """LEB128-encode a uint64 array; returns (uint8 bytes, bytes per value)."""
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        n_bytes += remaining > 0
+        remaining >>= np.uint64(7)
+
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    starts = np.cumsum(n_bytes) - n_bytes
+    for k in range(int(n_bytes.max(initial=0))):
+        has = n_bytes > k
+        chunk = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (n_bytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has] + k] = (chunk | more).astype(np.uint8)
+    return out, n_bytes
+
+
+def varint_decode(buf):
+    """Inverse of ``varint_encode``."""
+    buf = np.asarray(buf, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    parts = (buf & 0x7F).astype(np.uint64) << (7 * shift).astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+def _segment_starts(*keys):
+    """Boolean mask of the first element of every run of equal ``keys``."""
+    first = np.ones(len(keys[0]), dtype=bool)
+    if len(first):
+        change = np.zeros(len(first) - 1, dtype=bool)
+        for key in keys:
+            change |= key[1:] != key[:-1]
+        first[1:] = change
+    return first
+
+
+def _segment_delta(values, first):
+    """Delta-encode ``values``, restarting at every segment start."""
+    delta = np.empty_like(values)
+    if len(values):
+        delta[0] = values[0]
+        delta[1:] = values[1:] - values[:-1]
+        delta[first] = values[first]
+    return delta
+
+
+def _stream(values, segment_of, n_segments):
+    """Varint-encode ``values`` and return per-segment byte offsets."""
+    blob, n_bytes = varint_encode(values)
+    offsets = np.zeros(n_segments + 1, dtype=np.int64)
+    np.add.at(offsets, segment_of + 1, n_bytes)
+    return blob, np.cumsum(offsets)
+
+
+def build_ocr_index(texts, output_dir, chunk_tokens=10_000_000):
+    """
+    Indexes ``texts`` (one OCR string per dataset row, in row order) into
+    ``output_dir`` and returns the number of distinct terms.
+
+    Only the first 65536 tokens of a row are indexed so positions fit in
+    uint16. Tokens are buffered in Python lists and packed into NumPy arrays
+    every ``chunk_tokens`` tokens to bound memory.
+    """
+    vocab = {}
+    chunks = []
+    term_ids, rows, positions = [], [], []
+
+    def flush():
+        if term_ids:
+            chunks.append(
+                (
+                    np.array(term_ids, dtype=np.uint32),
+                    np.array(rows, dtype=np.uint32),
+                    np.array(positions, dtype=np.uint16),
+                )
+            )
+            term_ids.clear(), rows.clear(), positions.clear()
+
+    for row, text in enumerate(texts):
+        for position, token in enumerate(tokenize(text)[: MAX_POSITION + 1]):
+            term_ids.append(vocab.setdefault(token, len(vocab)))
+            rows.append(row)
+            positions.append(position)
+        if len(term_ids) >= chunk_tokens:
+            flush()
+    flush()
+
+    # Renumber terms alphabetically so term ids double as sorted positions
+    terms = sorted(vocab)
+    remap = np.empty(len(vocab), dtype=np.uint32)
+    remap[[vocab[t] for t in terms]] = np.arange(len(terms), dtype=np.uint32)
+    del vocab
+
+    term = remap[np.concatenate([c[0] for c in chunks])] if chunks else np.zeros(0, np.uint32)
+    row = np.concatenate([c[1] for c in chunks]) if chunks else np.zeros(0, np.uint32)
+    position = np.concatenate([c[2] for c in chunks]) if chunks else np.zeros(0, np.uint16)
+    del chunks
+    # Rows are already ascending, so a stable sort by term keeps row order
+    order = np.argsort(term, kind="stable")
+    term, row, position = term[order], row[order], position[order]
+    del order
+
+    n_terms = len(terms)
+    posting_start = _segment_starts(term, row)
+    posting_term = term[posting_start]
+    posting_row = row[posting_start]
+    posting_index = np.cumsum(posting_start) - 1
+    counts = np.bincount(posting_index, minlength=len(posting_row))
+    term_start = _segment_starts(posting_term)
+
+    arrays = {}
+    strings = StringTable.from_strings(terms)
+    arrays["terms_blob"], arrays["terms_offsets"] = strings.blob, strings.offsets
+    arrays["df"] = np.bincount(posting_term, minlength=n_terms).astype(np.uint32)
+    arrays["rows"], arrays["rows_offsets"] = _stream(
+        _segment_delta(posting_row.astype(np.int64), term_start), posting_term, n_terms
+    )
+    arrays["counts"], arrays["counts_offsets"] = _stream(counts, posting_term, n_terms)
+    arrays["positions"], arrays["positions_offsets"] = _stream(
+        _segment_delta(position.astype(np.int64), posting_start), term, n_terms
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_dir, f"ocr_index.{name}.npy"), arrays[name])
+    return n_terms
+
+
+class OCRIndex:
+    """
+    Read-only query interface over an index written by ``build_ocr_index``.
+
+    ``search`` accepts a small query language: whitespace-separated terms are
+    ANDed, ``OR`` separates alternatives, ``"double quotes"`` make a phrase and
+    a trailing ``*`` matches every term with that prefix (at most
+    ``MAX_PREFIX_TERMS`` of them; broader prefixes raise ValueError). Results
+    are sorted arrays of dataset rows.
+    """
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.terms = StringTable(self.terms_blob, self.terms_offsets)
+
+    @classmethod
+    def load(cls, index_dir):
+        return cls(
+            {
+                name: np.load(
+                    os.path.join(index_dir, f"ocr_index.{name}.npy"), mmap_mode="r"
+                )
+                for name in ARRAYS
+            }
+        )
+
+    def __len__(self):
+        return len(self.terms)
+
+    def term_id(self, term):
+        return self.terms.find(term)
+
+    def _decode(self, blob, offsets, term_id):
+        return varint_decode(blob[offsets[term_id] : offsets[term_id + 1]])
+
+    def postings(self, term_id):
+        """Sorted rows containing term ``term_id``."""
+        return np.cumsum(self._decode(self.rows, self.rows_offsets, term_id)).astype(
+            np.int64
+        )
+
+    def occurrences(self, term_id):
+        """``row << 16 | position`` for every occurrence of ``term_id``."""
+        rows = self.postings(term_id)
+        counts = self._decode(self.counts, self.counts_offsets, term_id).astype(np.int64)
+        deltas = self._decode(self.positions, self.positions_offsets, term_id).astype(
+            np.int64
+        )
+        # Positions restart at every row: undo the delta within each run
+        starts = np.cumsum(counts) - counts
+        positions = np.cumsum(deltas)
+        positions -= np.repeat(positions[starts] - deltas[starts], counts)
+        return (np.repeat(rows, counts) << 16) | positions
+
+    def _bisect(self, key, lo=0):
+        """First term id at or after ``lo`` whose ``key(term)`` is not False."""
+        hi = len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(self.terms[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def prefix_range(self, prefix):
+        """Term ids ``[lo, hi)`` of every term starting with ``prefix``."""
+        lo = self._bisect(lambda term: term >= prefix)
+        hi = self._bisect(lambda term: term[: len(prefix)] > prefix, lo)
+        return lo, hi
+
+    def postings_range(self, lo, hi):
+        """Sorted distinct rows containing any of the terms ``[lo, hi)``."""
+        # the terms' row streams are contiguous, so decode them in one go and
+        # undo the deltas, which restart at every term
+        deltas = varint_decode(self.rows[self.rows_offsets[lo] : self.rows_offsets[hi]]).astype(np.int64)
+        df = np.asarray(self.df[lo:hi], dtype=np.int64)
+        starts = np.cumsum(df) - df
+        rows = np.cumsum(deltas)
+        rows -= np.repeat(rows[starts] - deltas[starts], df)
+        return np.unique(rows)
+
+    def term(self, token):
+        if token.endswith("*"):
+            prefix = token[:-1].lower()
+            lo, hi = self.prefix_range(prefix)
+            if hi - lo > MAX_PREFIX_TERMS:
+                raise ValueError(
+                    f"'{prefix}*' matches {hi - lo} terms (at most {MAX_PREFIX_TERMS}); use a longer prefix"
+                )
+            if lo == hi:
+                return np.zeros(0, dtype=np.int64)
+            return self.postings_range(lo, hi)
+        term_id = self.term_id(token.lower())
+        return self.postings(term_id) if term_id >= 0 else np.zeros(0, dtype=np.int64)
+
+    def phrase(self, text):
+        tokens = tokenize(text)
+        if len(tokens) == 1:
+            return self.term(tokens[0])
+        term_ids = [self.term_id(token) for token in tokens]
+        if not tokens or min(term_ids) < 0:
+            return np.zeros(0, dtype=np.int64)
+        # Start from the rarest term and shift every occurrence back to the
+        # position the phrase would start at
+        order = sorted(range(len(tokens)), key=lambda i: self.df[term_ids[i]])
+        hits = self.occurrences(term_ids[order[0]]) - order[0]
+        for i in order[1:]:
+            if not len(hits):
+                break
+            hits = np.intersect1d(hits, self.occurrences(term_ids[i]) - i, assume_unique=True)
+        return np.unique(hits >> 16)
+
+    def search(self, query):
+        result = None
+        for clause in re.split(r"\s+OR\s+", query.strip()):
+            rows = self._and(clause)
+            result = rows if result is None else np.union1d(result, rows)
+        return result if result is not None else np.zeros(0, dtype=np.int64)
+
+    def _and(self, clause):
+        sets = []
+        for quoted, bare in re.findall(r'"([^"]*)"|(\S+)', clause):
+            if bare.endswith("*"):
+                sets.append(self.term(bare))
+            elif tokenize(quoted or bare):
+                # Bare words that tokenize to several terms (e.g. "base-ball")
+                # are treated as phrases too
+                sets.append(self.phrase(quoted or bare))
+        if not sets:
+            return np.zeros(0, dtype=np.int64)
+        sets.sort(key=len)
+        rows = sets[0]
+        for other in sets[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
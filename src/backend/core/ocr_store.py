@@ -0,0 +1,256 @@
+"""
+Compressed, memory-mapped store of the OCR text of every dataset row.
+
+Rows are grouped into blocks of ``ROWS_PER_BLOCK`` consecutive rows, and
+each block is compressed on its own with a dictionary trained on a sample
+of the text, so small blocks still compress well. Row ``i`` lives in block
+``i // ROWS_PER_BLOCK``. Its position inside the decompressed block comes
+from an offset table of uncompressed positions, so a lookup is two array
+reads and at most one block decompression. The most recently decompressed
+blocks are kept in an LRU bounded by bytes.
+
+Blocks are compressed with zstd when the optional ``zstandard`` package is
+installed, otherwise with zlib (raw deflate) and a preset dictionary made of
+the most valuable words of the sample. The codec is recorded in
+``ocr_store.json``, so a store only needs the package it was built with.
+"""
+import json
+import os
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from core.cache import LRUCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARRAYS = ("blocks", "block_offsets", "offsets", "dictionary")
+META_FILE = "ocr_store.json"
+ROWS_PER_BLOCK = 32
+TRAIN_ROWS = 20_000
+# zlib can only refer back 32 KiB, so a larger preset dictionary is wasted
+DICTIONARY_BYTES = {"zstd": 112 * 1024, "zlib": 32 * 1024}
+LEVELS = {"zstd": 19, "zlib": 9}
+COPY_BYTES = 64 * 1024 * 1024
+
+
+def train_dictionary(codec, samples, size=None):
+    """A preset dictionary for ``codec`` from a list of encoded texts."""
+    size = size or DICTIONARY_BYTES[codec]
+    if codec == "zstd":
+        try:
+            return zstandard.train_dictionary(size, [s for s in samples if s]).as_bytes()
+        except zstandard.ZstdError:
+            # too few samples to train on
+            return b""
+    # words worth the most bytes, most valuable last so they sit closest
+    # to the data and get the shortest back-references
+    counts = Counter(word for text in samples for word in text.split())
+    words, total = [], 0
+    for word, count in sorted(counts.items(), key=lambda wc: -wc[1] * len(wc[0])):
+        if count < 2 or total + len(word) + 1 > size:
+            break
+        words.append(word)
+        total += len(word) + 1
+    return b" ".join(reversed(words))
+
+
+def compressor(codec, dictionary, level=None):
+    """``compress(bytes) -> bytes`` for one block."""
+    level = level or LEVELS[codec]
+    if codec == "zstd":
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=level, dict_data=dict_data).compress
+
+    def compress(data):
+        compress_obj = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+        return compress_obj.compress(data) + compress_obj.flush()
+
+    return compress
+
+
+def decompressor(codec, dictionary):
+    """``decompress(bytes) -> bytes`` for one block; safe to share between threads."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("This OCR store was compressed with zstd; install zstandard to read it")
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        local = threading.local()
+
+        def decompress(data):
+            if not hasattr(local, "decompressor"):
+                local.decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return local.decompressor.decompress(data)
+
+        return decompress
+
+    def decompress(data):
+        decompress_obj = zlib.decompressobj(-15, zdict=dictionary)
+        return decompress_obj.decompress(data) + decompress_obj.flush()
+
+    return decompress
+
+
+class OCRStoreWriter:
+    """
+    Streams texts into ``ocr_store.*`` files: ``add`` batches of texts in row
+    order, then ``close``. The first ``train_rows`` texts train the
+    dictionary; after that, blocks are compressed and written as they fill.
+    """
+
+    def __init__(
+        self, output_dir, codec=None, rows_per_block=ROWS_PER_BLOCK, train_rows=TRAIN_ROWS, level=None
+    ):
+        self.output_dir = output_dir
+        self.codec = codec or ("zstd" if zstandard is not None else "zlib")
+        self.rows_per_block = rows_per_block
+        self.train_rows = train_rows
+        self.level = level
+        self.dictionary = None
+        self.compress = None
+        self.pending = []
+        self.lengths = []
+        self.block_sizes = []
+        os.makedirs(output_dir, exist_ok=True)
+        if os.path.exists(os.path.join(output_dir, META_FILE)):
+            os.remove(os.path.join(output_dir, META_FILE))
+        self.tmp_path = os.path.join(output_dir, "ocr_store.blocks.tmp")
+        self.tmp = open(self.tmp_path, "wb")
+
+    def add(self, texts):
+        encoded = [(text or "").encode("utf-8") for text in texts]
+        self.pending.extend(encoded)
+        self.lengths.append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        if self.compress is None and len(self.pending) >= self.train_rows:
+            self._train()
+        if self.compress is not None:
+            self._flush(len(self.pending) // self.rows_per_block * self.rows_per_block)
+
+    def _train(self):
+        self.dictionary = train_dictionary(self.codec, self.pending[: self.train_rows])
+        self.compress = compressor(self.codec, self.dictionary, self.level)
+
+    def _flush(self, n_rows):
+        for start in range(0, n_rows, self.rows_per_block):
+            data = self.compress(b"".join(self.pending[start : start + self.rows_per_block]))
+            self.tmp.write(data)
+            self.block_sizes.append(len(data))
+        del self.pending[:n_rows]
+
+    def close(self):
+        """Writes the arrays and ``ocr_store.json``; returns the metadata."""
+        if self.compress is None:
+            self._train()
+        self._flush(len(self.pending))
+        self.tmp.close()
+
+        lengths = np.concatenate(self.lengths) if self.lengths else np.zeros(0, np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        block_offsets = np.zeros(len(self.block_sizes) + 1, dtype=np.int64)
+        np.cumsum(self.block_sizes, out=block_offsets[1:])
+
+        # copy the compressed blocks into an .npy without holding them in memory
+        blocks_path = os.path.join(self.output_dir, "ocr_store.blocks.npy")
+        blocks = np.lib.format.open_memmap(blocks_path, mode="w+", dtype=np.uint8, shape=(int(block_offsets[-1]),))
+        with open(self.tmp_path, "rb") as f:
+            for start in range(0, len(blocks), COPY_BYTES):
+                chunk = f.read(COPY_BYTES)
+                blocks[start : start + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+        blocks.flush()
+        del blocks
+        os.remove(self.tmp_path)
+
+        np.save(os.path.join(self.output_dir, "ocr_store.block_offsets.npy"), block_offsets)
+        np.save(os.path.join(self.output_dir, "ocr_store.offsets.npy"), offsets)
+        dictionary = np.frombuffer(self.dictionary, dtype=np.uint8)
+        np.save(os.path.join(self.output_dir, "ocr_store.dictionary.npy"), dictionary)
+        meta = {
+            "codec": self.codec,
+            "rows": len(lengths),
+            "rows_per_block": self.rows_per_block,
+            "raw_bytes": int(offsets[-1]),
+            "compressed_bytes": int(block_offsets[-1]),
+            "dictionary_bytes": len(self.dictionary),
+        }
+        # written last, so a partial build is never loaded
+        with open(os.path.join(self.output_dir, META_FILE), "w") as f:
+            json.dump(meta, f)
+        return meta
+
+
+def build_ocr_store(texts, output_dir, **options):
+    """Writes ``ocr_store.*`` from an iterable of texts in row order; returns the metadata."""
+    writer = OCRStoreWriter(output_dir, **options)
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == 10_000:
+            writer.add(batch)
+            batch = []
+    writer.add(batch)
+    return writer.close()
+
+
+class OCRStore:
+    def __init__(self, arrays, meta, cache_bytes=16 * 1024 * 1024):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.rows_per_block = meta["rows_per_block"]
+        self.decompress = decompressor(meta["codec"], bytes(self.dictionary))
+        self.cache = LRUCache(cache_bytes)
+
+    @classmethod
+    def load(cls, index_dir, cache_bytes=16 * 1024 * 1024):
+        with open(os.path.join(index_dir, META_FILE), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"ocr_store.{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        return cls(arrays, meta, cache_bytes)
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(os.path.join(index_dir, META_FILE))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def block(self, b):
+        """The decompressed bytes of block ``b``, through the LRU."""
+        data = self.cache.get(b)
+        if data is None:
+            data = self.decompress(bytes(self.blocks[self.block_offsets[b] : self.block_offsets[b + 1]]))
+            self.cache.set(b, data)
+        return data
+
+    def __getitem__(self, row):
+        row = int(row)
+        if not 0 <= row < len(self):
+            raise IndexError(f"OCR row {row} out of range")
+        b = row // self.rows_per_block
+        base = int(self.offsets[b * self.rows_per_block])
+        start, end = int(self.offsets[row]) - base, int(self.offsets[row + 1]) - base
+        return str(self.block(b)[start:end], "utf-8")
+
+    def take(self, rows):
+        """Texts of many rows; rows sharing a block decompress it once."""
+        return [self[row] for row in np.asarray(rows, dtype=np.int64).tolist()]
+
+    def stats(self):
+        raw, compressed = self.meta["raw_bytes"], self.meta["compressed_bytes"]
+        return {
+            "codec": self.meta["codec"],
+            "rows": len(self),
+            "raw_bytes": raw,
+            "compressed_bytes": compressed,
+            "ratio": raw / compressed if compressed else 0.0,
+            "blocks": self.cache.stats(),
+        }
@@ -0,0 +1,219 @@
+"""
+Perceptual hashes of the downloaded images and a Hamming-distance index.
+
+Every image gets two 64-bit hashes: a dHash (signs of horizontal gradients
+on a 9x8 thumbnail) and a pHash (signs of the 8x8 lowest DCT frequencies of
+a 32x32 thumbnail against their median). Reprints of the same photograph
+land a few bits apart, unrelated images about 32 bits apart.
+
+``PerceptualIndex`` answers "which images are within ``r`` bits of this
+hash" by multi-index hashing. The 64 bits are split into four 16-bit
+chunks, and any code within ``r`` bits of the query matches at least one
+chunk within ``r // 4`` bits. Each chunk has a sorted copy, so candidates
+are a few binary searches away and only they are compared in full.
+"""
+import os
+from itertools import combinations
+
+import numpy as np
+
+from core.cluster_store import StringTable
+
+ARRAYS = ("codes", "dhash", "chunk_order", "chunk_sorted", "paths_blob", "paths_offsets")
+N_CHUNKS = 4
+CHUNK_BITS = 16
+DCT_SIZE = 32
+HASH_SIDE = 8
+
+# first HASH_SIDE rows of the orthonormal DCT-II matrix
+_k, _n = np.meshgrid(np.arange(HASH_SIDE), np.arange(DCT_SIZE), indexing="ij")
+DCT = (np.cos(np.pi * (2 * _n + 1) * _k / (2 * DCT_SIZE)) * np.sqrt(2 / DCT_SIZE)).astype(np.float32)
+DCT[0] /= np.sqrt(2)
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x):
+    """Set bits of every uint64 in ``x``."""
+    x = np.asarray(x, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x).astype(np.int64)
+    return POPCOUNT8[x.view(np.uint8)].reshape(*x.shape, 8).sum(-1, dtype=np.int64)
+
+
+def hamming(a, b):
+    """Bit distances between (broadcast) arrays of uint64 hashes."""
+    return popcount(np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64)))
+
+
+def _pack(bits):
+    """(n, 64) booleans -> n uint64, first bit most significant."""
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def dhash(thumbnails):
+    """dHashes of ``(n, 8, 9)`` grayscale thumbnails."""
+    thumbnails = np.asarray(thumbnails, dtype=np.float32)
+    return _pack((thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(len(thumbnails), -1))
+
+
+def phash(thumbnails):
+    """pHashes of ``(n, 32, 32)`` grayscale thumbnails."""
+    thumbnails = np.asarray(thumbnails, dtype=np.float32)
+    coefficients = (DCT @ thumbnails @ DCT.T).reshape(len(thumbnails), -1)
+    # the DC term only measures brightness, so it is left out of the median
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return _pack(coefficients > median)
+
+
+def thumbnails(source):
+    """
+    The ``(32, 32)`` and ``(8, 9)`` grayscale thumbnails of an image file or
+    file-like object. JPEGs are decoded at a reduced scale (``draft``), which
+    is most of the time saved over a full decode. Raises ``OSError`` or
+    ``ValueError`` for anything that isn't a readable image.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(source) as image:
+            image.draft("L", (DCT_SIZE * 2, DCT_SIZE * 2))
+            gray = image.convert("L")
+    except Image.DecompressionBombError as e:
+        raise ValueError(str(e))
+    large = gray.resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR)
+    small = gray.resize((HASH_SIDE + 1, HASH_SIDE), Image.BILINEAR)
+    return np.asarray(large, dtype=np.float32), np.asarray(small, dtype=np.float32)
+
+
+def hash_image(source):
+    """``(dhash, phash)`` of one image file or file-like object."""
+    large, small = thumbnails(source)
+    return dhash(small[None])[0], phash(large[None])[0]
+
+
+def hash_images(sources):
+    """
+    ``(dhash, phash, ok)`` for a list of image files. Files that can't be
+    decoded have ``ok`` False and zero hashes.
+    """
+    large = np.zeros((len(sources), DCT_SIZE, DCT_SIZE), dtype=np.float32)
+    small = np.zeros((len(sources), HASH_SIDE, HASH_SIDE + 1), dtype=np.float32)
+    ok = np.zeros(len(sources), dtype=bool)
+    for i, source in enumerate(sources):
+        try:
+            large[i], small[i] = thumbnails(source)
+            ok[i] = True
+        except (OSError, ValueError):
+            continue
+    d, p = dhash(small), phash(large)
+    d[~ok] = p[~ok] = 0
+    return d, p, ok
+
+
+def _chunks(codes):
+    """(N_CHUNKS, n) uint16 chunks of ``codes``, most significant first."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    shifts = np.arange(N_CHUNKS - 1, -1, -1, dtype=np.uint64) * np.uint64(CHUNK_BITS)
+    return ((codes[None, :] >> shifts[:, None]) & np.uint64(0xFFFF)).astype(np.uint16)
+
+
+def _flip_masks(max_bits):
+    """Every 16-bit mask with at most ``max_bits`` bits set."""
+    masks = [0]
+    for n_bits in range(1, max_bits + 1):
+        masks.extend(sum(1 << b for b in bits) for bits in combinations(range(CHUNK_BITS), n_bits))
+    return np.array(masks, dtype=np.uint16)
+
+
+def index_arrays(filepaths, phashes, dhashes):
+    """
+    The arrays of a ``PerceptualIndex`` over the hashed images ``filepaths``.
+    Duplicate filepaths keep their last hash.
+    """
+    filepaths = list(filepaths)
+    # last occurrence wins: unique over the reversed list
+    reversed_order = np.arange(len(filepaths))[::-1]
+    _, first = np.unique(np.array(filepaths, dtype=object)[reversed_order], return_index=True)
+    keep = reversed_order[first]
+    paths = StringTable.from_strings([filepaths[i] for i in keep.tolist()])
+    codes = np.asarray(phashes, dtype=np.uint64)[keep]
+
+    chunks = _chunks(codes)
+    chunk_order = np.argsort(chunks, axis=1, kind="stable").astype(np.int32)
+    return {
+        "codes": codes,
+        "dhash": np.asarray(dhashes, dtype=np.uint64)[keep],
+        "chunk_order": chunk_order,
+        "chunk_sorted": np.take_along_axis(chunks, chunk_order, axis=1),
+        "paths_blob": paths.blob,
+        "paths_offsets": paths.offsets,
+    }
+
+
+def build_perceptual_index(filepaths, phashes, dhashes, output_dir):
+    """Writes ``phash_index.*.npy``; returns the number of images."""
+    arrays = index_arrays(filepaths, phashes, dhashes)
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_dir, f"phash_index.{name}.npy"), arrays[name])
+    return len(arrays["codes"])
+
+
+class PerceptualIndex:
+    def __init__(self, arrays):
+        for name in ("codes", "dhash", "chunk_order", "chunk_sorted"):
+            setattr(self, name, arrays[name])
+        self.paths = StringTable(arrays["paths_blob"], arrays["paths_offsets"])
+        self._masks = {}
+
+    @classmethod
+    def load(cls, index_dir):
+        return cls(
+            {
+                name: np.load(os.path.join(index_dir, f"phash_index.{name}.npy"), mmap_mode="r")
+                for name in ARRAYS
+            }
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def candidates(self, code, radius):
+        """Ids whose pHash may be within ``radius`` bits of ``code`` (a superset)."""
+        max_bits = radius // N_CHUNKS
+        if max_bits not in self._masks:
+            self._masks[max_bits] = _flip_masks(max_bits)
+        masks = self._masks[max_bits]
+
+        found = []
+        for j, chunk in enumerate(_chunks([code])[:, 0]):
+            keys = np.unique(chunk ^ masks)
+            lo = np.searchsorted(self.chunk_sorted[j], keys, "left")
+            hi = np.searchsorted(self.chunk_sorted[j], keys, "right")
+            sizes = hi - lo
+            if sizes.sum():
+                positions = np.repeat(hi - sizes.cumsum(), sizes) + np.arange(sizes.sum())
+                found.append(self.chunk_order[j][positions])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found)).astype(np.int64)
+
+    def search(self, code, radius=10, k=None):
+        """
+        ``(ids, distances)`` of the images within ``radius`` bits of the pHash
+        ``code``, nearest first (ties by id); at most ``k`` when given.
+        """
+        ids = self.candidates(code, radius)
+        distances = hamming(self.codes[ids], np.uint64(code))
+        keep = distances <= radius
+        ids, distances = ids[keep], distances[keep]
+        order = np.lexsort((ids, distances))[:k]
+        return ids[order], distances[order]
+
+    def filepaths(self, ids):
+        return self.paths.take(ids)
+
+    def lookup(self, filepath):
+        """The id of ``filepath``, or ``None`` if it was never hashed."""
+        i = self.paths.find(filepath)
+        return i if i >= 0 else None
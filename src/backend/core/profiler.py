@@ -0,0 +1,48 @@
+"""
+Sampling profiler for the live process.
+
+A background thread snapshots every other thread's stack with
+``sys._current_frames`` at a fixed interval and counts identical stacks.
+The result is in the collapsed ("folded") format read by flamegraph.pl,
+speedscope and most other flamegraph tools: one ``frame;frame;frame count``
+line per distinct stack, root first.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=0.01, exclude=()):
+    """
+    Samples all threads (except the sampler and ``exclude`` thread ids) for
+    ``seconds``. Returns ``(Counter of folded stacks, number of samples)``.
+    """
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    skip = set(exclude) | {threading.get_ident()}
+    stacks = Counter()
+    n_samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in skip:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame_label(frame))
+                frame = frame.f_back
+            frames.append(names.get(thread_id, f"thread-{thread_id}"))
+            stacks[";".join(reversed(frames))] += 1
+        n_samples += 1
+        time.sleep(interval)
+    return stacks, n_samples
+
+
+def collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,70 @@
+"""
+Fast JSON serialisation and content-encoding for large responses.
+
+Payloads are serialised with orjson (no ``jsonable_encoder`` pass) and
+compressed with brotli when the client accepts it and the package is
+installed, otherwise gzip. Very large batches can be streamed as NDJSON,
+one object per line, so the first results go out before the last are built.
+"""
+import gzip
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+NDJSON = "application/x-ndjson"
+
+
+def _accepts(header, value):
+    """
+    Whether an Accept-style ``header`` lists ``value`` with a non-zero
+    quality, e.g. ``gzip`` in ``"gzip;q=1.0, br;q=0"`` but not ``br``.
+    Wildcards don't count: they never select a non-default format.
+    """
+    for entry in header.split(","):
+        token, *params = entry.split(";")
+        if token.strip().lower() != value:
+            continue
+        for param in params:
+            name, _, q = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    return float(q) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def json_response(request: Request, payload, status_code=200):
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif _accepts(accept_encoding, "gzip"):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(body, status_code, headers, media_type="application/json")
+
+
+def wants_ndjson(request: Request, format=None):
+    return format == "ndjson" or _accepts(request.headers.get("accept", ""), NDJSON)
+
+
+def ndjson_response(items):
+    """Stream an iterable of JSON-serialisable objects as NDJSON."""
+
+    def lines():
+        for item in items:
+            yield orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON)
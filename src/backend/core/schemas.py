@@ -0,0 +1,13 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+from core.config import settings
+
+
+class BatchRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=settings.batch_max_ids)
+
+
+class FacetLabels(BaseModel):
+    positive: List[str] = Field([], max_length=settings.batch_max_ids)
+    negative: List[str] = Field([], max_length=settings.batch_max_ids)
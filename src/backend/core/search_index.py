@@ -0,0 +1,297 @@
+"""
+Precomputed filter structures for ``/search``.
+
+For every dataset row we keep its publication date (as ``YYYYMMDD``) and the
+ordinal of the cluster it belongs to. Rows are also kept sorted by date, with
+their clusters alongside, and each newspaper has a packed bitmap of its rows.
+A filtered query is then an intersection of row arrays, date ranges and bit
+tests, with no per-row Python work.
+
+Results are clusters ranked by the pagination key (hit count, then cluster
+ordinal). The ranking of every clustered row, which match-all queries
+without filters page through, is stored already sorted by that key, and a
+date range is a contiguous slice of the date-sorted clusters, so neither
+needs a per-request sort of rows.
+
+For ``/stats/histogram`` we also keep, per newspaper (plus a last row for
+all newspapers), prefix sums over months of the number of images, of
+clustered images ("reprints") and of clusters by the month and newspaper of
+their first appearance. The count for any month range is then a difference
+of two entries, whatever the number of rows.
+"""
+import calendar
+import datetime
+import os
+import numpy as np
+
+from core.cluster_store import StringTable
+
+ARRAYS = (
+    "row_dates",
+    "row_cluster",
+    "date_order",
+    "sorted_dates",
+    "date_clusters",
+    "ranked_keys",
+    "ranked_clusters",
+    "ranked_hits",
+    "newspaper_bitmaps",
+    "lccns_blob",
+    "lccns_offsets",
+    "titles_blob",
+    "titles_offsets",
+    "cluster_ids_blob",
+    "cluster_ids_offsets",
+    "histogram_first_month",
+    "histogram_images",
+    "histogram_reprints",
+    "histogram_clusters",
+)
+HISTOGRAM_KINDS = ("images", "reprints", "clusters")
+
+
+def parse_dates(pub_dates):
+    """Vectorised 'YYYY-MM-DD' -> int32 YYYYMMDD; unparseable dates become 0."""
+    raw = np.asarray(pub_dates, dtype="U10")
+    digits = np.char.replace(raw, "-", "")
+    valid = np.char.isdigit(digits) & (np.char.str_len(digits) == 8)
+    return np.where(valid, digits, "0").astype(np.int32)
+
+
+def parse_date_bound(value, end=False):
+    """'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' -> inclusive YYYYMMDD bound."""
+    parts = value.split("-")
+    if not 1 <= len(parts) <= 3 or not all(p.isdigit() for p in parts):
+        raise ValueError(f"Invalid date: {value!r}")
+    year = int(parts[0])
+    month = int(parts[1]) if len(parts) > 1 else (12 if end else 1)
+    try:
+        day = int(parts[2]) if len(parts) > 2 else (calendar.monthrange(year, month)[1] if end else 1)
+        datetime.date(year, month, day)
+    except (ValueError, calendar.IllegalMonthError):
+        raise ValueError(f"Invalid date: {value!r}")
+    return year * 10000 + month * 100 + day
+
+
+def rank_clusters(row_clusters):
+    """
+    Groups rows by their cluster ordinals (-1 for unclustered rows, which are
+    skipped). Returns ``(keys, clusters, hits)`` sorted by descending hit
+    count then cluster ordinal; ``keys`` is the int64 sort key used for
+    cursors.
+    """
+    clusters, hits = np.unique(row_clusters, return_counts=True)
+    clustered = clusters >= 0
+    clusters, hits = clusters[clustered], hits[clustered]
+    keys = (np.int64(np.iinfo(np.int32).max) - hits.astype(np.int64)) << 32 | clusters
+    order = np.argsort(keys)
+    return keys[order], clusters[order], hits[order]
+
+
+def month_of(yyyymmdd):
+    """YYYYMMDD (scalar or array) -> months since year 0."""
+    return yyyymmdd // 10000 * 12 + yyyymmdd // 100 % 100 - 1
+
+
+def month_prefix_sums(months, newspapers, n_newspapers, n_months):
+    """
+    ``(n_newspapers + 1, n_months + 1)`` cumulative counts of the events at
+    relative ``months`` in ``newspapers``; the last row is all newspapers.
+    """
+    counts = np.zeros((n_newspapers + 1, n_months), dtype=np.int64)
+    counts[:n_newspapers] = np.bincount(
+        np.asarray(newspapers, dtype=np.int64) * n_months + months,
+        minlength=n_newspapers * n_months,
+    ).reshape(n_newspapers, n_months)
+    counts[n_newspapers] = counts[:n_newspapers].sum(axis=0)
+    prefix = np.zeros((n_newspapers + 1, n_months + 1), dtype=np.int64)
+    np.cumsum(counts, axis=1, out=prefix[:, 1:])
+    return prefix
+
+
+def build_search_index(pub_dates, lccns, titles, row_cluster, cluster_ids, output_dir):
+    """
+    Writes the search filter arrays to ``output_dir``.
+
+    ``pub_dates``, ``lccns`` and ``titles`` are dataset columns in row order;
+    ``row_cluster`` holds each row's ordinal in ``cluster_ids`` (or -1).
+    """
+    n_rows = len(row_cluster)
+    row_dates = parse_dates(pub_dates)
+    date_order = np.argsort(row_dates, kind="stable").astype(np.uint32)
+
+    lccn_codes, first_row, newspaper_of_row = np.unique(
+        np.asarray(lccns, dtype=str), return_index=True, return_inverse=True
+    )
+    titles = np.asarray(titles, dtype=object)[first_row]
+    bitmaps = np.zeros((len(lccn_codes), (n_rows + 7) // 8), dtype=np.uint8)
+    for newspaper in range(len(lccn_codes)):
+        bitmaps[newspaper] = np.packbits(newspaper_of_row == newspaper)
+
+    # monthly prefix sums for the histograms; rows without a date are left out
+    row_cluster = np.asarray(row_cluster, dtype=np.int32)
+    dated = np.flatnonzero(row_dates > 0)
+    dated_dates, dated_clusters = row_dates[dated], row_cluster[dated]
+    dated_newspapers = newspaper_of_row[dated]
+    months = month_of(dated_dates.astype(np.int64))
+    first_month = int(months.min()) if len(months) else 0
+    months -= first_month
+    n_months = int(months.max()) + 1 if len(months) else 0
+    clustered = np.flatnonzero(dated_clusters >= 0)
+    # a cluster's first appearance is its earliest dated row
+    order = clustered[np.lexsort((dated_dates[clustered], dated_clusters[clustered]))]
+    grouped = dated_clusters[order]
+    first = order[np.r_[True, grouped[1:] != grouped[:-1]]] if len(order) else order
+    histograms = {
+        "images": (months, dated_newspapers),
+        "reprints": (months[clustered], dated_newspapers[clustered]),
+        "clusters": (months[first], dated_newspapers[first]),
+    }
+    n_newspapers = len(lccn_codes)
+    ranked_keys, ranked_clusters, ranked_hits = rank_clusters(row_cluster)
+
+    arrays = {
+        "row_dates": row_dates,
+        "row_cluster": row_cluster,
+        "date_order": date_order,
+        "sorted_dates": row_dates[date_order],
+        "date_clusters": row_cluster[date_order],
+        "ranked_keys": ranked_keys,
+        "ranked_clusters": ranked_clusters,
+        "ranked_hits": ranked_hits,
+        "newspaper_bitmaps": bitmaps,
+        "histogram_first_month": np.array([first_month], dtype=np.int64),
+    }
+    for kind in HISTOGRAM_KINDS:
+        arrays[f"histogram_{kind}"] = month_prefix_sums(*histograms[kind], n_newspapers, n_months)
+    for name, strings in (
+        ("lccns", lccn_codes.tolist()),
+        ("titles", [str(t) for t in titles]),
+        ("cluster_ids", list(cluster_ids)),
+    ):
+        table = StringTable.from_strings(strings)
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = table.blob, table.offsets
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_dir, f"search_index.{name}.npy"), arrays[name])
+
+
+class SearchIndex:
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.lccns = StringTable(self.lccns_blob, self.lccns_offsets)
+        self.titles = StringTable(self.titles_blob, self.titles_offsets)
+        self.cluster_ids = StringTable(self.cluster_ids_blob, self.cluster_ids_offsets)
+        self._newspapers = {}
+        for i in range(len(self.lccns)):
+            self._newspapers[self.lccns[i].lower()] = i
+            self._newspapers.setdefault(self.titles[i].lower(), i)
+
+    @classmethod
+    def load(cls, index_dir):
+        return cls(
+            {
+                name: np.load(
+                    os.path.join(index_dir, f"search_index.{name}.npy"), mmap_mode="r"
+                )
+                for name in ARRAYS
+            }
+        )
+
+    def __len__(self):
+        return len(self.row_dates)
+
+    def newspaper_id(self, name):
+        """Newspaper ordinal for an LCCN or title (case-insensitive), or None."""
+        return self._newspapers.get(name.lower())
+
+    def date_range(self, start=None, end=None):
+        """``slice`` of the date-sorted arrays between ``start`` and ``end`` (YYYYMMDD)."""
+        lo = 0 if start is None else int(np.searchsorted(self.sorted_dates, start, "left"))
+        hi = (
+            len(self.sorted_dates)
+            if end is None
+            else int(np.searchsorted(self.sorted_dates, end, "right"))
+        )
+        return slice(lo, hi)
+
+    def rows_in_date_range(self, start=None, end=None):
+        """Rows published between ``start`` and ``end`` (YYYYMMDD), in date order."""
+        return self.date_order[self.date_range(start, end)].astype(np.int64)
+
+    def in_newspapers(self, rows, newspaper_ids):
+        """Mask of ``rows`` whose newspaper is one of ``newspaper_ids``."""
+        bitmap = np.bitwise_or.reduce(self.newspaper_bitmaps[list(newspaper_ids)], axis=0)
+        return ((bitmap[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+    def filter_rows(self, rows=None, newspaper_ids=None, start=None, end=None):
+        """
+        Intersects ``rows`` (``None`` for every row) with the date range and
+        newspapers, keeping only clustered rows.
+        """
+        if rows is None:
+            rows = self.rows_in_date_range(start, end)
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            if start is not None or end is not None:
+                dates = self.row_dates[rows]
+                keep = np.ones(len(rows), dtype=bool)
+                if start is not None:
+                    keep &= dates >= start
+                if end is not None:
+                    keep &= dates <= end
+                rows = rows[keep]
+        if newspaper_ids:
+            rows = rows[self.in_newspapers(rows, newspaper_ids)]
+        return rows[self.row_cluster[rows] >= 0]
+
+    def rank_clusters(self, rows):
+        """``rank_clusters`` of the clusters of ``rows``."""
+        return rank_clusters(self.row_cluster[rows])
+
+    def search_clusters(self, rows=None, newspaper_ids=None, start=None, end=None):
+        """
+        ``filter_rows`` then ``rank_clusters``, as ``(keys, clusters, hits,
+        n_images)``. Without ``rows`` or newspapers the stored ranking (no
+        date filter) or a slice of the date-sorted clusters is used instead
+        of gathering rows.
+        """
+        if rows is None and not newspaper_ids:
+            if start is None and end is None:
+                keys, clusters, hits = self.ranked_keys, self.ranked_clusters, self.ranked_hits
+            else:
+                keys, clusters, hits = rank_clusters(self.date_clusters[self.date_range(start, end)])
+            return keys, clusters, hits, int(hits.sum())
+        rows = self.filter_rows(rows, newspaper_ids, start, end)
+        return (*self.rank_clusters(rows), len(rows))
+
+    def histogram(self, kind="images", by="year", newspaper_ids=None, start=None, end=None):
+        """
+        Counts of ``kind`` (one of ``HISTOGRAM_KINDS``) per year or month,
+        summed over ``newspaper_ids`` (all newspapers if empty). ``start`` and
+        ``end`` are YYYYMMDD bounds, applied at month granularity. Returns
+        ``(labels, counts)``; each count is a difference of prefix sums.
+        """
+        prefix = getattr(self, f"histogram_{kind}")
+        first_month, n_months = int(self.histogram_first_month[0]), prefix.shape[1] - 1
+        lo = max(month_of(start) - first_month, 0) if start else 0
+        hi = min(month_of(end) - first_month + 1, n_months) if end else n_months
+        if lo >= hi:
+            return [], np.zeros(0, dtype=np.int64)
+
+        if by == "month":
+            edges = np.arange(lo, hi + 1)
+        else:
+            next_year = ((first_month + lo) // 12 + 1) * 12 - first_month
+            edges = np.r_[lo, np.arange(next_year, hi, 12), hi]
+        rows = list(newspaper_ids) if newspaper_ids else [prefix.shape[0] - 1]
+        counts = np.diff(prefix[rows][:, edges].sum(axis=0))
+
+        starts = first_month + edges[:-1]
+        if by == "month":
+            labels = [f"{m // 12:04d}-{m % 12 + 1:02d}" for m in starts.tolist()]
+        else:
+            labels = [f"{m // 12:04d}" for m in starts.tolist()]
+        return labels, counts
@@ -0,0 +1,188 @@
+"""
+Per-cluster summaries and dataset-wide statistics, computed once at build
+time so the API can serve them without aggregating per request.
+
+For every cluster we store its size, first and last publication date
+(YYYYMMDD), the distinct newspapers it appeared in (CSR over newspaper
+ordinals) and a representative image (the member with the highest
+detection confidence). Global statistics go to a small JSON sidecar.
+
+The timeline of a cluster is its membership re-sorted by publication date
+(then newspaper), stored in the same CSR layout as the cluster store with
+the date and newspaper of each entry alongside, so ``/cluster/{id}/timeline``
+is a slice rather than a sort.
+"""
+import json
+import os
+import numpy as np
+
+from core.cluster_store import StringTable
+from core.filepaths import parse_filepaths
+
+ARRAYS = (
+    "size",
+    "first_date",
+    "last_date",
+    "newspaper_offsets",
+    "newspapers",
+    "representative",
+    "timeline_members",
+    "timeline_dates",
+    "timeline_newspapers",
+    "cluster_ids_blob",
+    "cluster_ids_offsets",
+    "lccns_blob",
+    "lccns_offsets",
+    "titles_blob",
+    "titles_offsets",
+    "places_blob",
+    "places_offsets",
+)
+STATS_FILE = "summaries.stats.json"
+
+
+def build_summaries(store, titles_by_lccn, output_dir, places_by_lccn=None):
+    """
+    Summarises every cluster of ``store`` (a ClusterStore) into
+    ``output_dir``. ``titles_by_lccn`` and ``places_by_lccn`` map LCCNs to
+    newspaper titles and places of publication (from the metadata); unknown
+    LCCNs keep the LCCN as title and an empty place.
+    """
+    n_clusters = len(store)
+    table = parse_filepaths(store.paths)
+    if not table.valid.all():
+        bad = int(np.argmin(table.valid))
+        raise ValueError(f"{int((~table.valid).sum())} filepaths don't parse, e.g. {store.paths[bad]!r}")
+    dates, confidences = table.date, table.confidence
+    lccn_codes, newspaper_of_path = list(table.lccns), table.lccn
+
+    # everything below is indexed by membership, in CSR order
+    member_dates = dates[store.members]
+    member_newspapers = newspaper_of_path[store.members]
+    member_cluster = np.repeat(np.arange(n_clusters), np.diff(store.offsets))
+    size = np.diff(store.offsets).astype(np.int32)
+    starts = store.offsets[:-1]
+    nonempty = size > 0
+
+    first_date = np.zeros(n_clusters, dtype=np.int32)
+    last_date = np.zeros(n_clusters, dtype=np.int32)
+    if len(member_dates):
+        first_date[nonempty] = np.minimum.reduceat(member_dates, starts[nonempty])
+        last_date[nonempty] = np.maximum.reduceat(member_dates, starts[nonempty])
+
+    # distinct (cluster, newspaper) pairs, already grouped by cluster
+    pairs = np.unique(member_cluster.astype(np.int64) << 32 | member_newspapers)
+    pair_cluster = (pairs >> 32).astype(np.int64)
+    newspaper_offsets = np.zeros(n_clusters + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_cluster, minlength=n_clusters), out=newspaper_offsets[1:])
+
+    # representative: highest confidence, then earliest date
+    order = np.lexsort((member_dates, -confidences[store.members], member_cluster))
+    representative = np.full(n_clusters, -1, dtype=np.int32)
+    representative[nonempty] = store.members[order[starts[nonempty]]]
+
+    # timeline: each cluster's members by date, then newspaper
+    order = np.lexsort((store.members, member_newspapers, member_dates, member_cluster))
+
+    arrays = {
+        "size": size,
+        "first_date": first_date,
+        "last_date": last_date,
+        "newspaper_offsets": newspaper_offsets,
+        "newspapers": (pairs & 0xFFFFFFFF).astype(np.int32),
+        "representative": representative,
+        "timeline_members": store.members[order],
+        "timeline_dates": member_dates[order],
+        "timeline_newspapers": member_newspapers[order].astype(np.int32),
+    }
+    titles = [titles_by_lccn.get(lccn, lccn) for lccn in lccn_codes]
+    places = [(places_by_lccn or {}).get(lccn) or "" for lccn in lccn_codes]
+    for name, strings in (
+        ("cluster_ids", store.cluster_ids),
+        ("lccns", lccn_codes),
+        ("titles", titles),
+        ("places", places),
+    ):
+        table = StringTable.from_strings(strings)
+        arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = table.blob, table.offsets
+
+    stats = {
+        "dates": {
+            "first_year": int(dates.min()) // 10000 if len(dates) else None,
+            "last_year": int(dates.max()) // 10000 if len(dates) else None,
+        },
+        "clusters": n_clusters,
+        "images": int(store.n_images),
+        "newspapers": len(lccn_codes),
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(output_dir, f"summaries.{name}.npy"), arrays[name])
+    with open(os.path.join(output_dir, STATS_FILE), "w") as f:
+        json.dump(stats, f)
+    return stats
+
+
+def format_date(yyyymmdd):
+    yyyymmdd = int(yyyymmdd)
+    return f"{yyyymmdd // 10000:04d}-{yyyymmdd // 100 % 100:02d}-{yyyymmdd % 100:02d}"
+
+
+class ClusterSummaries:
+    def __init__(self, arrays, stats):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.stats = stats
+        self.cluster_ids = StringTable(self.cluster_ids_blob, self.cluster_ids_offsets)
+        self.lccns = StringTable(self.lccns_blob, self.lccns_offsets)
+        self.titles = StringTable(self.titles_blob, self.titles_offsets)
+        self.places = StringTable(self.places_blob, self.places_offsets)
+        # the timeline shares the cluster store's CSR layout
+        self.timeline_offsets = np.zeros(len(self.size) + 1, dtype=np.int64)
+        np.cumsum(self.size, out=self.timeline_offsets[1:])
+        self._index = {cluster_id: i for i, cluster_id in enumerate(self.cluster_ids)}
+
+    @classmethod
+    def load(cls, index_dir):
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"summaries.{name}.npy"), mmap_mode="r")
+            for name in ARRAYS
+        }
+        with open(os.path.join(index_dir, STATS_FILE), "r") as f:
+            stats = json.load(f)
+        return cls(arrays, stats)
+
+    def __len__(self):
+        return len(self.cluster_ids)
+
+    def __contains__(self, cluster_id):
+        return cluster_id in self._index
+
+    def get(self, cluster_id):
+        """Summary dict for ``cluster_id``, or None if it wasn't summarised."""
+        c = self._index.get(cluster_id)
+        if c is None:
+            return None
+        newspapers = self.newspapers[self.newspaper_offsets[c] : self.newspaper_offsets[c + 1]]
+        return {
+            "size": int(self.size[c]),
+            "first_date": format_date(self.first_date[c]),
+            "last_date": format_date(self.last_date[c]),
+            "newspapers": [
+                {"lccn": self.lccns[n], "title": self.titles[n]} for n in newspapers.tolist()
+            ],
+            "representative": int(self.representative[c]),
+        }
+
+    def timeline(self, cluster_id):
+        """
+        ``(path_ids, dates, newspapers)`` of a cluster's members in
+        publication order, or None if it wasn't summarised. Path ids index
+        the ClusterStore paths; newspapers index ``lccns``/``titles``/``places``.
+        """
+        c = self._index.get(cluster_id)
+        if c is None:
+            return None
+        members = slice(self.timeline_offsets[c], self.timeline_offsets[c + 1])
+        return self.timeline_members[members], self.timeline_dates[members], self.timeline_newspapers[members]
@@ -0,0 +1,154 @@
+"""
+On-disk thumbnail cache in front of the LoC IIIF servers.
+
+Files are named by the SHA-256 of the image id (not of their bytes, so the
+cache is keyed by id rather than content-addressed); a hit needs no dataset
+lookup and is served straight from disk. The cache is bounded by
+total bytes with least-recently-used eviction; recency survives restarts
+through file mtimes. Concurrent misses for the same image share a single
+upstream fetch, and the number of fetches in flight is capped. If the
+request doing that fetch is cancelled, the requests waiting on it retry.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+async def httpx_fetch(url):
+    """Default upstream: GET ``url`` with a shared httpx client."""
+    import httpx
+
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+    response = await _client.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+_client = None
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes, fetch=httpx_fetch, concurrency=4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = 0
+        self.upstream_errors = 0
+
+        # rebuild the LRU order from what is already on disk, oldest first
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = []
+        for root, _, names in os.walk(cache_dir):
+            for name in names:
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(root, name))
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+        self.entries = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self.size = sum(self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def path_for(self, image_id):
+        digest = hashlib.sha256(image_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest[2:]}.jpg")
+
+    def lookup(self, image_id):
+        """Path of the cached thumbnail (marking it recently used), or None."""
+        path = self.path_for(image_id)
+        with self.lock:
+            if path not in self.entries:
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.size -= self.entries.pop(path, 0)
+            return None
+        return path
+
+    def _store(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size += len(content) - self.entries.pop(path, 0)
+            self.entries[path] = len(content)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                evicted, size = self.entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
+
+    async def get(self, image_id, resolve_url):
+        """
+        Path of the thumbnail for ``image_id``, fetching it on a miss.
+        ``resolve_url`` is an async callable returning the upstream URL; it
+        is only awaited on a miss.
+        """
+        path = self.lookup(image_id)
+        if path is not None:
+            return path
+
+        future = self.pending.get(image_id)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the fetching request was cancelled, not this one: try again
+                if not future.cancelled():
+                    raise
+                return await self.get(image_id, resolve_url)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[image_id] = future
+        try:
+            async with self.semaphore:
+                content = await self.fetch(await resolve_url())
+            path = self.path_for(image_id)
+            await asyncio.to_thread(self._store, path, content)
+            future.set_result(path)
+            return path
+        except Exception as e:
+            self.upstream_errors += 1
+            future.set_exception(e)
+            # mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            # cancelled (client disconnect, timeout, shutdown): wake the waiters
+            if not future.done():
+                future.cancel()
+            del self.pending[image_id]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "upstream_errors": self.upstream_errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
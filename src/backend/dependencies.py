@@ -0,0 +1,120 @@
+import secrets
+import threading
+from typing import Optional
+from fastapi import Header, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from core.ann_index import ANNIndex
+from core.cluster_store import ClusterStore
+from core.config import settings
+from core.facet_cache import FacetCache
+from core.facet_learner import FacetLearner
+from core.filepath_index import FilepathIndex
+from core.iiif import PageDimensions
+from core.phash import PerceptualIndex
+from core.search_index import SearchIndex
+from core.summaries import ClusterSummaries
+from core.thumbnails import ThumbnailCache
+
+_dataset_lock = threading.Lock()
+
+
+def get_cluster_store(request: Request) -> ClusterStore:
+    return request.app.state.cluster_store
+
+
+def get_cluster_summaries(request: Request) -> Optional[ClusterSummaries]:
+    return request.app.state.cluster_summaries
+
+
+def get_filepath_index(request: Request) -> FilepathIndex:
+    index = request.app.state.filepath_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Filepath index not built")
+    return index
+
+
+def get_page_dimensions(request: Request) -> PageDimensions:
+    return request.app.state.page_dimensions
+
+
+def get_search_index(request: Request) -> SearchIndex:
+    index = request.app.state.search_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Search index not built")
+    return index
+
+
+def get_facet_learner(request: Request) -> FacetLearner:
+    learner = request.app.state.facet_learner
+    if learner is None:
+        raise HTTPException(status_code=503, detail="Embeddings not available")
+    return learner
+
+
+def get_facet_cache(request: Request) -> FacetCache:
+    cache = request.app.state.facet_cache
+    if cache is None:
+        raise HTTPException(status_code=503, detail="Embeddings not available")
+    return cache
+
+
+def get_ann_index(request: Request) -> ANNIndex:
+    index = request.app.state.ann_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Nearest-neighbour index not built")
+    return index
+
+
+def get_perceptual_index(request: Request) -> PerceptualIndex:
+    index = request.app.state.perceptual_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Perceptual hash index not built")
+    return index
+
+
+def get_thumbnail_cache(request: Request) -> ThumbnailCache:
+    return request.app.state.thumbnail_cache
+
+
+def thumbnail_source(request: Request, image_id: str):
+    """Async callable resolving the upstream IIIF url of ``image_id``."""
+
+    async def resolve():
+        index = request.app.state.filepath_index
+        row = index.lookup(image_id) if index is not None else None
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+        item = await run_in_threadpool(lambda: get_dataset(request)[row])
+        return item["prediction_section_iiif_url"]
+
+    return resolve
+
+
+def get_dataset(request: Request):
+    """
+    The served dataset columns: the metadata snapshot when it is built,
+    otherwise the Newspaper Navigator split, opened lazily on first use.
+
+    Both are memory-mapped, so rows are only materialised when indexed.
+    ``datasets`` is only imported on the fallback path.
+    """
+    with _dataset_lock:
+        if request.app.state.dataset is None:
+            from datasets import load_dataset
+
+            request.app.state.dataset = load_dataset(
+                settings.dataset_name, settings.dataset_config, split="train"
+            )
+    return request.app.state.dataset
+
+
+def require_admin(x_admin_token: str = Header("")):
+    """
+    Gate for admin endpoints: they don't exist unless ``ADMIN_TOKEN`` is
+    set, and need it in the ``X-Admin-Token`` header when it is.
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token.encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -1,33 +1,149 @@
+import time
+
+IMPORT_START = time.perf_counter()
+
+import os
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from datasets import load_dataset
-from routers import dataset, clusters, images, search
+from routers import dataset, clusters, images, search, stats, facets, cache, metrics, admin
 from core.config import settings
+from core.ann_index import ANNIndex
+from core.cache import CacheMiddleware, ResponseCache, make_backend, snapshot_version
+from core.cluster_store import ClusterStore
+from core.facet_cache import FacetCache
+from core.facet_learner import FacetLearner
+from core.filepath_index import FilepathIndex
+from core.iiif import PageDimensions, fetch_info_json
+from core.metadata_store import MetadataStore
+from core.metrics import Metrics, MetricsMiddleware
+from core.ocr_index import OCRIndex
+from core.phash import PerceptualIndex
+from core.search_index import SearchIndex
+from core.summaries import ClusterSummaries
+from core.thumbnails import ThumbnailCache
+
+
+def load_artifact(loader, name):
+    """Memory-map an artifact from scripts/build_artifacts.py, if it exists."""
+    try:
+        artifact = loader(settings.artifacts_dir)
+        print(f"{name} mapped: {len(artifact)} entries")
+        return artifact
+    except FileNotFoundError:
+        print(f"No {name} in {os.path.abspath(settings.artifacts_dir)}")
+        return None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each phase is timed and exported on /metrics
+    phase = app.state.metrics.phase
+
+    # Map the cluster store snapshot, or parse clusters.json if it isn't built
+    with phase("cluster_store"):
+        app.state.cluster_store = load_artifact(ClusterStore.load, "cluster store")
+        if app.state.cluster_store is None:
+            print("Parsing clusters...")
+            app.state.cluster_store = ClusterStore.from_json(settings.clusters_path)
+    print(f"Clusters loaded: {app.state.cluster_store.memory_report()}")
 
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     # Load the dataset and create the filepath to index mapping
-#     print("Loading dataset...")
-#     dataset = load_dataset("biglam/newspaper-navigator", "photos", split="train")
-#     app.state.dataset = dataset
-#     app.state.filepath_to_index = {item["filepath"]: i for i, item in enumerate(dataset)}
-#     print("Dataset loaded.")
-#     yield
-#     # Clean up (optional)
-#     print("Shutting down...")
+    # Memory-map the prebuilt indexes
+    with phase("filepath_index"):
+        app.state.filepath_index = load_artifact(FilepathIndex.load, "filepath index")
+    with phase("ocr_index"):
+        app.state.ocr_index = load_artifact(OCRIndex.load, "OCR index")
+    with phase("search_index"):
+        app.state.search_index = load_artifact(SearchIndex.load, "search index")
+    with phase("cluster_summaries"):
+        app.state.cluster_summaries = load_artifact(ClusterSummaries.load, "cluster summaries")
+    # Served dataset columns; without the snapshot the HF dataset is opened on first use
+    with phase("metadata"):
+        app.state.dataset = load_artifact(
+            lambda path: MetadataStore.load(path, settings.ocr_block_cache_bytes), "metadata snapshot"
+        )
+    with phase("page_dimensions"):
+        app.state.page_dimensions = PageDimensions.load(
+            settings.artifacts_dir,
+            fetch=fetch_info_json if settings.iiif_fetch_page_dimensions else None,
+            cache_size=settings.page_dimensions_cache_size,
+            requests_per_second=settings.page_dimensions_requests_per_second,
+            retry_seconds=settings.page_dimensions_retry_seconds,
+            concurrency=settings.page_dimensions_fetch_concurrency,
+        )
+    print(f"Page dimensions loaded: {len(app.state.page_dimensions)} pages")
 
+    # Embeddings for the facet learner are memory-mapped, not read
+    # Trained facets are cached per embeddings snapshot
+    app.state.facet_learner = app.state.facet_cache = None
+    if os.path.exists(settings.embeddings_path):
+        with phase("facet_learner"):
+            app.state.facet_cache = FacetCache(
+                settings.facet_cache_dir,
+                snapshot_version([settings.embeddings_path]),
+                settings.facet_cache_entries,
+            )
+            app.state.facet_learner = FacetLearner(
+                settings.embeddings_path,
+                processes=settings.facet_processes,
+                block_norms=app.state.facet_cache.block_norms(),
+            )
+        print(f"Embeddings mapped: {len(app.state.facet_learner)} rows")
+        print(f"Facet cache: {len(app.state.facet_cache)} facets")
 
-app = FastAPI()
+    # The ANN index re-ranks its candidates against the same mapped embeddings
+    embeddings = app.state.facet_learner.embeddings if app.state.facet_learner else None
+    with phase("ann_index"):
+        app.state.ann_index = load_artifact(
+            lambda path: ANNIndex.load(path, embeddings), "nearest-neighbour index"
+        )
+
+    with phase("perceptual_index"):
+        app.state.perceptual_index = load_artifact(PerceptualIndex.load, "perceptual hash index")
+
+    with phase("thumbnail_cache"):
+        app.state.thumbnail_cache = ThumbnailCache(
+            settings.thumbnail_cache_dir,
+            settings.thumbnail_cache_max_bytes,
+            concurrency=settings.thumbnail_upstream_concurrency,
+        )
+    print(f"Thumbnail cache: {len(app.state.thumbnail_cache)} files")
+
+    # Cached responses and ETags are tied to this exact set of artifacts
+    with phase("response_cache"):
+        app.state.response_cache = ResponseCache(
+            snapshot_version([settings.clusters_path, settings.artifacts_dir]),
+            settings.cache_max_bytes,
+            make_backend(settings.cache_backend_url),
+            ttl=settings.cache_ttl_seconds,
+        )
+    print(f"Response cache ready: snapshot {app.state.response_cache.version}")
+    startup = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in app.state.metrics.startup.items())
+    print(f"Startup phases: {startup}")
+    yield
+    # Clean up (optional)
+    print("Shutting down...")
+    if app.state.facet_learner is not None:
+        app.state.facet_learner.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.title = settings.api_title
 app.description = settings.api_description
 app.version = settings.api_version
+app.state.metrics = Metrics()
+app.state.metrics.startup["import"] = time.perf_counter() - IMPORT_START
+
+app.add_middleware(CacheMiddleware, prefixes=("/cluster/", "/image/", "/stats/"))
+# Added last so it is outermost and also times cached responses
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(dataset.router)
 app.include_router(clusters.router)
 app.include_router(images.router)
 app.include_router(search.router)
-
-# @app.get("/filepath_to_index")
-# async def get_filepath_to_index():
-#     return app.state.filepath_to_index
+app.include_router(stats.router)
+app.include_router(facets.router)
+app.include_router(cache.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
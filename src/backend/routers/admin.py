@@ -0,0 +1,31 @@
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from core.config import settings
+from core.profiler import collapsed, sample_stacks
+from dependencies import require_admin
+
+router = APIRouter(tags=["admin"], dependencies=[Depends(require_admin)])
+
+_profile_lock = threading.Lock()
+
+
+@router.get("/admin/profile", response_class=PlainTextResponse)
+def get_profile(
+    seconds: float = Query(10, gt=0, le=settings.profile_max_seconds),
+    interval_ms: float = Query(10, ge=1, le=1000),
+):
+    """
+    Samples every thread of this worker for ``seconds`` and returns the
+    stacks in collapsed format, e.g. ``flamegraph.pl profile.txt > out.svg``
+    or drop the file into speedscope.
+    """
+    # one profile at a time; the sampler holds a threadpool thread
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        stacks, n_samples = sample_stacks(seconds, interval_ms / 1000)
+    finally:
+        _profile_lock.release()
+    return PlainTextResponse(collapsed(stacks), headers={"X-Profile-Samples": str(n_samples)})
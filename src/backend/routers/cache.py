@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+
+router = APIRouter(tags=["cache"])
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(request: Request):
+    facet_cache = request.app.state.facet_cache
+    # only the metadata snapshot has one; the datasets fallback doesn't
+    ocr_store = getattr(request.app.state.dataset, "ocr_store", None)
+    return {
+        "responses": request.app.state.response_cache.stats(),
+        "thumbnails": request.app.state.thumbnail_cache.stats(),
+        "facets": facet_cache.stats() if facet_cache is not None else None,
+        "ocr": ocr_store.stats() if ocr_store is not None else None,
+        "page_dimensions": request.app.state.page_dimensions.stats(),
+    }
@@ -1,21 +1,191 @@
+import asyncio
 import json
-from fastapi import APIRouter, Query, HTTPException, Request
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, HTTPException, Request, Response
+
+from core.cluster_store import ClusterStore
+from core.filepath_index import FilepathIndex
+from core.filepaths import parse_filepaths
+from core.iiif import PageDimensions, build_annotation
+from core.responses import json_response, ndjson_response, wants_ndjson
+from core.schemas import BatchRequest
+from core.summaries import ClusterSummaries, format_date
+from core.thumbnails import ThumbnailCache
+from dependencies import (
+    get_cluster_store,
+    get_cluster_summaries,
+    get_dataset,
+    get_filepath_index,
+    get_page_dimensions,
+    get_thumbnail_cache,
+    thumbnail_source,
+)
 
 router = APIRouter(tags=["clusters"])
 
 
-@router.get("/cluster/{cluster_id}")
-async def get_cluster_metadata(cluster_id: str):
+def cluster_metadata(cluster_id, store, summaries=None):
+    filepaths = store.filepaths(cluster_id)
+    summary = summaries.get(cluster_id) if summaries is not None else None
 
-    metadata = {
+    if summary is not None:
+        dates = {
+            "first_year": int(summary["first_date"][:4]),
+            "last_year": int(summary["last_date"][:4]),
+            "first_date": summary["first_date"],
+            "last_date": summary["last_date"],
+        }
+        newspapers = [newspaper["title"] for newspaper in summary["newspapers"]]
+        # empty clusters have no representative (-1)
+        representative = store.paths[summary["representative"]] if summary["representative"] >= 0 else None
+    else:
+        # no summaries built: derive what we can from the filepaths
+        table = parse_filepaths(filepaths)
+        years = table.year[table.valid]
+        dates = {
+            "first_year": int(years.min()) if len(years) else None,
+            "last_year": int(years.max()) if len(years) else None,
+        }
+        newspapers = table.lccns.take(np.unique(table.lccn[table.valid]))
+        representative = filepaths[0] if filepaths else None
+
+    return {
         "id": f"{cluster_id}",
-        "dates": {"first_year": 1900, "last_year": 2020},
-        "newspapers": ["Newspaper A", "Newspaper B"],
+        "size": len(filepaths),
+        "dates": dates,
+        "newspapers": newspapers,
+        "representative": {"id": representative, "url": f"/image/{representative}"},
         "images": [
-            {"id": "path_to_image1", "url": "path/to/image1.jpg"},
-            {"id": "path_to_image2", "url": "path/to/image2.jpg"},
-            {"id": "path_to_image3", "url": "path/to/image3.jpg"},
+            {"id": filepath, "url": f"/image/{filepath}"} for filepath in filepaths
         ],
     }
 
-    return metadata
+
+@router.post("/clusters:batch")
+def get_clusters_batch(
+    batch: BatchRequest,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    store: ClusterStore = Depends(get_cluster_store),
+    summaries: Optional[ClusterSummaries] = Depends(get_cluster_summaries),
+):
+    found = [cluster_id for cluster_id in batch.ids if cluster_id in store]
+    clusters = (cluster_metadata(cluster_id, store, summaries) for cluster_id in found)
+
+    if wants_ndjson(request, format):
+        return ndjson_response(clusters)
+    missing = [cluster_id for cluster_id in batch.ids if cluster_id not in store]
+    return json_response(request, {"clusters": list(clusters), "missing": missing})
+
+
+@router.get("/cluster/{cluster_id}")
+async def get_cluster_metadata(
+    cluster_id: str,
+    store: ClusterStore = Depends(get_cluster_store),
+    summaries: Optional[ClusterSummaries] = Depends(get_cluster_summaries),
+):
+    if cluster_id not in store:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+
+    return cluster_metadata(cluster_id, store, summaries)
+
+
+@router.get("/cluster/{cluster_id}/annotations")
+def get_cluster_annotations(
+    cluster_id: str,
+    request: Request,
+    response: Response,
+    store: ClusterStore = Depends(get_cluster_store),
+    index: FilepathIndex = Depends(get_filepath_index),
+    dimensions: PageDimensions = Depends(get_page_dimensions),
+):
+    if cluster_id not in store:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+
+    filepaths = store.filepaths(cluster_id)
+    rows = index.lookup_many(filepaths)
+    found = [(fp, row) for fp, row in zip(filepaths, rows.tolist()) if row >= 0]
+
+    # one columnar read for the whole cluster instead of a row at a time
+    columns = get_dataset(request)[[row for _, row in found]] if found else {}
+    items = [
+        {name: columns[name][i] for name in ("box", "name", "pub_date")}
+        for i in range(len(found))
+    ]
+
+    sizes = dimensions.get_many([fp for fp, _ in found])
+    if None in sizes:
+        # pages may be fetched successfully later, so don't cache this
+        response.headers["Cache-Control"] = "no-store"
+
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": f"{request.base_url}cluster/{cluster_id}/annotations",
+        "type": "AnnotationPage",
+        "items": [
+            build_annotation(fp, item, size, request.base_url)
+            for (fp, _), item, size in zip(found, items, sizes)
+        ],
+    }
+
+
+@router.get("/cluster/{cluster_id}/timeline")
+def get_cluster_timeline(
+    cluster_id: str,
+    request: Request,
+    store: ClusterStore = Depends(get_cluster_store),
+    summaries: Optional[ClusterSummaries] = Depends(get_cluster_summaries),
+):
+    if cluster_id not in store:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    if summaries is None:
+        raise HTTPException(status_code=503, detail="Cluster summaries not built")
+    timeline = summaries.timeline(cluster_id)
+    if timeline is None:
+        raise HTTPException(status_code=503, detail=f"Cluster {cluster_id} not summarised")
+    path_ids, dates, newspaper_ids = timeline
+
+    # precomputed in publication order, so this is a slice and a decode
+    newspapers = {
+        n: {"lccn": summaries.lccns[n], "title": summaries.titles[n], "place": summaries.places[n]}
+        for n in set(newspaper_ids.tolist())
+    }
+    reprints = [
+        {"date": format_date(date), "newspaper": newspapers[n], "id": filepath, "url": f"/image/{filepath}"}
+        for filepath, date, n in zip(store.paths.take(path_ids), dates.tolist(), newspaper_ids.tolist())
+    ]
+    return json_response(
+        request,
+        {
+            "id": cluster_id,
+            "size": len(reprints),
+            "newspapers": len(newspapers),
+            "first_date": reprints[0]["date"] if reprints else None,
+            "last_date": reprints[-1]["date"] if reprints else None,
+            "timeline": reprints,
+        },
+    )
+
+
+@router.post("/cluster/{cluster_id}/thumbnails:prewarm", status_code=202)
+async def prewarm_cluster_thumbnails(
+    cluster_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    store: ClusterStore = Depends(get_cluster_store),
+    thumbnails: ThumbnailCache = Depends(get_thumbnail_cache),
+):
+    if cluster_id not in store:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+    filepaths = store.filepaths(cluster_id)
+
+    async def prewarm():
+        # the cache caps upstream concurrency; errors only skip that image
+        await asyncio.gather(
+            *(thumbnails.get(fp, thumbnail_source(request, fp)) for fp in filepaths),
+            return_exceptions=True,
+        )
+
+    background_tasks.add_task(prewarm)
+    return {"id": cluster_id, "images": len(filepaths)}
@@ -1,11 +1,25 @@
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Depends
+from core.cluster_store import ClusterStore
 from core.config import settings
+from core.summaries import ClusterSummaries
+from dependencies import get_cluster_store, get_cluster_summaries
 
 router = APIRouter()
 
 
 @router.get("/")
-async def get_dataset_metedata():
+async def get_dataset_metedata(
+    store: ClusterStore = Depends(get_cluster_store),
+    summaries: Optional[ClusterSummaries] = Depends(get_cluster_summaries),
+):
+    # statistics are precomputed by scripts/build_artifacts.py summaries
+    stats = summaries.stats if summaries is not None else {
+        "dates": {"first_year": None, "last_year": None},
+        "clusters": len(store),
+        "images": store.n_images,
+        "newspapers": None,
+    }
 
     metadata = {
         "id": "viral_images_api",
@@ -14,10 +28,7 @@ async def get_dataset_metedata():
             "description": settings.api_description,
             "version": settings.api_version,
         },
-        "dates": {"first_year": 1900, "last_year": 2020},
-        "clusters": 2000,
-        "images": 1500000,
-        "newspapers": 200,
+        **stats,
     }
 
     return metadata
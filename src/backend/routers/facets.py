@@ -0,0 +1,112 @@
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from core.facet_cache import FacetCache
+from core.facet_learner import FacetLearner, N_PREDICTIONS, facet_key, merge_labels
+from core.filepath_index import FilepathIndex
+from core.schemas import FacetLabels
+from dependencies import get_facet_cache, get_facet_learner, get_filepath_index
+
+router = APIRouter(tags=["facets"])
+
+
+def facet_response(request, facet, k, cached, timings):
+    timings["total"] = sum(timings.values())
+    indices, scores = facet.top(k)
+    filepath_index = request.app.state.filepath_index
+    ids = filepath_index.filepaths(indices) if filepath_index else [None] * len(indices)
+    return {
+        "query": facet.query,
+        "facet": facet.key,
+        "parent": facet.parent,
+        "cache": "hit" if cached else "miss",
+        "positives": len(facet.positives),
+        "negatives": len(facet.negatives),
+        "results": [
+            {"row": row, "id": image_id, "score": round(score, 6)}
+            for row, image_id, score in zip(indices.tolist(), ids, scores.tolist())
+        ],
+        "rows_rescored": facet.rescored,
+        "timings_ms": {stage: round(s * 1000, 3) for stage, s in timings.items()},
+    }
+
+
+@router.get("/facets/{query}")
+def get_facet(
+    query: str,
+    request: Request,
+    k: int = Query(100, ge=1, le=N_PREDICTIONS),
+    learner: FacetLearner = Depends(get_facet_learner),
+    cache: FacetCache = Depends(get_facet_cache),
+):
+    ocr_index = request.app.state.ocr_index
+    if ocr_index is None:
+        raise HTTPException(status_code=503, detail="OCR index not built")
+
+    # positive examples are the rows whose OCR matches the query
+    start = time.perf_counter()
+    try:
+        positive_indices = ocr_index.search(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    positive_indices = positive_indices[positive_indices < len(learner)]
+    if not len(positive_indices):
+        raise HTTPException(status_code=404, detail=f"No OCR matches for {query}")
+    # the negatives are seeded, so the facet key is known before training
+    negative_indices = learner.sample_negatives(positive_indices)
+    facet = cache.get(facet_key(query, positive_indices, negative_indices))
+    timings = {"search": time.perf_counter() - start}
+
+    if facet is not None:
+        cache.record("hit", timings["search"])
+        return facet_response(request, facet, k, True, timings)
+    facet, learn_timings = learner.learn_facet(query, positive_indices, negative_indices)
+    timings.update(learn_timings)
+    cache.put(facet)
+    cache.save_block_norms(learner.block_norms)
+    cache.record("learn", sum(timings.values()))
+    return facet_response(request, facet, k, False, timings)
+
+
+@router.post("/facets/{facet_id}/labels")
+def label_facet(
+    facet_id: str,
+    labels: FacetLabels,
+    request: Request,
+    k: int = Query(100, ge=1, le=N_PREDICTIONS),
+    learner: FacetLearner = Depends(get_facet_learner),
+    cache: FacetCache = Depends(get_facet_cache),
+    index: FilepathIndex = Depends(get_filepath_index),
+):
+    """
+    Adds positive and negative image ids to a facet and returns the refined
+    facet, which gets its own id. Replaying the same labels is a cache hit.
+    """
+    start = time.perf_counter()
+    facet = cache.get(facet_id)
+    if facet is None:
+        raise HTTPException(status_code=404, detail=f"Facet {facet_id} not found")
+    rows = {}
+    for name, image_ids in (("positive", labels.positive), ("negative", labels.negative)):
+        rows[name] = index.lookup_many(image_ids)
+        unknown = [i for i, row in zip(image_ids, rows[name].tolist()) if not 0 <= row < len(learner)]
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Images not found: {unknown[:10]}")
+    try:
+        positives, negatives = merge_labels(
+            facet.positives, facet.negatives, rows["positive"], rows["negative"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    refined = cache.get(facet_key(facet.query, positives, negatives))
+    timings = {"lookup": time.perf_counter() - start}
+    if refined is not None:
+        cache.record("hit", timings["lookup"])
+        return facet_response(request, refined, k, True, timings)
+    refined, refine_timings = learner.refine(facet, rows["positive"], rows["negative"])
+    timings.update(refine_timings)
+    cache.put(refined)
+    cache.save_block_norms(learner.block_norms)
+    cache.record("refine", sum(timings.values()))
+    return facet_response(request, refined, k, False, timings)
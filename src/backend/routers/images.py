@@ -1,60 +1,217 @@
-from fastapi import APIRouter
+import io
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from core.ann_index import ANNIndex
+from core.cluster_store import ClusterStore
+from core.config import settings
+from core.filepath_index import FilepathIndex
+from core.iiif import PageDimensions, build_annotation
+from core.phash import PerceptualIndex, hamming, hash_image
+from core.responses import json_response, ndjson_response, wants_ndjson
+from core.schemas import BatchRequest
+from core.thumbnails import ThumbnailCache
+from dependencies import (
+    get_ann_index,
+    get_cluster_store,
+    get_dataset,
+    get_filepath_index,
+    get_page_dimensions,
+    get_perceptual_index,
+    get_thumbnail_cache,
+    thumbnail_source,
+)
 
 router = APIRouter(tags=["images"])
 
+BATCH_READ_ROWS = 256
 
-@router.get("/image/{image_id}")
-async def get_image_metadata(image_id: str):
 
-    metadata = {
-        "id": f"{image_id}",
-        "date": "1850-03-25",
-        "newspaper": "Newspaper A",
-        "publisher": "Publisher Name",
-        "place": "City, Country",
-        "url": "http://example.com/image1.jpg",
-        "iiif": f"http://example.com/image/{image_id}/annotation.json",
-        "cluster": "cluster_id",
-        "ocr": ["Optical", "Character", "Recognition", "text", "here"],
+# Image ids are dataset filepaths, so they contain slashes. The suffixed
+# routes have to be registered before the catch-all metadata route.
+@router.get("/image/{image_id:path}/annotation.json")
+def get_iiif_annotation(
+    image_id: str,
+    request: Request,
+    response: Response,
+    index: FilepathIndex = Depends(get_filepath_index),
+    dimensions: PageDimensions = Depends(get_page_dimensions),
+):
+    row = index.lookup(image_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+    item = get_dataset(request)[row]
+    size = dimensions.get(image_id)
+    if size is None:
+        # the page may be fetched successfully later, so don't cache this
+        response.headers["Cache-Control"] = "no-store"
+
+    return build_annotation(image_id, item, size, request.base_url)
+
+
+@router.get("/image/{image_id:path}/thumbnail")
+async def get_thumbnail(
+    image_id: str,
+    request: Request,
+    thumbnails: ThumbnailCache = Depends(get_thumbnail_cache),
+):
+    try:
+        path = await thumbnails.get(image_id, thumbnail_source(request, image_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Upstream fetch failed: {e}")
+
+    return FileResponse(
+        path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+
+@router.get("/image/{image_id:path}/similar")
+def get_similar_images(
+    image_id: str,
+    k: int = Query(10, ge=1, le=100),
+    nprobe: int = Query(settings.ann_nprobe, ge=1, le=1024),
+    index: FilepathIndex = Depends(get_filepath_index),
+    ann_index: ANNIndex = Depends(get_ann_index),
+    store: ClusterStore = Depends(get_cluster_store),
+):
+    # queries are the image's own embedding, so the index is useless without them
+    if ann_index.embeddings is None:
+        raise HTTPException(status_code=503, detail="Embeddings not available")
+    row = index.lookup(image_id)
+    if row is None or row >= len(ann_index.embeddings):
+        raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+
+    query = np.asarray(ann_index.embeddings[row], dtype=np.float32)
+    # ask for one extra neighbour: the image itself is its own best match
+    rows, scores = ann_index.search(query, k=k + 1, nprobe=nprobe)
+    keep = rows != row
+    rows, scores = rows[keep][:k], scores[keep][:k]
+
+    return {
+        "id": image_id,
+        "similar": [
+            {
+                "id": filepath,
+                "score": round(score, 6),
+                "cluster": store.cluster_of(filepath),
+            }
+            for filepath, score in zip(index.filepaths(rows), scores.tolist())
+        ],
     }
 
-    return metadata
-
-
-@router.get("/image/{image_id}/annotation.json")
-async def get_iiif_annotation(image_id: str):
-
-    # turn pct into xywz
-    # contruct iiif manifest (loc-specific)
-
-    metadata = {
-        "@context": "http://iiif.io/api/presentation/3/context.json",
-        "id": f"https://PROJECT_URL/image/{image_id}/annotation.json",
-        "type": "Annotation",
-        "motivation": ["contentState", "tagging"],
-        "target": {
-            "type": "SpecificResource",
-            "source": {
-                "id": "IIIF_IMAGE_MANIFEST_https://tile.loc.gov/image-services/iiif/service:ndnp:kyu:batch_kyu_bunting_ver01:data:sn86069123:00202195209:1862111301:0085",
-                "type": "Canvas",
-                "partOf": [
-                    {
-                        "id": "IIIF_PRESENTATION_MANIFEST_https://www.loc.gov/item/sn86069123/1862-11-13/ed-1/manifest.json",
-                        "type": "Manifest",
-                    }
-                ],
-            },
-            "selector": {
-                "type": "FragmentSelector",
-                "value": "PCT_TRANSFORM_INTO_xywh=1326,508,1702,1841",
-            },
-        },
-        "body": {
-            "type": "TextualBody",
-            "value": "Published by NEWSPAPER_NAME on PUBLICATION_DATE",
-            "format": "text/plain",
-            "language": ["en"],
-        },
+
+# Candidates grow combinatorially with the radius (each of the four 16-bit
+# chunks is probed with every pattern of radius // 4 flipped bits), so it is
+# capped where the probe count is still in the hundreds
+MAX_MATCH_RADIUS = 12
+
+
+@router.post("/images:match")
+async def match_uploaded_image(
+    request: Request,
+    radius: int = Query(settings.match_radius, ge=0, le=MAX_MATCH_RADIUS),
+    k: int = Query(20, ge=1, le=100),
+    index: PerceptualIndex = Depends(get_perceptual_index),
+    store: ClusterStore = Depends(get_cluster_store),
+):
+    """
+    Which clusters an uploaded image (the raw request body) belongs to:
+    hashed images within ``radius`` bits of its pHash, and their clusters
+    ranked by closest match, then by number of matches.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > settings.match_max_bytes:
+            raise HTTPException(status_code=413, detail="Image too large")
+    try:
+        code_d, code = await run_in_threadpool(hash_image, io.BytesIO(bytes(body)))
+    except (OSError, ValueError):
+        raise HTTPException(status_code=400, detail="Request body is not a readable image")
+
+    # probing the index is CPU-bound, so keep it off the event loop
+    ids, distances = await run_in_threadpool(index.search, code, radius, k)
+    filepaths = index.filepaths(ids)
+    dhash_distances = hamming(index.dhash[ids], code_d).tolist()
+    matches = [
+        {"id": filepath, "distance": distance, "dhash_distance": d, "cluster": store.cluster_of(filepath)}
+        for filepath, distance, d in zip(filepaths, distances.tolist(), dhash_distances)
+    ]
+
+    clusters = {}
+    for match in matches:
+        if match["cluster"] is None:
+            continue
+        entry = clusters.setdefault(
+            match["cluster"],
+            {"id": match["cluster"], "matches": 0, "distance": match["distance"], "url": f"/cluster/{match['cluster']}"},
+        )
+        entry["matches"] += 1
+    return {
+        "phash": f"{int(code):016x}",
+        "dhash": f"{int(code_d):016x}",
+        "radius": radius,
+        "clusters": sorted(clusters.values(), key=lambda c: (c["distance"], -c["matches"])),
+        "matches": matches,
+    }
+
+
+def image_metadata(image_id, item, store, base_url):
+    return {
+        "id": f"{image_id}",
+        "date": item["pub_date"],
+        "newspaper": item["name"],
+        "publisher": item["publisher"],
+        "place": item["place_of_publication"],
+        "url": item["prediction_section_iiif_url"],
+        "iiif": f"{base_url}image/{image_id}/annotation.json",
+        "cluster": store.cluster_of(image_id),
+        "ocr": item["ocr"].split(),
     }
 
-    return metadata
+
+@router.post("/images:batch")
+def get_images_batch(
+    batch: BatchRequest,
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    index: FilepathIndex = Depends(get_filepath_index),
+    store: ClusterStore = Depends(get_cluster_store),
+):
+    rows = index.lookup_many(batch.ids).tolist()
+    dataset = get_dataset(request)
+
+    def resolve():
+        # read the dataset a block of rows at a time, in columnar form
+        found = [(image_id, row) for image_id, row in zip(batch.ids, rows) if row >= 0]
+        for start in range(0, len(found), BATCH_READ_ROWS):
+            block = found[start : start + BATCH_READ_ROWS]
+            columns = dataset[[row for _, row in block]]
+            for i, (image_id, _) in enumerate(block):
+                item = {name: values[i] for name, values in columns.items()}
+                yield image_metadata(image_id, item, store, request.base_url)
+
+    if wants_ndjson(request, format):
+        return ndjson_response(resolve())
+    missing = [image_id for image_id, row in zip(batch.ids, rows) if row < 0]
+    return json_response(request, {"images": list(resolve()), "missing": missing})
+
+
+@router.get("/image/{image_id:path}")
+def get_image_metadata(
+    image_id: str,
+    request: Request,
+    index: FilepathIndex = Depends(get_filepath_index),
+    store: ClusterStore = Depends(get_cluster_store),
+):
+    row = index.lookup(image_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+    item = get_dataset(request)[row]
+
+    return image_metadata(image_id, item, store, request.base_url)
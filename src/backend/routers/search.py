@@ -1,12 +1,92 @@
-from fastapi import APIRouter
+import base64
+import numpy as np
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from core.cluster_store import ClusterStore
+from core.search_index import SearchIndex, parse_date_bound
+from dependencies import get_cluster_store, get_search_index
 
 router = APIRouter(tags=["search"])
 
+MATCH_ALL = "*"
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(int(key).to_bytes(8, "big")).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        key = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True)
+    except ValueError:
+        key = None
+    if not key or len(key) > 8:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int.from_bytes(key, "big")
+
+
 @router.get("/search/{query}")
-async def get_search_results(query: str):
-    # filter by newspaper title
+def get_search_results(
+    query: str,
+    request: Request,
+    newspaper: Optional[List[str]] = Query(None, description="LCCN or title"),
+    start_date: Optional[str] = Query(None, description="YYYY[-MM[-DD]]"),
+    end_date: Optional[str] = Query(None, description="YYYY[-MM[-DD]]"),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    index: SearchIndex = Depends(get_search_index),
+    store: ClusterStore = Depends(get_cluster_store),
+):
+    # filter by newspaper title (or LCCN)
+    newspaper_ids = []
+    for name in newspaper or []:
+        newspaper_id = index.newspaper_id(name)
+        if newspaper_id is None:
+            raise HTTPException(status_code=404, detail=f"Newspaper {name} not found")
+        newspaper_ids.append(newspaper_id)
+
     # filter by date range
-    # return list of clusters
-    # paginate results larger than 50
+    try:
+        start = parse_date_bound(start_date) if start_date else None
+        end = parse_date_bound(end_date, end=True) if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows = None
+    if query.strip() != MATCH_ALL:
+        ocr_index = request.app.state.ocr_index
+        if ocr_index is None:
+            raise HTTPException(status_code=503, detail="OCR index not built")
+        try:
+            rows = ocr_index.search(query)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # return list of clusters, best matches first
+    keys, clusters, hits, n_images = index.search_clusters(rows, newspaper_ids, start, end)
+
+    # paginate with a cursor on the sort key, so deep pages cost the same
+    first = int(np.searchsorted(keys, decode_cursor(cursor), "right")) if cursor else 0
+    page = slice(first, first + limit)
+    next_cursor = encode_cursor(keys[page.stop - 1]) if page.stop < len(keys) else None
+
     # return metadata for each cluster
-    return {"message": f"Return search results (list of clusters) for query: {query}"}
+    results = []
+    for cluster, n_hits in zip(clusters[page].tolist(), hits[page].tolist()):
+        cluster_id = index.cluster_ids[cluster]
+        results.append(
+            {
+                "id": cluster_id,
+                "matches": n_hits,
+                "size": len(store.member_ids(cluster_id)) if cluster_id in store else None,
+                "url": f"/cluster/{cluster_id}",
+            }
+        )
+
+    return {
+        "query": query,
+        "total_clusters": len(keys),
+        "total_images": n_images,
+        "clusters": results,
+        "next_cursor": next_cursor,
+    }
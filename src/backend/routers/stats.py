@@ -0,0 +1,44 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from core.search_index import SearchIndex, parse_date_bound
+from dependencies import get_search_index
+
+router = APIRouter(tags=["stats"])
+
+
+@router.get("/stats/histogram")
+def get_histogram(
+    count: str = Query("images", pattern="^(images|reprints|clusters)$"),
+    by: str = Query("year", pattern="^(year|month)$"),
+    newspaper: Optional[List[str]] = Query(None, description="LCCN or title"),
+    start_date: Optional[str] = Query(None, description="YYYY[-MM[-DD]]"),
+    end_date: Optional[str] = Query(None, description="YYYY[-MM[-DD]]"),
+    index: SearchIndex = Depends(get_search_index),
+):
+    """
+    Image, reprint (clustered image) or cluster counts per year or month.
+    Clusters are counted once, in the month and newspaper where they first
+    appeared. Date bounds apply at month granularity.
+    """
+    newspaper_ids = []
+    for name in newspaper or []:
+        newspaper_id = index.newspaper_id(name)
+        if newspaper_id is None:
+            raise HTTPException(status_code=404, detail=f"Newspaper {name} not found")
+        newspaper_ids.append(newspaper_id)
+
+    try:
+        start = parse_date_bound(start_date) if start_date else None
+        end = parse_date_bound(end_date, end=True) if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    labels, counts = index.histogram(count, by, newspaper_ids, start, end)
+    return {
+        "count": count,
+        "by": by,
+        "newspapers": [{"lccn": index.lccns[n], "title": index.titles[n]} for n in newspaper_ids],
+        "total": int(counts.sum()),
+        "bins": [{"period": label, "count": n} for label, n in zip(labels, counts.tolist())],
+    }
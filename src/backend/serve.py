@@ -0,0 +1,68 @@
+"""
+Launches the API, optionally as several worker processes:
+
+    python serve.py --workers 4
+
+Every served artifact (cluster store, metadata, filepath/OCR/search
+indexes, summaries, embeddings, ANN index) is a read-only memory-mapped
+.npy file, so workers share those pages through the OS page cache. An extra
+worker costs its interpreter and its caches, not another copy of the data.
+Build the snapshots first (scripts/build_artifacts.py cluster-store,
+metadata, ...); without them each worker parses clusters.json into its own
+memory and opens the HF dataset itself.
+
+State that stays per worker: the response-cache LRU (set CACHE_BACKEND_URL
+to share responses through Redis, and lower CACHE_MAX_BYTES), the thumbnail
+cache's in-memory index (the files themselves are shared), the facet
+learner's process pool and /metrics, which describe the worker that served
+the scrape.
+
+``python benchmarks/run.py --suite workers`` measures how proportional
+memory (PSS) grows with the worker count.
+"""
+import argparse
+import os
+
+from core.config import settings
+
+# One file per snapshot that would otherwise be rebuilt in every worker
+SHARED_ARTIFACTS = {
+    "cluster-store": "cluster_store.members.npy",
+    "metadata": "metadata.box.npy",
+    "filepath-index": "filepath_index.hashes.npy",
+    "search-index": "search_index.row_dates.npy",
+    "summaries": "summaries.size.npy",
+}
+
+
+def missing_artifacts(artifacts_dir):
+    return [
+        name
+        for name, filename in SHARED_ARTIFACTS.items()
+        if not os.path.exists(os.path.join(artifacts_dir, filename))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Viral Images API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1))
+    )
+    args = parser.parse_args()
+
+    missing = missing_artifacts(settings.artifacts_dir)
+    if missing and args.workers > 1:
+        print(
+            f"Warning: {', '.join(missing)} not built in {os.path.abspath(settings.artifacts_dir)}; "
+            f"each of the {args.workers} workers will hold its own copy of that data"
+        )
+
+    import uvicorn
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()